@@ -11,6 +11,7 @@ function setupBuild() {
         'src/renderer/styles.css',
         'src/renderer/renderer.js',
         'python-backend/pdf_bookmark_tool.py',
+        'python-backend/marked_content.py',
         'python-backend/requirements.txt'
     ];
     
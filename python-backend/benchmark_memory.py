@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+有界内存模式检查 - 以 max_memory_mb 运行自动书签流程（只写出预览，不保存PDF），
+检查峰值常驻内存不超过上限。每个文件在独立的子进程中运行，峰值内存互不影响
+没有给出PDF文件时先生成一个合成的长文档
+
+用法: python benchmark_memory.py [a.pdf b.pdf ...] [--max-memory 200] [--generate-pages 10000]
+任一文件的峰值超过上限或处理失败时，以退出码1结束
+"""
+
+import sys
+import os
+import json
+import time
+import argparse
+import subprocess
+import tempfile
+from pdf_bookmark_tool import PDFBookmarkTool, fitz, get_peak_memory_mb
+
+
+def generate_document(path, page_count):
+    """
+    生成合成的长文档：每页若干段正文，每10页一个编号的章标题（位置各不相同，不会被当作页眉）
+    正文版式只排版一次（模板页），其余页面复制模板页后再写入章标题
+    
+    Args:
+        path: 输出路径
+        page_count: 页数
+    """
+    doc = fitz.open()
+    paragraph = "Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor. " * 4
+    # 模板页: 0为没有章标题的页面，1..4为章标题位于不同高度的页面
+    tops = [110, 140, 240, 340, 440]
+    for top in tops:
+        page = doc.new_page()
+        for k in range(6):
+            if top + k * 100 + 90 > page.rect.height - 40:
+                break
+            page.insert_textbox(fitz.Rect(72, top + k * 100, 520, top + k * 100 + 90), paragraph, fontsize=10)
+    
+    for page_num in range(page_count):
+        if page_num % 10 == 0:
+            chapter = page_num // 10 + 1
+            variant = chapter % 4 + 1
+            doc.fullcopy_page(variant)
+            doc[-1].insert_text((72, tops[variant] - 20), f"{chapter} Chapter {chapter}", fontsize=16)
+        else:
+            doc.fullcopy_page(0)
+    doc.delete_pages(0, len(tops) - 1)
+    doc.save(path, garbage=1)
+    doc.close()
+
+
+def run_one(pdf_path, max_memory, preview_path):
+    """
+    子进程：以有界内存模式运行自动书签流程，输出一行JSON结果
+    
+    Args:
+        pdf_path: 输入PDF路径
+        max_memory: 常驻内存上限（MB）
+        preview_path: 书签预览输出路径
+    """
+    tool = PDFBookmarkTool(pdf_path)
+    tool.max_memory_mb = max_memory
+    tool.preview_output = preview_path
+    
+    start = time.perf_counter()
+    try:
+        success = tool.new_auto_bookmark_process()
+    except MemoryError as e:
+        print(f"内存超过上限: {e}")
+        success = False
+    elapsed = time.perf_counter() - start
+    
+    print(json.dumps({
+        "success": success,
+        "time": elapsed,
+        "peak_mb": get_peak_memory_mb(),
+        "windows": tool.memory_stats["windows"],
+        "store_shrinks": tool.memory_stats["store_shrinks"],
+    }))
+
+
+def run_check(pdf_paths, max_memory):
+    """
+    对每个文件运行有界内存模式并输出结果表
+    
+    Args:
+        pdf_paths: PDF文件列表
+        max_memory: 常驻内存上限（MB）
+    
+    Returns:
+        bool: 所有文件都处理成功且峰值不超过上限
+    """
+    all_passed = True
+    print(f"{'文件':<24}{'页数':>8}{'耗时(s)':>10}{'峰值内存(MB)':>14}{'上限(MB)':>10}{'窗口数':>8}  结果")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for pdf_path in pdf_paths:
+            with fitz.open(pdf_path) as doc:
+                page_count = len(doc)
+            preview_path = os.path.join(temp_dir, "preview.json")
+            process = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--run-one", pdf_path, preview_path,
+                 "--max-memory", str(max_memory)],
+                capture_output=True, text=True, encoding="utf-8")
+            result_lines = [line for line in process.stdout.splitlines() if line.startswith("{")]
+            if process.returncode != 0 or not result_lines:
+                print(f"{os.path.basename(pdf_path)[:22]:<24}失败: {process.stderr.strip()[-200:]}")
+                all_passed = False
+                continue
+            result = json.loads(result_lines[-1])
+            peak = result["peak_mb"]
+            passed = result["success"] and (peak is None or peak <= max_memory)
+            all_passed = all_passed and passed
+            peak_text = f"{peak:.0f}" if peak is not None else "-"
+            print(f"{os.path.basename(pdf_path)[:22]:<24}{page_count:>8}{result['time']:>10.2f}{peak_text:>14}"
+                  f"{max_memory:>10}{result['windows']:>8}  {'通过' if passed else '超出上限'}")
+    return all_passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="有界内存模式峰值内存检查")
+    parser.add_argument("pdf_files", nargs="*", help="参与检查的PDF文件（不指定时生成合成文档）")
+    parser.add_argument("--max-memory", type=int, default=200, help="常驻内存上限(MB)（默认: 200）")
+    parser.add_argument("--generate-pages", type=int, default=10000, help="合成文档的页数（默认: 10000）")
+    parser.add_argument("--run-one", nargs=2, metavar=("PDF", "PREVIEW"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.run_one:
+        run_one(args.run_one[0], args.max_memory, args.run_one[1])
+        return
+    
+    if args.pdf_files:
+        sys.exit(0 if run_check(args.pdf_files, args.max_memory) else 1)
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        pdf_path = os.path.join(temp_dir, f"synthetic_{args.generate_pages}.pdf")
+        print(f"生成 {args.generate_pages} 页的合成文档...")
+        generate_document(pdf_path, args.generate_pages)
+        passed = run_check([pdf_path], args.max_memory)
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+保存配置基准测试 - 比较各保存配置（及增量保存）的耗时、峰值内存和输出大小
+每个 文件×配置 在独立的子进程中运行，峰值内存互不影响
+
+用法: python benchmark_save_profiles.py a.pdf b.pdf ... [--profiles fast,compact] [--toc-every 10]
+"""
+
+import sys
+import os
+import json
+import time
+import argparse
+import subprocess
+import tempfile
+from pdf_bookmark_tool import PDFBookmarkTool, SAVE_PROFILES, get_peak_memory_mb
+
+
+def run_one(pdf_path, profile, output_path, toc_every):
+    """
+    子进程：打开文件、写入书签并按指定配置保存，输出一行JSON结果
+    
+    Args:
+        pdf_path: 输入PDF路径
+        profile: 保存配置名，"incremental"表示增量保存
+        output_path: 输出路径
+        toc_every: 每隔多少页添加一个书签
+    """
+    tool = PDFBookmarkTool(pdf_path)
+    tool.open_pdf()
+    page_count = len(tool.doc)
+    tool.doc.set_toc([[1, f"Bookmark {i + 1}", page + 1]
+                      for i, page in enumerate(range(0, page_count, toc_every))])
+    if profile == "incremental":
+        tool.incremental_save = True
+    else:
+        tool.save_profile = profile
+    
+    start = time.perf_counter()
+    success = tool.save_pdf(output_path)
+    elapsed = time.perf_counter() - start
+    tool.close_pdf()
+    
+    print(json.dumps({
+        "success": success,
+        "time": elapsed,
+        "peak_mb": get_peak_memory_mb(),
+        "size": os.path.getsize(output_path) if success else None,
+    }))
+
+
+def run_benchmark(pdf_paths, profiles, toc_every):
+    """
+    对每个文件依次运行各保存配置并输出结果表
+    
+    Args:
+        pdf_paths: PDF文件列表
+        profiles: 保存配置名列表
+        toc_every: 每隔多少页添加一个书签
+    """
+    print(f"{'文件':<24}{'配置':<13}{'耗时(s)':>10}{'峰值内存(MB)':>14}{'输出(MB)':>11}{'原文件(MB)':>12}")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for pdf_path in pdf_paths:
+            source_mb = os.path.getsize(pdf_path) / (1024 * 1024)
+            for profile in profiles:
+                output_path = os.path.join(temp_dir, f"{profile}.pdf")
+                process = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--run-one", pdf_path, profile, output_path,
+                     "--toc-every", str(toc_every)],
+                    capture_output=True, text=True, encoding="utf-8")
+                result_lines = [line for line in process.stdout.splitlines() if line.startswith("{")]
+                if process.returncode != 0 or not result_lines:
+                    print(f"{os.path.basename(pdf_path)[:22]:<24}{profile:<13}失败: {process.stderr.strip()[-200:]}")
+                    continue
+                result = json.loads(result_lines[-1])
+                peak = f"{result['peak_mb']:.0f}" if result['peak_mb'] is not None else "-"
+                size = f"{result['size'] / (1024 * 1024):.2f}" if result['size'] is not None else "-"
+                print(f"{os.path.basename(pdf_path)[:22]:<24}{profile:<13}{result['time']:>10.2f}{peak:>14}{size:>11}{source_mb:>12.2f}")
+                if os.path.exists(output_path):
+                    os.remove(output_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PDF保存配置基准测试")
+    parser.add_argument("pdf_files", nargs="*", help="参与测试的PDF文件")
+    parser.add_argument("--profiles", type=str, default=",".join(list(SAVE_PROFILES) + ["incremental"]),
+                        help="逗号分隔的保存配置（incremental表示增量保存），默认全部")
+    parser.add_argument("--toc-every", type=int, default=10, help="每隔多少页添加一个书签（默认: 10）")
+    parser.add_argument("--run-one", nargs=3, metavar=("PDF", "PROFILE", "OUTPUT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.run_one:
+        run_one(*args.run_one, toc_every=args.toc_every)
+        return
+    
+    if not args.pdf_files:
+        parser.error("需要至少一个PDF文件")
+    run_benchmark(args.pdf_files, [p.strip() for p in args.profiles.split(",") if p.strip()], args.toc_every)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+结构树书签回归检查 - 生成一个带标签的PDF，检查从结构树读取到的标题文本、层级和页码
+覆盖的情况：RoleMap自定义角色、MCR引用、ActualText、H按分节深度定层级、
+CJK字体（ToUnicode）、嵌套Form XObject中的标题文本、使用Differences编码且没有ToUnicode的简单字体
+
+用法: python check_struct_tree.py [--save tagged.pdf]
+有标题不一致时以退出码1结束
+"""
+
+import re
+import os
+import sys
+import argparse
+import tempfile
+from pdf_bookmark_tool import PDFBookmarkTool, fitz
+
+
+# (页码(0基), 结构角色, 文本, 字体)，每页的第k项对应MCID k
+PAGE_ITEMS = [
+    (0, "H1", "1 Introduction", "helv"), (0, "P", "Body text on page one.", "helv"),
+    (0, "Heading2", "1.1 Background", "tiro"), (0, "P", "More body text.", "helv"),
+    (1, "Heading2", "1.2 中文标题", "china-s"), (1, "P", "Body text on page two.", "helv"),
+    (2, "H1", "2 Methods", "tiro"), (2, "H", "Plain H heading", "helv"), (2, "P", "Body.", "helv"),
+]
+
+# 期望的书签: (标题, 层级, 页码(1基))
+EXPECTED = [
+    ("1 Introduction", 1, 1),
+    ("1.1 Background", 2, 1),
+    ("1.2 中文标题", 2, 2),
+    ("2 Methods", 1, 3),
+    ("Plain H heading", 2, 3),
+    ("3 Forms", 1, 4),
+    ("3.1 Étude", 2, 4),
+]
+
+
+def build_fixture(path):
+    """
+    生成带标签的测试PDF
+    
+    Args:
+        path: 输出路径
+    """
+    doc = fitz.open()
+    for _ in range(4):
+        doc.new_page()
+    
+    # 前3页：每个结构元素的文本用BDC/EMC包起来，MCID按页内顺序编号
+    for page_num in range(3):
+        page = doc[page_num]
+        items = [item for item in PAGE_ITEMS if item[0] == page_num]
+        y = 80
+        for _, role, text, font in items:
+            page.insert_text((72, y), text, fontname=font, fontsize=10 if role == "P" else 16)
+            y += 30
+        segments = re.findall(rb'q\nBT\n.*?ET\nQ\n', page.read_contents(), re.S)
+        assert len(segments) == len(items)
+        content = b"".join(b"/%s <</MCID %d>> BDC\n" % (item[1].encode(), k) + segment + b"EMC\n"
+                           for k, (item, segment) in enumerate(zip(items, segments)))
+        xrefs = page.get_contents()
+        doc.update_stream(xrefs[0], content)
+        for xref in xrefs[1:]:
+            doc.update_stream(xref, b"")
+    
+    # 第4页：标题文本在嵌套的Form XObject中（show_pdf_page生成外层和内层两个Form）
+    source = fitz.open()
+    source.new_page().insert_text((72, 80), "3 Forms", fontname="helv", fontsize=16)
+    page = doc[3]
+    page.show_pdf_page(page.rect, source, 0)
+    form_content = page.read_contents()
+    
+    # 第4页：使用Differences编码（65 -> Eacute）且没有ToUnicode的Type1字体，"Atude"显示为"Étude"
+    font_xref = doc.get_new_xref()
+    doc.update_object(font_xref, "<</Type/Font/Subtype/Type1/BaseFont/Helvetica"
+                                 "/Encoding <</Type/Encoding/BaseEncoding/WinAnsiEncoding/Differences [65 /Eacute]>>>>")
+    owner, keys = page.xref, ["Resources", "Font"]
+    while keys:
+        value_type, value = doc.xref_get_key(owner, keys[0])
+        if value_type != "xref":
+            break
+        owner = int(value.split()[0])
+        keys.pop(0)
+    doc.xref_set_key(owner, "/".join(keys + ["FDiff"]), f"{font_xref} 0 R")
+    content = (b"/H1 <</MCID 0>> BDC\n" + form_content + b"\nEMC\n"
+               b"/H2 <</MCID 1>> BDC\nBT /FDiff 16 Tf 72 692 Td (3.1 Atude) Tj ET\nEMC\n"
+               b"/P <</MCID 2>> BDC\nBT /FDiff 10 Tf 72 662 Td (Body text on page four.) Tj ET\nEMC\n")
+    xrefs = page.get_contents()
+    doc.update_stream(xrefs[0], content)
+    for xref in xrefs[1:]:
+        doc.update_stream(xref, b"")
+    
+    # 结构树: Document -> Sect1 [H1, P, Heading2, P, Heading2(MCR，第2页), P]
+    #                   Sect2 [H1(ActualText), Sect [H], P]
+    #                   Sect4 [H1(Form XObject), H2(Differences), P]
+    def new_object(source_text):
+        xref = doc.get_new_xref()
+        doc.update_object(xref, source_text)
+        return xref
+    
+    def element(role, page_num, mcid, parent, extra=""):
+        return new_object(f"<</Type/StructElem/S/{role}/P {parent} 0 R/Pg {doc.page_xref(page_num)} 0 R"
+                          f"/K {mcid}{extra}>>")
+    
+    root = doc.get_new_xref()
+    document, sect1, sect2, sect3, sect4 = (doc.get_new_xref() for _ in range(5))
+    sect1_kids = []
+    for index, (page_num, role, _, _) in enumerate(PAGE_ITEMS[:6]):
+        k = sum(1 for item in PAGE_ITEMS[:index] if item[0] == page_num)
+        if page_num == 1 and role == "Heading2":
+            sect1_kids.append(new_object(f"<</Type/StructElem/S/{role}/P {sect1} 0 R"
+                                         f"/K [<</Type/MCR/Pg {doc.page_xref(1)} 0 R/MCID {k}>>]>>"))
+        else:
+            sect1_kids.append(element(role, page_num, k, sect1))
+    methods = element("H1", 2, 0, sect2, "/ActualText (2 Methods)")
+    plain = element("H", 2, 1, sect3)
+    body = element("P", 2, 2, sect2)
+    sect4_kids = [element("H1", 3, 0, sect4), element("H2", 3, 1, sect4), element("P", 3, 2, sect4)]
+    
+    def kids(xrefs):
+        return " ".join(f"{xref} 0 R" for xref in xrefs)
+    
+    doc.update_object(sect1, f"<</Type/StructElem/S/Sect/P {document} 0 R/K [{kids(sect1_kids)}]>>")
+    doc.update_object(sect3, f"<</Type/StructElem/S/Sect/P {sect2} 0 R/K [{plain} 0 R]>>")
+    doc.update_object(sect2, f"<</Type/StructElem/S/Sect/P {document} 0 R/K [{kids([methods, sect3, body])}]>>")
+    doc.update_object(sect4, f"<</Type/StructElem/S/Sect/P {document} 0 R/K [{kids(sect4_kids)}]>>")
+    doc.update_object(document, f"<</Type/StructElem/S/Document/P {root} 0 R/K [{kids([sect1, sect2, sect4])}]>>")
+    doc.update_object(root, f"<</Type/StructTreeRoot/K [{document} 0 R]/RoleMap <</Heading2 /H2>>>>")
+    catalog = doc.pdf_catalog()
+    doc.xref_set_key(catalog, "StructTreeRoot", f"{root} 0 R")
+    doc.xref_set_key(catalog, "MarkInfo", "<</Marked true>>")
+    doc.save(path)
+    doc.close()
+    source.close()
+
+
+def run_check(pdf_path):
+    """
+    从结构树读取书签并与期望结果比较
+    
+    Args:
+        pdf_path: 测试PDF路径
+    
+    Returns:
+        bool: 是否与期望结果一致
+    """
+    tool = PDFBookmarkTool(pdf_path)
+    if not tool.open_pdf():
+        return False
+    try:
+        tree_list = tool.find_headings_from_struct_tree() or []
+    finally:
+        tool.close_pdf()
+    actual = [(node['title'], node['level'], node['page']) for node in tree_list]
+    
+    print(f"\n{'期望':<30}{'实际':<30}结果")
+    all_passed = len(actual) == len(EXPECTED)
+    for index in range(max(len(actual), len(EXPECTED))):
+        expected_item = EXPECTED[index] if index < len(EXPECTED) else None
+        actual_item = actual[index] if index < len(actual) else None
+        passed = expected_item == actual_item
+        all_passed = all_passed and passed
+        print(f"{str(expected_item):<30}{str(actual_item):<30}{'通过' if passed else '不一致'}")
+    return all_passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="结构树书签回归检查")
+    parser.add_argument("--save", help="保留生成的测试PDF到指定路径")
+    args = parser.parse_args()
+    
+    if args.save:
+        build_fixture(args.save)
+        passed = run_check(args.save)
+    else:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            pdf_path = os.path.join(temp_dir, "tagged.pdf")
+            build_fixture(pdf_path)
+            passed = run_check(pdf_path)
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+"""
+标记内容文本读取
+解析页面内容流，读取带标签PDF中各标记内容（BDC ... EMC，带MCID）显示的文本，
+供从结构树生成书签时取得标题文本（结构元素没有ActualText等替代文本时）
+
+PyMuPDF的文本提取不带标记内容信息，因此这里只做读取标题所需的最小解析：
+词法分析、标记内容栈、文本显示操作符、嵌套的Form XObject，以及按ToUnicode或编码解码字符串
+"""
+
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    import pymupdf as fitz  # PyMuPDF 1.24起的模块名（旧名fitz会输出弃用警告）
+except ImportError:
+    import fitz  # PyMuPDF
+
+
+# 页面内容流的词法单元
+CONTENT_TOKEN_PATTERN = re.compile(rb'''
+    (?P<space>\s+|%[^\r\n]*)
+  | (?P<hex><[0-9A-Fa-f\s]*>)
+  | (?P<dict_open><<) | (?P<dict_close>>>)
+  | (?P<array_open>\[) | (?P<array_close>\])
+  | (?P<name>/[^\s/\[\]<>(){}%]*)
+  | (?P<number>[+-]?(?:\d+\.?\d*|\.\d+))
+  | (?P<string>\()
+  | (?P<operator>[A-Za-z'"*][A-Za-z0-9'"*]*)
+  | (?P<other>.)
+''', re.VERBOSE | re.DOTALL)
+
+
+class MarkedContentReader:
+    """
+    读取页面中各标记内容的文本
+    标记内容中用Do调用的Form XObject递归读取，其中的文本计入外层的MCID
+    """
+    
+    def __init__(self, doc):
+        """
+        Args:
+            doc: fitz文档对象
+        """
+        self.doc = doc
+    
+    def read_page(self, page_num: int) -> Dict[int, str]:
+        """
+        解析页面内容流，读取各标记内容（带MCID）中显示的文本
+        
+        Args:
+            page_num: 页码（0基）
+        
+        Returns:
+            Dict[int, str]: MCID -> 文本
+        """
+        page = self.doc[page_num]
+        # 字体和Form XObject按引用它们的对象分组：0为页面自身，其他为引用它们的Form XObject的xref
+        decoders = {}
+        for font in page.get_fonts(full=True):
+            decoders.setdefault(font[6], {})[font[4]] = self.get_font_decoder(font)
+        forms = {}
+        for xref, name, invoker, _ in page.get_xobjects():
+            forms.setdefault(invoker, {})[name] = xref
+        
+        texts = {}
+        self.parse_content(page.read_contents(), 0, decoders, forms, texts, [], set())
+        return texts
+    
+    def parse_content(self, data: bytes, owner: int, decoders: Dict, forms: Dict,
+                      texts: Dict[int, str], mcid_stack: List, active_forms: set):
+        """
+        解析一个内容流（页面或Form XObject），把标记内容中的文本追加到texts
+        
+        Args:
+            data: 内容流
+            owner: 内容流所属对象（0为页面，否则为Form XObject的xref）
+            decoders: 所属对象 -> {字体资源名: 解码函数}
+            forms: 所属对象 -> {XObject资源名: Form XObject的xref}
+            texts: MCID -> 文本（直接修改）
+            mcid_stack: 标记内容栈，每项为MCID或None（Form XObject以外层的MCID开始）
+            active_forms: 正在读取的Form XObject（防止循环引用）
+        """
+        operands = []
+        containers = []  # 正在读取的数组/字典
+        decoder = None
+        last_y = None
+        pos = 0
+        while pos < len(data):
+            match = CONTENT_TOKEN_PATTERN.match(data, pos)
+            kind = match.lastgroup
+            pos = match.end()
+            if kind == "space" or kind == "other":
+                continue
+            if kind == "string":
+                value, pos = read_literal_string(data, pos)
+            elif kind == "hex":
+                digits = re.sub(rb'\s', b'', match.group()[1:-1]).decode('ascii')
+                value = bytes.fromhex(digits + "0" * (len(digits) % 2))
+            elif kind == "name":
+                value = match.group()[1:].decode('latin-1')
+            elif kind == "number":
+                value = float(match.group())
+            elif kind in ("array_open", "dict_open"):
+                containers.append([])
+                continue
+            elif kind in ("array_close", "dict_close"):
+                items = containers.pop() if containers else []
+                value = dict(zip(items[::2], items[1::2])) if kind == "dict_close" else items
+            else:
+                value = match.group().decode('latin-1')
+            
+            # 数组和字典中的true/false/null等关键字作为普通值
+            if kind != "operator" or containers:
+                (containers[-1] if containers else operands).append(value)
+                continue
+            
+            operator = value
+            mcid = next((m for m in reversed(mcid_stack) if m is not None), None)
+            if operator == "BDC":
+                properties = operands[-1] if operands else None
+                value = properties.get("MCID") if isinstance(properties, dict) else None
+                # Form XObject中的MCID属于另一套编号，其中的文本计入外层的MCID
+                mcid_stack.append(int(value) if isinstance(value, float) and owner == 0 else None)
+            elif operator == "BMC":
+                mcid_stack.append(None)
+            elif operator == "EMC":
+                if mcid_stack:
+                    mcid_stack.pop()
+            elif operator == "Tf" and len(operands) >= 2:
+                decoder = decoders.get(owner, {}).get(operands[-2])
+            elif mcid is not None and operator in ("Tj", "'", '"', "TJ") and operands:
+                if operator in ("'", '"'):
+                    texts[mcid] = texts.get(mcid, "") + " "
+                parts = operands[-1] if isinstance(operands[-1], list) else [operands[-1]]
+                for part in parts:
+                    if isinstance(part, bytes):
+                        texts[mcid] = texts.get(mcid, "") + (decoder(part) if decoder else "")
+                    elif isinstance(part, float) and part < -250:
+                        # TJ中较大的负间距通常是词间空格
+                        texts[mcid] = texts.get(mcid, "") + " "
+            elif mcid is not None and operator in ("Td", "TD", "Tm", "T*"):
+                # 换行时加空格
+                y = operands[-1] if operator != "T*" and operands and isinstance(operands[-1], float) else None
+                if operator == "T*" or (operator in ("Td", "TD") and y) or (operator == "Tm" and last_y is not None and y != last_y):
+                    texts[mcid] = texts.get(mcid, "") + " "
+                if operator == "Tm":
+                    last_y = y
+            elif mcid is not None and operator == "Do" and operands and isinstance(operands[-1], str):
+                form_xref = forms.get(owner, {}).get(operands[-1])
+                if form_xref and form_xref not in active_forms:
+                    if texts.get(mcid):
+                        texts[mcid] += " "
+                    active_forms.add(form_xref)
+                    self.parse_content(self.doc.xref_stream(form_xref) or b"", form_xref, decoders, forms,
+                                       texts, [mcid], active_forms)
+                    active_forms.discard(form_xref)
+            elif operator == "BI":
+                # 跳过内联图片数据
+                end = re.compile(rb'\sEI(?=\s|$)').search(data, pos)
+                pos = end.end() if end else len(data)
+            operands = []
+    
+    def get_font_decoder(self, font: Tuple) -> Optional[Callable[[bytes], str]]:
+        """
+        构造字体的字符串解码函数：优先使用ToUnicode映射，其次按编码解码（简单字体应用Encoding中的Differences）
+        
+        Args:
+            font: page.get_fonts()的一项 (xref, ext, type, basefont, name, encoding)
+        
+        Returns:
+            Optional[Callable[[bytes], str]]: 解码函数，无法解码时返回None
+        """
+        xref, _, font_type, _, _, encoding = font[:6]
+        value_type, value = self.doc.xref_get_key(xref, "ToUnicode") if xref else ("null", "null")
+        if value_type == "xref":
+            cmap = self.doc.xref_stream(int(value.split()[0])) or b""
+            code_length = 2 if font_type == "Type0" else 1
+            codespace = re.search(rb'begincodespacerange\s*<([0-9A-Fa-f]+)>', cmap)
+            if codespace:
+                code_length = max(1, len(codespace.group(1)) // 2)
+            mapping = parse_to_unicode(cmap)
+            
+            def decode_with_cmap(data: bytes) -> str:
+                return "".join(mapping.get(int.from_bytes(data[i:i + code_length], 'big'), "")
+                               for i in range(0, len(data) - code_length + 1, code_length))
+            return decode_with_cmap
+        
+        if font_type == "Type0":
+            if "UTF16" in encoding or "UCS2" in encoding:
+                return lambda data: data.decode('utf-16-be', 'ignore')
+            return None
+        
+        # 简单字体：按基础编码（默认WinAnsi）建立单字节码表，再用Differences中的字形名覆盖
+        table = list(bytes(range(256)).decode('cp1252', 'replace'))
+        if xref:
+            value_type, value = self.doc.xref_get_key(xref, "Encoding")
+            if value_type != "name":
+                value_type, value = self.doc.xref_get_key(xref, "Encoding/BaseEncoding")
+            if value_type == "name" and value == "/MacRomanEncoding":
+                table = list(bytes(range(256)).decode('mac_roman'))
+            value_type, value = self.doc.xref_get_key(xref, "Encoding/Differences")
+            if value_type == "array":
+                apply_differences(table, value)
+        return lambda data: "".join(table[byte] for byte in data)
+
+
+def read_literal_string(data: bytes, pos: int) -> Tuple[bytes, int]:
+    """
+    读取内容流中的字面字符串（"("之后到配对的")"），处理转义和嵌套括号
+    
+    Args:
+        data: 内容流
+        pos: "("之后的位置
+    
+    Returns:
+        Tuple[bytes, int]: (字符串内容, 字符串结束后的位置)
+    """
+    escapes = {ord('n'): b'\n', ord('r'): b'\r', ord('t'): b'\t', ord('b'): b'\b', ord('f'): b'\f'}
+    result = bytearray()
+    depth = 1
+    while pos < len(data):
+        char = data[pos]
+        pos += 1
+        if char == 0x5C:  # 反斜杠
+            if pos >= len(data):
+                break
+            char = data[pos]
+            pos += 1
+            octal = re.match(rb'[0-7]{1,3}', data[pos - 1:pos + 2])
+            if octal:
+                result.append(int(octal.group(), 8) & 0xFF)
+                pos += len(octal.group()) - 1
+            elif char in escapes:
+                result += escapes[char]
+            elif char not in (0x0A, 0x0D):  # 反斜杠加换行表示续行
+                result.append(char)
+        elif char == 0x28:
+            depth += 1
+            result.append(char)
+        elif char == 0x29:
+            depth -= 1
+            if depth == 0:
+                break
+            result.append(char)
+        else:
+            result.append(char)
+    return bytes(result), pos
+
+
+def parse_to_unicode(cmap: bytes) -> Dict[int, str]:
+    """
+    解析ToUnicode CMap中的bfchar和bfrange
+    
+    Args:
+        cmap: CMap流的内容
+    
+    Returns:
+        Dict[int, str]: 字符码 -> 文本
+    """
+    mapping = {}
+    for block in re.findall(rb'beginbfchar(.*?)endbfchar', cmap, re.DOTALL):
+        for source, target in re.findall(rb'<([0-9A-Fa-f]+)>\s*<([0-9A-Fa-f]*)>', block):
+            mapping[int(source, 16)] = bytes.fromhex(target.decode('ascii')).decode('utf-16-be', 'ignore')
+    for block in re.findall(rb'beginbfrange(.*?)endbfrange', cmap, re.DOTALL):
+        for low, high, target in re.findall(rb'<([0-9A-Fa-f]+)>\s*<([0-9A-Fa-f]+)>\s*(<[0-9A-Fa-f]*>|\[[^\]]*\])', block):
+            low, high = int(low, 16), min(int(high, 16), int(low, 16) + 0xFFFF)
+            if target.startswith(b'['):
+                for i, item in enumerate(re.findall(rb'<([0-9A-Fa-f]*)>', target)):
+                    mapping[low + i] = bytes.fromhex(item.decode('ascii')).decode('utf-16-be', 'ignore')
+            else:
+                base = bytes.fromhex(target[1:-1].decode('ascii')).decode('utf-16-be', 'ignore')
+                if base:
+                    for i in range(high - low + 1):
+                        mapping[low + i] = base[:-1] + chr(min(ord(base[-1]) + i, 0x10FFFF))
+    return mapping
+
+
+def apply_differences(table: List[str], differences: str):
+    """
+    用Encoding中Differences数组的字形名覆盖单字节码表
+    
+    Args:
+        table: 256项的码表（直接修改）
+        differences: xref_get_key读取到的Differences数组（如"[65 /Eacute /Ecircumflex]"）
+    """
+    code = 0
+    for token in re.findall(r'/[^\s/\[\]]*|\d+', differences):
+        if token.startswith("/"):
+            if code < 256:
+                table[code] = glyph_name_to_text(token[1:])
+            code += 1
+        else:
+            code = int(token)
+
+
+def glyph_name_to_text(name: str) -> str:
+    """
+    把字形名转换为文本（Adobe字形表、uniXXXX和uXXXX[XX]形式），无法识别时返回空字符串
+    
+    Args:
+        name: 字形名（不带"/"）
+    
+    Returns:
+        str: 对应的文本
+    """
+    name = re.sub(r'#([0-9A-Fa-f]{2})', lambda m: chr(int(m.group(1), 16)), name).split('.')[0]
+    if re.fullmatch(r'uni(?:[0-9A-F]{4})+', name):
+        return "".join(chr(int(name[i:i + 4], 16)) for i in range(3, len(name), 4))
+    if re.fullmatch(r'u[0-9A-F]{4,6}', name):
+        return chr(min(int(name[1:], 16), 0x10FFFF))
+    code = fitz.glyph_name_to_unicode(name) if name else 0xFFFD
+    if code == 0xFFFD and name and hasattr(fitz, "mupdf"):
+        # 新版PyMuPDF的glyph_name_to_unicode按Unicode字符名查找，改用MuPDF的Adobe字形表
+        code = fitz.mupdf.fz_unicode_from_glyph_name(name) or 0xFFFD
+    if code == 0xFFFD:
+        return name if len(name) == 1 else ""
+    return chr(code)
@@ -9,13 +9,32 @@ PDF自动书签工具
 import sys
 import os
 
-import fitz  # PyMuPDF
+try:
+    import pymupdf as fitz  # PyMuPDF 1.24起的模块名（旧名fitz会输出弃用警告）
+except ImportError:
+    import fitz  # PyMuPDF
 import re
+import io
 import json
-from typing import List, Tuple, Dict, Optional
+import math
+import bisect
+import time
+import gc
+import mmap
+import random
+import shutil
+import filecmp
+import tempfile
+import contextlib
+import signal
+import hashlib
+import threading
+from typing import List, Tuple, Dict, Optional, Iterator
 import argparse
+import inspect
 # 新增dotenv导入
 from dotenv import load_dotenv
+from marked_content import MarkedContentReader
 
 # 设置环境变量确保UTF-8输出
 os.environ['PYTHONIOENCODING'] = 'utf-8'
@@ -95,15 +114,423 @@ def safe_json_parse(json_str, param_name):
         return []
 
 
+def parse_page_range_spec(spec: str) -> List[Tuple[int, Optional[int]]]:
+    """
+    解析页码范围字符串，如"1-20,30-,45"（1基，闭区间，省略起点表示从第1页开始，省略终点表示到文档末尾）
+    
+    Args:
+        spec: 页码范围字符串
+        
+    Returns:
+        List[Tuple[int, Optional[int]]]: (起始页, 结束页) 列表，结束页为None表示到文档末尾
+        
+    Raises:
+        ValueError: 无法解析、页码为0或起始页大于结束页
+    """
+    ranges = []
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        match = re.match(r'^(\d*)\s*-\s*(\d*)$', part)
+        if match:
+            start = int(match.group(1)) if match.group(1) else 1
+            end = int(match.group(2)) if match.group(2) else None
+        elif part.isdigit():
+            start = end = int(part)
+        else:
+            raise ValueError(f"无法解析页码范围 '{part}'")
+        if start < 1 or (end is not None and end < 1):
+            raise ValueError(f"页码从1开始: '{part}'")
+        if end is not None and start > end:
+            raise ValueError(f"起始页大于结束页: '{part}'")
+        ranges.append((start, end))
+    if not ranges:
+        raise ValueError(f"页码范围为空: '{spec}'")
+    return ranges
+
+
+def page_range_argument(spec: str) -> str:
+    """
+    argparse的type函数：检查--pages/--skip-pages的页码范围格式，无效时报命令行参数错误
+    
+    Args:
+        spec: 页码范围字符串
+        
+    Returns:
+        str: 原样返回的页码范围字符串
+    """
+    try:
+        parse_page_range_spec(spec)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return spec
+
+
+def get_process_memory_mb() -> Optional[float]:
+    """
+    获取当前进程的常驻内存（MB）
+    优先使用psutil，其次读取/proc（Linux）或调用psapi（Windows），
+    都不可用时退回到峰值常驻内存（macOS等）
+    
+    Returns:
+        Optional[float]: 常驻内存大小，无法获取时返回None
+    """
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    except ImportError:
+        pass
+    
+    if sys.platform == 'win32':
+        try:
+            import ctypes
+            from ctypes import wintypes
+            
+            class ProcessMemoryCounters(ctypes.Structure):
+                _fields_ = [
+                    ("cb", wintypes.DWORD),
+                    ("PageFaultCount", wintypes.DWORD),
+                    ("PeakWorkingSetSize", ctypes.c_size_t),
+                    ("WorkingSetSize", ctypes.c_size_t),
+                    ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                    ("PagefileUsage", ctypes.c_size_t),
+                    ("PeakPagefileUsage", ctypes.c_size_t),
+                ]
+            
+            counters = ProcessMemoryCounters()
+            counters.cb = ctypes.sizeof(counters)
+            get_current_process = ctypes.windll.kernel32.GetCurrentProcess
+            get_current_process.restype = wintypes.HANDLE
+            if ctypes.windll.psapi.GetProcessMemoryInfo(get_current_process(), ctypes.byref(counters), counters.cb):
+                return counters.WorkingSetSize / (1024 * 1024)
+        except Exception:
+            pass
+        return None
+    
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    
+    return get_peak_memory_mb()
+
+
+def get_peak_memory_mb() -> Optional[float]:
+    """
+    获取当前进程的峰值常驻内存（MB）
+    
+    Returns:
+        Optional[float]: 峰值内存，无法获取时返回None
+    """
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS以字节为单位，其他系统以KB为单位
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+    except (ImportError, AttributeError):
+        return None
+
+
+# 保存配置：只修改了书签时通常不需要对整个文件做重复对象合并和重新压缩
+SAVE_PROFILES = {
+    # 原有的保存方式：合并重复对象并压缩
+    "standard": {"garbage": 4, "deflate": True},
+    # 最快：只去除未引用的对象，不重新压缩
+    "fast": {"garbage": 1, "deflate": False},
+    # 最小：合并重复对象、压缩并使用对象流（PyMuPDF 1.24以下不支持对象流）
+    "compact": {"garbage": 4, "deflate": True, "use_objstms": 1},
+    # 网页快速查看：线性化输出，浏览器可在下载完成前显示首页（新版MuPDF已不支持线性化）
+    "web": {"garbage": 4, "deflate": True, "linear": True},
+}
+
+# 处理被取消时的进程退出码（与被SIGINT中断的惯例一致）
+CANCELLED_EXIT_CODE = 130
+
+# 影响书签结果的选项，与输入文件、辅助文件和工具版本一起组成结果缓存的键；
+# 只影响输出方式的选项（保存配置、增量保存、预览等）不在其中
+RESULT_CACHE_OPTIONS = (
+    "toc_patterns", "font_size_threshold", "enable_font_size_filter", "x_coordinate_tolerance", "leftmost_x_min_page_ratio",
+    "leftmost_x_max_min_pages", "enable_furniture_filter", "furniture_margin_ratio", "furniture_min_pages",
+    "furniture_min_density", "furniture_y_quantum", "furniture_heading_ratio",
+    "enable_context_filter", "context_search_distance", "table_row_search_distance",
+    "enable_two_tier_extraction", "two_tier_max_clip_ratio", "text_extraction_flags", "slow_page_seconds",
+    "page_line_budget", "deadline_seconds",
+    "page_ranges", "skip_pages", "sample_pages", "sample_run_length", "max_memory_mb", "memory_window_pages",
+    "reuse_outline", "outline_gap_pages", "enable_struct_tree", "enable_toc_links", "enable_toc_text",
+    "toc_scan_pages", "toc_link_min_links", "toc_link_min_entry_ratio", "toc_text_min_entries", "toc_text_min_density", "toc_page_offset_limit",
+    "toc_min_verified", "toc_indent_tolerance", "enable_table_filter", "table_min_segment_length",
+    "table_max_page_coverage", "exclude_titles", "include_titles", "require_numeric_start",
+)
+
+# 影响单页候选标题的选项，与工具版本一起决定页面记录的存放目录（按页指纹复用候选标题）
+PAGE_RECORD_OPTIONS = (
+    "toc_patterns", "font_size_threshold", "enable_font_size_filter", "enable_furniture_filter",
+    "furniture_margin_ratio", "furniture_y_quantum", "enable_context_filter", "context_search_distance",
+    "enable_two_tier_extraction", "two_tier_max_clip_ratio", "text_extraction_flags", "slow_page_seconds",
+    "page_line_budget", "enable_table_filter", "table_min_segment_length", "table_max_page_coverage", "exclude_titles", "include_titles",
+    "require_numeric_start",
+)
+
+# 目录行中的引导符（"....."、"……"等）和印刷页码（阿拉伯数字或合法的小写罗马数字，"did"、"civil"等单词不算）
+TOC_LEADER_PATTERN = r'\s*[\.·…_]{2,}\s*'
+TOC_PAGE_NUMBER_PATTERN = r'([0-9]+|(?=[ivxlcdm])m{0,3}(?:cm|cd|d?c{0,3})(?:xc|xl|l?x{0,3})(?:ix|iv|v?i{0,3}))'
+TOC_LINE_PATTERN = r'^(.*?\S)(' + TOC_LEADER_PATTERN + r'|\s+)' + TOC_PAGE_NUMBER_PATTERN + r'$'
+
+# 结构树中的标题角色及对应层级（H没有层级，按外层Sect等分节元素的嵌套深度确定）
+STRUCT_HEADING_ROLES = {"H1": 1, "H2": 2, "H3": 3, "H4": 4, "H5": 5, "H6": 6, "H": None}
+STRUCT_SECTION_ROLES = {"Part", "Art", "Sect", "Div"}
+
+
+class ProcessCancelled(Exception):
+    """处理被取消（收到取消信号或控制消息）时在检查点抛出"""
+    
+    def __init__(self, stage: str, page: Optional[int] = None):
+        """
+        Args:
+            stage: 取消时所处的处理阶段
+            page: 取消时正在处理的页码（1基）
+        """
+        self.stage = stage
+        self.page = page
+        location = f"第{page}页" if page else ""
+        super().__init__(f"处理已在[{stage}]{location}取消")
+
+
+class BlockSpatialIndex:
+    """
+    单页文本块的均匀网格空间索引
+    用于快速查询某个文本块上方、下方、右侧指定距离内的相邻文本块，
+    避免逐页两两比较带来的平方级开销
+    """
+    
+    def __init__(self, blocks: List[Dict], cell_size: float = 64.0):
+        """
+        构建空间索引
+        
+        Args:
+            blocks: 单页的文本块列表（需包含bbox）
+            cell_size: 网格单元大小（pt）
+        """
+        self.blocks = blocks
+        self.cell_size = cell_size
+        self.grid = {}  # (列, 行) -> 文本块下标列表
+        
+        for index, block in enumerate(blocks):
+            for cell in self._cells_for_rect(block.get('bbox', [0, 0, 0, 0])):
+                self.grid.setdefault(cell, []).append(index)
+    
+    def _cells_for_rect(self, rect):
+        """枚举矩形覆盖的所有网格单元"""
+        x0, y0, x1, y1 = rect[:4]
+        size = self.cell_size
+        for col in range(int(x0 // size), int(x1 // size) + 1):
+            for row in range(int(y0 // size), int(y1 // size) + 1):
+                yield (col, row)
+    
+    def query(self, rect) -> List[Dict]:
+        """
+        查询与矩形区域相交的文本块
+        
+        Args:
+            rect: 查询区域 (x0, y0, x1, y1)
+            
+        Returns:
+            List[Dict]: 相交的文本块列表
+        """
+        x0, y0, x1, y1 = rect[:4]
+        seen = set()
+        result = []
+        for cell in self._cells_for_rect(rect):
+            for index in self.grid.get(cell, ()):
+                if index in seen:
+                    continue
+                seen.add(index)
+                bx0, by0, bx1, by1 = self.blocks[index]['bbox'][:4]
+                if bx0 <= x1 and bx1 >= x0 and by0 <= y1 and by1 >= y0:
+                    result.append(self.blocks[index])
+        return result
+    
+    def above(self, bbox, distance: float) -> List[Dict]:
+        """返回bbox上方distance范围内、水平方向有重叠的文本块（由近到远）"""
+        x0, y0, x1, y1 = bbox[:4]
+        candidates = [b for b in self.query((x0, y0 - distance, x1, y0)) if b['bbox'][3] <= y0 + 1.0]
+        return sorted(candidates, key=lambda b: -b['bbox'][3])
+    
+    def below(self, bbox, distance: float) -> List[Dict]:
+        """返回bbox下方distance范围内、水平方向有重叠的文本块（由近到远）"""
+        x0, y0, x1, y1 = bbox[:4]
+        candidates = [b for b in self.query((x0, y1, x1, y1 + distance)) if b['bbox'][1] >= y1 - 1.0]
+        return sorted(candidates, key=lambda b: b['bbox'][1])
+    
+    def right_of(self, bbox, distance: float) -> List[Dict]:
+        """返回bbox右侧distance范围内、垂直方向有重叠的文本块（由近到远）"""
+        x0, y0, x1, y1 = bbox[:4]
+        candidates = [b for b in self.query((x1, y0, x1 + distance, y1)) if b['bbox'][0] >= x1 - 1.0]
+        return sorted(candidates, key=lambda b: b['bbox'][0])
+
+
+class LeftMarginEstimator:
+    """
+    文档左边距的流式估计器
+    逐页累积量化后的x坐标直方图，选取在足够多页面上出现的最小x作为左边距，
+    单个游离文本块（页边批注、旋转标签等）不会拉动估计结果；
+    所需页数有上限，长文档中只出现在各章首页的凸排标题列不会输给正文边距
+    """
+    
+    def __init__(self, quantum: float = 1.0, window: float = 2.0, min_page_ratio: float = 0.05, max_min_pages: int = 3):
+        """
+        Args:
+            quantum: 直方图量化步长（pt）
+            window: 合并统计的相邻范围（pt），通常取X坐标容差
+            min_page_ratio: 左边距至少需要出现的页面比例
+            max_min_pages: 按比例计算出的所需页数的上限
+        """
+        self.quantum = quantum
+        self.window_bins = max(0, int(round(window / quantum)))
+        self.min_page_ratio = min_page_ratio
+        self.max_min_pages = max_min_pages
+        self.bin_pages = {}  # 量化x -> 出现过的页码集合
+        self.bin_blocks = {}  # 量化x -> 文本块数量
+        self.bin_min_x = {}  # 量化x -> 该区间内的最小原始x
+        self.pages = set()
+        self.min_x = None  # 全局最小x（无法估计时的兜底值）
+    
+    def add(self, page_num: int, x: float):
+        """累积一个文本块的x坐标"""
+        if x <= 0:
+            return
+        bin_key = int(x // self.quantum)
+        self.pages.add(page_num)
+        self.bin_pages.setdefault(bin_key, set()).add(page_num)
+        self.bin_blocks[bin_key] = self.bin_blocks.get(bin_key, 0) + 1
+        if bin_key not in self.bin_min_x or x < self.bin_min_x[bin_key]:
+            self.bin_min_x[bin_key] = x
+        if self.min_x is None or x < self.min_x:
+            self.min_x = x
+    
+    def add_page(self, page_num: int, blocks: List[Dict]):
+        """累积一页文本块的x坐标"""
+        for block in blocks:
+            x_coordinate = block.get('position', {}).get('x', 0)
+            if x_coordinate == 0:
+                bbox = block.get('bbox', [0, 0, 0, 0])
+                if len(bbox) >= 4:
+                    x_coordinate = bbox[0]
+            self.add(page_num, x_coordinate)
+    
+    def estimate(self) -> Optional[float]:
+        """
+        估计文档左边距
+        
+        Returns:
+            Optional[float]: 左边距x坐标，没有任何数据时返回None
+        """
+        if not self.bin_blocks:
+            return None
+        
+        min_pages = max(1, min(self.max_min_pages, math.ceil(self.min_page_ratio * len(self.pages))))
+        for bin_key in sorted(self.bin_blocks):
+            window = range(bin_key, bin_key + self.window_bins + 1)
+            pages = set().union(*(self.bin_pages.get(b, set()) for b in window))
+            blocks = sum(self.bin_blocks.get(b, 0) for b in window)
+            # 至少两个文本块、且覆盖足够多的页面，才认为是真正的左边距
+            if len(pages) >= min_pages and blocks >= 2:
+                return self.bin_min_x[bin_key]
+        
+        return self.min_x
+
+
+class PageTextService:
+    """
+    单页文本服务
+    每页只创建一次MuPDF TextPage（只解释一次内容流），dict、blocks、words
+    和search_for都从同一个TextPage派生；close()后立即释放TextPage
+    """
+    
+    def __init__(self, page, page_num: int, flags: int):
+        """
+        Args:
+            page: fitz页面对象
+            page_num: 页码（0基）
+            flags: 文本提取标志
+        """
+        self.page = page
+        self.page_num = page_num
+        self.flags = flags
+        self.build_time = 0.0  # 创建TextPage（解释内容流）的耗时（秒）
+        self._textpage = None
+        self._dict = None
+        self._blocks = None
+    
+    @property
+    def textpage(self):
+        """按需创建TextPage"""
+        if self._textpage is None:
+            start_time = time.perf_counter()
+            self._textpage = self.page.get_textpage(flags=self.flags)
+            self.build_time = time.perf_counter() - start_time
+        return self._textpage
+    
+    def get_dict(self) -> Dict:
+        """页面的dict结构（多个调用方共享同一份结果，调用方不应修改）"""
+        if self._dict is None:
+            self._dict = self.page.get_text("dict", textpage=self.textpage)
+        return self._dict
+    
+    def get_blocks(self) -> List[Tuple]:
+        """页面的文本块列表 (x0, y0, x1, y1, text, block_no, block_type)"""
+        if self._blocks is None:
+            self._blocks = self.page.get_text("blocks", textpage=self.textpage)
+        return self._blocks
+    
+    def get_words(self) -> List[Tuple]:
+        """页面的单词列表 (x0, y0, x1, y1, word, block_no, line_no, word_no)"""
+        return self.page.get_text("words", textpage=self.textpage)
+    
+    def search_for(self, needle: str, quads: bool = False) -> List:
+        """在页面中搜索文本，返回命中区域"""
+        return self.page.search_for(needle, quads=quads, textpage=self.textpage)
+    
+    def close(self):
+        """释放TextPage和缓存的dict"""
+        self._textpage = None
+        self._dict = None
+        self._blocks = None
+        self.page = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
 class PDFBookmarkTool:
-    def __init__(self, pdf_path: str):
+    def __init__(self, pdf_path: str, pdf_stream=None, source_path: Optional[str] = None):
         """
         初始化PDF书签工具
         
         Args:
-            pdf_path: PDF文件路径
+            pdf_path: PDF文件路径；从内存打开时是用于显示和生成默认输出文件名的名称
+            pdf_stream: 内存中的PDF数据（bytes、bytearray、memoryview或mmap），提供时从内存打开而不读取pdf_path
+            source_path: 从内存打开时，内存数据对应的原文件路径（如mmap映射的文件）；
+                         没有对应文件（如标准输入）时为None
         """
         self.pdf_path = pdf_path
+        self.pdf_stream = pdf_stream
+        # 原文件路径（复制、硬链接和增量保存使用），从内存打开且没有对应文件时为None
+        self.source_path = pdf_path if pdf_stream is None else source_path
+        self.stream_view = None  # 为mmap创建的memoryview，关闭文档时释放，之后调用方才能关闭mmap
         self.doc = None
         self.toc_patterns = [
             # 匹配各种目录格式 - 支持最多8层深度
@@ -136,150 +563,1209 @@ class PDFBookmarkTool:
         self.enable_debug = False  # 是否启用调试模式
         self.document_leftmost_x = None  # PDF文件所有内容的最左边x坐标
         self.x_coordinate_tolerance = 2.0  # X坐标容差（像素）
+        self.leftmost_x_min_page_ratio = 0.05  # 左边距至少需要出现的页面比例（排除游离文本块）
+        self.leftmost_x_max_min_pages = 3  # 按比例计算出的所需页数的上限（与文档长度无关）
+        
+        # 页眉页脚过滤选项
+        self.enable_furniture_filter = True  # 是否过滤跨页重复的页眉、页脚、页码
+        self.furniture_margin_ratio = 0.12  # 页眉页脚区域占页面高度的比例（上下各一份）
+        self.furniture_min_pages = 3  # 同一位置同一文本至少出现的页数
+        self.furniture_min_density = 0.4  # 在首末出现页之间至少出现的页面比例（区分页眉与各章开头的标题）
+        self.furniture_y_quantum = 4.0  # Y坐标量化步长（pt）
+        self.furniture_heading_ratio = 1.2  # 行高超过正文行高这一倍数的文本块视为标题，不按页眉页脚过滤
+        self.body_line_height = None  # 正文行高（pt），在逐页分析时按文本长度加权统计
+        
+        # 上下文（相邻文本块）分析选项
+        self.enable_context_filter = True  # 是否启用基于相邻文本块的独立性检查
+        self.context_search_distance = 24.0  # 查找上下相邻文本块的最大距离（pt）
+        self.table_row_search_distance = 300.0  # 查找同一行右侧单元格的最大距离（pt）
+        self.page_block_indexes = {}  # 页码(0基) -> BlockSpatialIndex，在提取文本时构建
+        
+        # 两级提取：先用get_text("blocks")粗筛，只对候选块提取字体信息
+        # 裁剪提取仍要重新解释整页内容流，候选块分散在大半个页面上时改为用本页已有的TextPage直接完整提取
+        self.enable_two_tier_extraction = True
+        self.two_tier_max_clip_ratio = 0.3  # 候选块合并区域占页面面积超过该比例时，该页不做裁剪提取
+        
+        # 文本提取标志：
+        # - 不带 TEXT_PRESERVE_IMAGES，MuPDF不会解码和复制图片数据（图片块对标题识别没有用处）
+        # - 不带 TEXT_PRESERVE_LIGATURES，连字（如"ﬁ"）展开为普通字母，便于与书签文件匹配
+        # - 不带 TEXT_PRESERVE_WHITESPACE，制表符等空白统一转为空格
+        # - 保留 TEXT_MEDIABOX_CLIP，忽略页面可见区域外的文字
+        # - 保留 TEXT_CID_FOR_UNKNOWN_UNICODE，没有Unicode映射的字形输出CID而不是U+FFFD（CJK、子集字体的匹配依赖它）
+        self.text_extraction_flags = fitz.TEXT_MEDIABOX_CLIP | fitz.TEXT_CID_FOR_UNKNOWN_UNICODE
+        self.drop_span_origin = True  # 是否丢弃span级别的origin坐标（标题识别不使用，可减少内存）
+        self.page_text = None  # 当前页的PageTextService，切换页面或关闭文档时释放
+        
+        # 单页预算：个别病态页面（图表、矢量文字转储等数万个细碎span）上跳过或降级代价高的字体和标题分析
+        # 预算只用廉价的blocks提取来检查，超出的页面不再构建dict
+        self.slow_page_seconds = 5.0  # 单页文本解释（创建TextPage）已耗时超过该值（秒）时跳过该页的后续分析，解释本身不会被中断，0表示不限制
+        self.page_line_budget = 5000  # 单页文本行数上限，超出的页面降级为只提取文字和位置，0表示不限制
+        self.page_budget_stats = {}  # 页码(1基) -> {"action": "degraded"/"skipped", "reason", "lines", "time"}
+        
+        # 整体截止时间：临近截止时依次改用更廉价的策略，返回当时能得到的最好结果
+        self.deadline_seconds = None  # 任务截止时间（秒），None表示不限制
+        self.deadline_page_share = 0.6  # 逐页分析最多占用的时间比例，预计超出时改为抽样遍历剩余页面
+        self.deadline_validator_share = 0.8  # 已用时间超过该比例后跳过次要校验（上下文、表格、模糊匹配）
+        self.deadline_warmup_pages = 10  # 预热页数：前几页耗时含字体加载等一次性开销，不参与平均耗时估计
+        self.deadline_max_dedup_objects = 10000  # 有截止时间时，对象数超过该值的文档保存时不做重复对象合并（耗时随对象数平方增长且无法中断）
+        self.deadline_started_at = None  # 计时起点（time.perf_counter()）
+        self.degradations = []  # 降级决策记录 [{"stage", "decision", "elapsed"}, ...]
+        
+        # 协作式取消：收到信号或控制消息后，在下一个检查点（每页、每个候选块、每个标题）停止，
+        # 输出已找到的候选和匹配结果，不写出PDF
+        self.cancel_event = threading.Event()  # 取消请求标志，可在信号处理函数和控制消息线程中设置
+        self.cancel_reason = None  # 取消原因（信号名或控制消息）
+        self.partial_results = {"stage": None, "pages_analyzed": 0, "candidates": [], "matches": []}  # 取消时输出的部分结果
+        
+        # 分析页面范围与抽样
+        self.page_ranges = None  # 只分析的页码范围，如"1-20,30-"（1基，None表示全部页面）
+        self.skip_pages = None  # 跳过的页码范围，格式同page_ranges
+        self.sample_pages = 0  # 抽样模式：从多少页估计版式（左边距、页眉页脚），0表示不抽样
+        self.sample_run_length = 5  # 抽样时每组连续页的页数
+        self.restricted_pages = None  # 只分析这些页（0基页码集合），None表示不限制；复用原有书签时为未覆盖的页面
+        
+        # 复用原有书签：先读取PDF中已有的书签，有效且覆盖全文时跳过提取，
+        # 否则只分析没有被覆盖的页面，并把结果与原有书签合并
+        self.reuse_outline = False  # 是否复用原有书签
+        self.outline_gap_pages = 10  # 连续多少页没有任何书签指向时视为未覆盖
+        
+        # 印刷目录页：直接由目录页生成书签，层级取自缩进，只在目标页上核对标题，不扫描全文
+        # - 链接：Word/LaTeX导出的PDF在目录页上带有指向各标题的内部链接（含_Toc...命名目标）
+        # - 文本：没有链接时解析“标题....页码”形式的目录行，印刷页码通过页面标签或页码偏移换算为物理页
+        self.enable_toc_links = True  # 是否尝试从目录页链接生成书签
+        self.enable_toc_text = True  # 是否尝试解析目录页文本生成书签
+        self.toc_scan_pages = 20  # 在前多少页中查找目录页
+        self.toc_link_min_links = 3  # 一页至少有多少个指向其他页面的内部链接才视为目录页
+        self.toc_link_min_entry_ratio = 0.6  # 链接行中带引导符或行尾页码、目标页按顺序递增的行所占的最小比例（排除正文中的引用链接）
+        self.toc_text_min_entries = 5  # 一页至少有多少行“标题+右对齐页码”才视为目录页
+        self.toc_text_min_density = 0.5  # 目录行占该页文本行的最小比例
+        self.toc_page_offset_limit = 50  # 估计印刷页码与物理页码的偏移时，最多尝试的偏移量
+        self.toc_min_verified = 0.8  # 至少多少比例的标题在目标页上找到，才采用由目录页生成的书签
+        self.toc_indent_tolerance = 4.0  # 缩进聚类和行对齐的坐标容差（pt）
+        
+        # 带标签PDF的结构树：有H/H1..H6标题元素时直接由结构树生成书签，不再根据字体大小和x坐标猜测
+        self.enable_struct_tree = True  # 是否尝试从结构树生成书签
+        self.outline_source = None  # 本次书签的来源（见统计信息中的source）: struct_tree/toc_links/toc_text/heuristic/existing_outline/markdown/bookmark_file/apply_toc
+        
+        # 有界内存模式（设置max_memory_mb后启用）：按页窗口处理，窗口之间释放页面对象、
+        # 已处理页面的空间索引和MuPDF缓存
+        self.max_memory_mb = None  # 进程常驻内存上限（MB），None表示不限制
+        self.memory_window_pages = 200  # 每个窗口处理的页数
+        self.memory_min_window_pages = 10  # 内存紧张时窗口缩小的下限
+        self.mupdf_store_ratio = 0.25  # MuPDF缓存（字体、图片等）最多占内存上限的比例
+        self.memory_window_start = 0  # 当前窗口的起始页（0基）
+        self.memory_stats = {
+            "windows": 0,  # 已结束的窗口数
+            "peak_rss_mb": 0.0,  # 观测到的最大常驻内存
+            "window_pages": 0,  # 当前窗口大小
+            "store_shrinks": 0,  # MuPDF缓存超过上限而收缩的次数
+        }
+        
+        # 表格区域（页面矢量线框）检测选项
+        self.enable_table_filter = True  # 是否排除落在表格线框内的候选标题
+        self.table_min_segment_length = 10.0  # 参与表格检测的最短线段长度（pt）
+        self.table_max_page_coverage = 0.6  # 线框簇占页面面积超过该比例时视为页面边框，只在去掉边框线后的内部查找表格
+        self.page_table_regions = {}  # 页码(0基) -> 表格区域列表 [(x0, y0, x1, y1), ...]
+        self.table_detection_stats = {
+            'pages': 0,  # 执行过检测的页数
+            'drawing_pages': 0,  # 含有矢量图形的页数
+            'regions': 0,  # 检测到的表格区域数
+            'time': 0.0,  # 检测总耗时（秒）
+            'max_page_time': 0.0,  # 单页最大耗时（秒）
+            'max_page': 0,  # 耗时最大的页码（1基）
+        }
+        
+        # 保存选项
+        self.incremental_save = False  # 增量保存：只在原文件末尾追加书签（大纲）对象，不重写和重新压缩整个文件
+        self.save_profile = "standard"  # 完整保存时使用的保存配置，见SAVE_PROFILES
+        self.unchanged_output = "copy"  # 新书签与原有书签完全一致时的输出方式: copy=复制原文件（保留修改时间）, link=硬链接原文件（失败时复制）, skip=不写出
+        self.outline_outputs = []  # 同时写出的书签文件 [(路径, 格式), ...]，路径"-"表示标准输出，格式为json/csv/txt
+        self.existing_toc = None  # 打开文件时原有的书签 [[层级, 标题, 页码], ...]，首次使用时读取
+        self.outline_unchanged = False  # 本次计算出的书签是否与原有书签完全一致（一致时不修改、不重写PDF）
+        self.preview_output = None  # 预览模式：只把最终书签（含来源坐标）以JSON写到该路径（"-"表示标准输出），不写出PDF和书签文件
+        self.proposed_toc = []  # 本次计算出的最终书签 [{'level', 'title', 'page', 'source'}, ...]，供预览输出
+        
+        # 结果缓存：以输入文件、选项、辅助文件和工具版本的哈希为键，保存最终书签和统计信息，
+        # 命中时跳过提取、匹配和规范化，直接写出（或预览）；按最近使用时间淘汰，可多台机器共享同一目录
+        self.cache_dir = None  # 结果缓存目录，None表示不启用
+        self.cache_max_mb = 64  # 缓存目录大小上限（MB），超出时删除最久未使用的结果
+        self.cache_key = None  # 本次处理的缓存键（未启用缓存时为None）
+        # 按页指纹复用（需要cache_dir）：每页以内容流的哈希为指纹，保存该页的候选标题、页眉页脚特征和左边距数据；
+        # 新版本文档中指纹未变化的页面直接复用（按新页码重映射），只重新提取变化的页面
+        self.reuse_page_results = False  # 是否按页指纹复用候选标题
+        
+        # 手动控制选项
+        self.exclude_titles = []  # 手动排除的标题列表
+        self.include_titles = []  # 手动包含的标题列表
+        
+        # 标题格式过滤选项
+        self.require_numeric_start = False  # 是否要求标题必须以数字开头
+        
+        # 大模型API配置
+        load_dotenv()
+        self.api_key = os.environ.get("API_KEY", "")
+        self.api_url = "https://lab.iwhalecloud.com/gpt-proxy/v1/chat/completions"
+        
+        # 文档标题相关
+        self.document_title_text = None  # 文档标题文本，避免被添加为书签
+    
+    def open_pdf(self) -> bool:
+        """
+        打开PDF文件
+        
+        Returns:
+            bool: 是否成功打开
+        """
+        try:
+            if self.pdf_stream is not None:
+                self.doc = self._open_stream()
+            else:
+                self.doc = fitz.open(self.pdf_path)
+            self.existing_toc = None
+            self.outline_unchanged = False
+            self.restricted_pages = None
+            self.outline_source = None
+            return True
+        except Exception as e:
+            print(f"错误：无法打开PDF文件 {self.pdf_path}: {e}")
+            return False
+    
+    def _open_stream(self) -> fitz.Document:
+        """
+        从内存中的PDF数据打开文档
+        mmap和memoryview直接交给MuPDF（PyMuPDF 1.24起不复制数据），
+        旧版PyMuPDF只接受bytes，此时复制一次
+        
+        Returns:
+            fitz.Document: 打开的文档
+        """
+        stream = self.pdf_stream
+        if isinstance(stream, mmap.mmap):
+            self.stream_view = stream = memoryview(stream)
+        try:
+            return fitz.open(stream=stream, filetype="pdf")
+        except TypeError:
+            return fitz.open(stream=bytes(stream), filetype="pdf")
+    
+    def _write_source_copy(self, path: str):
+        """
+        把原文件的内容写到指定路径：有原文件时复制文件，否则写出内存中的PDF数据
+        
+        Args:
+            path: 目标路径
+        """
+        if self.source_path:
+            shutil.copy2(self.source_path, path)
+        else:
+            with open(path, "wb") as f:
+                f.write(self.pdf_stream)
+    
+    def get_existing_toc(self) -> List:
+        """
+        获取打开文件时原有的书签（只读取一次，不受之后set_toc的影响）
+        
+        Returns:
+            List: [[层级, 标题, 页码], ...]
+        """
+        if self.existing_toc is None:
+            self.existing_toc = self.doc.get_toc(simple=True)
+        return self.existing_toc
+    
+    def is_toc_unchanged(self, toc: List) -> bool:
+        """
+        比较新书签与原有书签的层级、标题和目标页码是否完全一致
+        
+        Args:
+            toc: 新书签列表，每项前三个元素为 [层级, 标题, 页码]
+            
+        Returns:
+            bool: 是否完全一致
+        """
+        existing_toc = self.get_existing_toc()
+        if len(toc) != len(existing_toc):
+            return False
+        return all(list(new[:3]) == list(old[:3]) for new, old in zip(toc, existing_toc))
+    
+    def close_pdf(self):
+        """关闭PDF文件"""
+        self.release_page_text()
+        if self.doc is not None and not self.doc.is_closed:
+            self.doc.close()
+        if self.stream_view is not None:
+            self.stream_view.release()
+            self.stream_view = None
+    
+    def get_page_text(self, page_num: int) -> PageTextService:
+        """
+        获取页面的文本服务，同一页的多次提取共享一个TextPage
+        请求其他页面时，上一页的TextPage会被立即释放
+        
+        Args:
+            page_num: 页码（0基）
+            
+        Returns:
+            PageTextService: 页面文本服务
+        """
+        if self.page_text is None or self.page_text.page_num != page_num:
+            self.release_page_text()
+            self.page_text = PageTextService(self.doc[page_num], page_num, self.text_extraction_flags)
+        return self.page_text
+    
+    def release_page_text(self):
+        """释放当前页的TextPage"""
+        if self.page_text is not None:
+            self.page_text.close()
+            self.page_text = None
+    
+    def start_deadline(self):
+        """开始计时（每个处理流程开始时调用），清空上一次的降级记录"""
+        self.deadline_started_at = time.perf_counter()
+        self.degradations = []
+    
+    def deadline_elapsed_ratio(self) -> float:
+        """
+        已用时间占截止时间的比例
+        
+        Returns:
+            float: 比例（未设置截止时间时为0）
+        """
+        if not self.deadline_seconds or self.deadline_started_at is None:
+            return 0.0
+        return (time.perf_counter() - self.deadline_started_at) / self.deadline_seconds
+    
+    def deadline_reached(self, share: float = 1.0) -> bool:
+        """
+        判断已用时间是否达到截止时间的指定比例
+        
+        Args:
+            share: 比例，1.0表示截止时间本身
+            
+        Returns:
+            bool: 是否已达到
+        """
+        return bool(self.deadline_seconds) and self.deadline_elapsed_ratio() >= share
+    
+    def record_degradation(self, stage: str, decision: str):
+        """
+        记录一次因截止时间而做出的降级决策（同一阶段的同一决策只记录一次）
+        
+        Args:
+            stage: 处理阶段
+            decision: 决策内容
+        """
+        if any(d["stage"] == stage and d["decision"] == decision for d in self.degradations):
+            return
+        elapsed = time.perf_counter() - self.deadline_started_at if self.deadline_started_at else 0.0
+        self.degradations.append({"stage": stage, "decision": decision, "elapsed": round(elapsed, 2)})
+        print(f"  ⏱ 截止时间降级 [{stage}] {decision} (已用 {elapsed:.1f}s / {self.deadline_seconds}s)")
+    
+    def skip_for_deadline(self, stage: str, decision: str) -> bool:
+        """
+        已用时间超过deadline_validator_share时返回True并记录降级决策，用于跳过次要步骤
+        
+        Args:
+            stage: 处理阶段
+            decision: 跳过时记录的决策内容
+            
+        Returns:
+            bool: 是否应跳过
+        """
+        if not self.deadline_reached(self.deadline_validator_share):
+            return False
+        self.record_degradation(stage, decision)
+        return True
+    
+    def get_deadline_summary(self) -> Dict:
+        """
+        截止时间降级情况汇总（用于结果统计）
+        
+        Returns:
+            Dict: {"degraded": 是否降级, "decisions": 降级决策列表}
+        """
+        return {"degraded": bool(self.degradations), "decisions": list(self.degradations)}
+    
+    def print_deadline_summary(self):
+        """输出截止时间降级情况"""
+        if not self.degradations:
+            return
+        print(f"⚠️ 结果为截止时间内的降级结果，共 {len(self.degradations)} 项降级决策:")
+        for d in self.degradations:
+            print(f"    [{d['stage']}] {d['decision']} (第 {d['elapsed']}s)")
+    
+    def listen_for_cancel(self, control_stdin: bool = False):
+        """
+        安装取消触发方式：SIGINT、SIGTERM（Windows上还有SIGBREAK）信号，
+        以及可选的标准输入控制消息（单独一行"cancel"）
+        第二次收到信号时不再等待检查点，直接中断。必须在主线程中调用
+        
+        Args:
+            control_stdin: 是否从标准输入读取控制消息
+        """
+        def handle_signal(signum, frame):
+            if self.cancel_event.is_set():
+                raise KeyboardInterrupt
+            self.request_cancel(signal.Signals(signum).name)
+        
+        for name in ("SIGINT", "SIGTERM", "SIGBREAK"):
+            if hasattr(signal, name):
+                signal.signal(getattr(signal, name), handle_signal)
+        
+        if control_stdin:
+            def read_control_messages():
+                for line in sys.stdin:
+                    if line.strip().lower() == "cancel":
+                        self.request_cancel("control:cancel")
+                        return
+            
+            threading.Thread(target=read_control_messages, name="cancel-listener", daemon=True).start()
+    
+    def request_cancel(self, reason: str = "cancel"):
+        """
+        请求取消处理（可在信号处理函数或其他线程中调用，不做输出）
+        
+        Args:
+            reason: 取消原因
+        """
+        if not self.cancel_event.is_set():
+            self.cancel_reason = reason
+            self.cancel_event.set()
+    
+    def check_cancelled(self, stage: str, page: Optional[int] = None):
+        """
+        取消检查点：已请求取消时抛出ProcessCancelled
+        
+        Args:
+            stage: 处理阶段
+            page: 当前页码（1基）
+        """
+        if self.cancel_event.is_set():
+            self.partial_results["stage"] = stage
+            raise ProcessCancelled(stage, page)
+    
+    def reset_partial_results(self):
+        """清空部分结果（每个处理流程开始时调用）"""
+        self.partial_results = {"stage": None, "pages_analyzed": 0, "candidates": [], "matches": []}
+    
+    def get_partial_results(self) -> Dict:
+        """
+        取消时的结构化部分结果
+        
+        Returns:
+            Dict: {"cancelled", "reason", "stage", "pages_analyzed", "candidates", "matches"}，
+                  候选块只保留文本、页码、字号和坐标
+        """
+        candidates = []
+        for item in self.partial_results["candidates"]:
+            block = item[0] if isinstance(item, tuple) else item
+            bbox = block.get('bbox', [0, 0, 0, 0])
+            candidates.append({
+                "text": block.get('text', '').strip(),
+                "page": block.get('page', 1),
+                "size": block.get('size'),
+                "x": round(bbox[0], 2),
+                "y": round(bbox[1], 2),
+            })
+        return {
+            "cancelled": True,
+            "reason": self.cancel_reason,
+            "stage": self.partial_results["stage"],
+            "pages_analyzed": self.partial_results["pages_analyzed"],
+            "candidates": candidates,
+            "matches": [dict(match) for match in self.partial_results["matches"]],
+        }
+    
+    def iter_pages_within_deadline(self, pages: List[int], stage: str) -> Iterator[int]:
+        """
+        在截止时间内遍历页面：按已处理页面的平均耗时预计剩余时间，
+        预计超出deadline_page_share时改为抽样遍历剩余页面，到达截止时间时停止
+        抽样以sample_run_length页连续页为一组，组间间隔随机（平均每stride组分析一组），
+        避免固定间隔与章节周期重合而漏掉所有章节标题
+        每页之前检查取消请求
+        
+        Args:
+            pages: 待遍历的页码列表（0基）
+            stage: 处理阶段（用于记录降级决策和取消位置）
+            
+        Yields:
+            int: 页码（0基）
+        """
+        if not self.deadline_seconds:
+            for page_num in pages:
+                self.check_cancelled(stage, page_num + 1)
+                yield page_num
+                self.partial_results["pages_analyzed"] += 1
+            return
+        
+        pass_end = self.deadline_started_at + self.deadline_seconds * self.deadline_page_share
+        run_length = max(1, self.sample_run_length)
+        rng = random.Random(0)  # 固定种子，同一文档多次运行结果一致
+        stride = 1  # 平均每stride组连续页分析一组
+        recorded_stride = 1
+        processed = 0
+        run_position = 0
+        warmup_end = None  # 预热结束时刻，之后的页面用于估计平均耗时
+        index = 0
+        while index < len(pages):
+            self.check_cancelled(stage, pages[index] + 1)
+            yield pages[index]
+            self.partial_results["pages_analyzed"] += 1
+            processed += 1
+            run_position += 1
+            
+            remaining = len(pages) - index - 1
+            if remaining and self.deadline_reached():
+                self.record_degradation(stage, f"到达截止时间，停止于第{pages[index] + 1}页，剩余{remaining}页未分析")
+                return
+            
+            if processed == self.deadline_warmup_pages:
+                warmup_end = time.perf_counter()
+            
+            if run_position < run_length:
+                index += 1
+                continue
+            run_position = 0
+            
+            # 每组结束时重新估计抽样间隔
+            if remaining and warmup_end is not None and processed >= 2 * self.deadline_warmup_pages:
+                now = time.perf_counter()
+                per_page = (now - warmup_end) / (processed - self.deadline_warmup_pages)
+                available = max(pass_end - now, per_page)
+                stride = max(1, math.ceil(per_page * remaining / available))
+                if stride > recorded_stride:
+                    recorded_stride = stride
+                    self.record_degradation(
+                        stage, f"预计超时，从第{pages[index] + 1}页起平均每{stride * run_length}页抽样分析{run_length}页")
+            
+            gap = rng.randint(0, 2 * (stride - 1) * run_length) if stride > 1 else 0
+            index += 1 + gap
+    
+    def check_page_budget(self, page_num: int) -> Optional[str]:
+        """
+        检查页面是否超出单页预算（只做廉价的blocks提取，在构建dict之前调用）
+        耗时检查在TextPage创建之后进行，只能避免慢页面上代价更高的dict构建和标题分析，
+        不能中断内容流解释本身；整体耗时由deadline_seconds控制
+        
+        Args:
+            page_num: 页码（0基）
+            
+        Returns:
+            Optional[str]: None表示在预算内；"degraded"表示文本行数超出预算，只提取文字和位置、
+                           不参与标题候选；"skipped"表示解释内容流的耗时已超过slow_page_seconds，跳过该页的后续分析
+        """
+        page_key = page_num + 1
+        if page_key in self.page_budget_stats:
+            return self.page_budget_stats[page_key]["action"]
+        if not self.slow_page_seconds and not self.page_line_budget:
+            return None
+        
+        page_text = self.get_page_text(page_num)
+        start_time = time.perf_counter()
+        blocks = page_text.get_blocks()
+        elapsed = page_text.build_time + (time.perf_counter() - start_time)
+        line_count = sum(block[4].count("\n") + 1 for block in blocks if block[6] == 0)
+        
+        if self.slow_page_seconds and elapsed > self.slow_page_seconds:
+            action, reason = "skipped", f"文本解释耗时 {elapsed:.1f}s 超过 {self.slow_page_seconds}s"
+        elif self.page_line_budget and line_count > self.page_line_budget:
+            action, reason = "degraded", f"{line_count} 行文本超过预算 {self.page_line_budget} 行"
+        else:
+            return None
+        
+        self.page_budget_stats[page_key] = {
+            "action": action,
+            "reason": reason,
+            "lines": line_count,
+            "time": round(elapsed, 3),
+        }
+        print(f"  第{page_key}页{'跳过' if action == 'skipped' else '降级为廉价提取'}: {reason}")
+        return action
+    
+    def get_page_budget_summary(self) -> Dict:
+        """
+        超出单页预算的页面汇总（用于结果统计）
+        
+        Returns:
+            Dict: {"degraded": [页码...], "skipped": [页码...]}，页码为1基
+        """
+        summary = {"degraded": [], "skipped": []}
+        for page_key, info in sorted(self.page_budget_stats.items()):
+            summary[info["action"]].append(page_key)
+        return summary
+    
+    def print_page_budget_stats(self):
+        """输出超出单页预算的页面统计"""
+        summary = self.get_page_budget_summary()
+        if summary["degraded"] or summary["skipped"]:
+            print(f"  单页预算: 降级 {len(summary['degraded'])} 页 {summary['degraded'][:10]}, "
+                  f"跳过 {len(summary['skipped'])} 页 {summary['skipped'][:10]}")
+    
+    def begin_memory_windows(self):
+        """开始一次逐页遍历（重置有界内存模式的窗口状态）"""
+        self.memory_window_start = 0
+        self.memory_stats["window_pages"] = self.memory_window_pages
+    
+    def memory_window_due(self, page_num: int) -> bool:
+        """
+        判断处理完当前页后是否需要结束内存窗口（窗口页数已满，或常驻内存已超过上限时）
+        每页把MuPDF缓存限制在上限以内，并采样一次常驻内存（读取/proc等，开销很小）
+        
+        Args:
+            page_num: 刚处理完的页码（0基）
+            
+        Returns:
+            bool: 是否需要调用trim_memory_window
+        """
+        if self.max_memory_mb is None:
+            return False
+        self.limit_mupdf_store()
+        rss = get_process_memory_mb()
+        if rss is not None:
+            self.memory_stats["peak_rss_mb"] = max(self.memory_stats["peak_rss_mb"], rss)
+            if rss > self.max_memory_mb:
+                # 不等窗口结束，立即清理
+                return True
+        return page_num + 1 - self.memory_window_start >= self.memory_stats["window_pages"]
+    
+    def limit_mupdf_store(self):
+        """
+        把MuPDF缓存（字体、图片、解析过的对象）限制在 max_memory_mb * mupdf_store_ratio 以内
+        MuPDF的缓存上限只能在创建上下文时设置，这里在超出时按比例收缩；
+        取不到缓存大小的PyMuPDF版本只在窗口结束时清空缓存
+        """
+        store_size = self._mupdf_store_size()
+        store_limit = self.max_memory_mb * self.mupdf_store_ratio * 1024 * 1024
+        if store_size is not None and store_size > store_limit:
+            fitz.TOOLS.store_shrink(math.ceil(100 * (1 - store_limit / store_size)))
+            self.memory_stats["store_shrinks"] += 1
+    
+    def _mupdf_store_size(self) -> Optional[int]:
+        """
+        MuPDF缓存当前占用的字节数（旧版本为属性，新版本为方法，取不到时返回None）
+        
+        Returns:
+            Optional[int]: 缓存字节数
+        """
+        store_size = fitz.TOOLS.store_size
+        if callable(store_size):
+            store_size = store_size()
+        return store_size if isinstance(store_size, int) else None
+    
+    def trim_memory_window(self, page_num: int):
+        """
+        结束当前内存窗口：释放页面对象、已处理页面的空间索引，清空MuPDF缓存
+        清理后内存仍超过上限时缩小窗口，窗口已是下限仍超过上限则中止处理
+        
+        Args:
+            page_num: 刚处理完的页码（0基）
+            
+        Raises:
+            MemoryError: 窗口已缩小到下限，常驻内存仍超过上限
+        """
+        self.release_page_text()
+        for done_page in [p for p in self.page_block_indexes if p <= page_num]:
+            del self.page_block_indexes[done_page]
+        fitz.TOOLS.store_shrink(100)
+        gc.collect()
+        
+        self.memory_window_start = page_num + 1
+        self.memory_stats["windows"] += 1
+        rss = get_process_memory_mb()
+        if rss is None:
+            return
+        self.memory_stats["peak_rss_mb"] = max(self.memory_stats["peak_rss_mb"], rss)
+        print(f"  内存窗口结束于第 {page_num + 1} 页: 常驻内存 {rss:.0f} MB / 上限 {self.max_memory_mb} MB")
+        
+        if rss > self.max_memory_mb:
+            window_pages = self.memory_stats["window_pages"]
+            if window_pages <= self.memory_min_window_pages:
+                raise MemoryError(f"常驻内存 {rss:.0f} MB 超过上限 {self.max_memory_mb} MB")
+            self.memory_stats["window_pages"] = max(self.memory_min_window_pages, window_pages // 2)
+            print(f"  内存超过上限，窗口缩小为 {self.memory_stats['window_pages']} 页")
+    
+    def extract_text_with_font_info(self, page_num: int) -> List[Dict]:
+        """
+        提取页面文本及字体信息
+        
+        Args:
+            page_num: 页码
+            
+        Returns:
+            List[Dict]: 文本块信息列表
+        """
+        budget_action = self.check_page_budget(page_num)
+        if budget_action == "skipped":
+            self.page_block_indexes[page_num] = BlockSpatialIndex([])
+            return []
+        if budget_action == "degraded":
+            return self.extract_text_blocks_fast(page_num)
+        
+        text_dict = self.get_page_text(page_num).get_dict()
+        
+        text_blocks = []
+        for block in text_dict["blocks"]:
+            if "lines" in block:
+                text_block = self._build_text_block(block, page_num, text_dict.get("height", 0))
+                if text_block:
+                    text_blocks.append(text_block)
+        
+        # 构建本页的空间索引，供上下文分析使用
+        self.page_block_indexes[page_num] = BlockSpatialIndex(text_blocks)
+        
+        return text_blocks
+    
+    def extract_text_blocks_fast(self, page_num: int) -> List[Dict]:
+        """
+        第一级提取：只获取文本块的位置和文字（get_text("blocks")），不解析字体
+        返回的文本块带有 is_light 标记，字体信息需通过 extract_block_font_info 补全
+        
+        Args:
+            page_num: 页码（0基）
+            
+        Returns:
+            List[Dict]: 轻量文本块信息列表
+        """
+        if self.check_page_budget(page_num) == "skipped":
+            self.page_block_indexes[page_num] = BlockSpatialIndex([])
+            return []
+        
+        page_text = self.get_page_text(page_num)
+        page_height = page_text.page.rect.height
+        
+        text_blocks = []
+        for x0, y0, x1, y1, block_text, _, block_type in page_text.get_blocks():
+            if block_type != 0:  # 跳过图片块
+                continue
+            
+            line_texts = [line.strip() for line in block_text.split("\n") if line.strip()]
+            if not line_texts:
+                continue
+            
+            text_blocks.append(self._build_light_block([x0, y0, x1, y1], line_texts, page_num, page_height))
+        
+        # 构建本页的空间索引，供上下文分析使用
+        self.page_block_indexes[page_num] = BlockSpatialIndex(text_blocks)
+        
+        return text_blocks
+    
+    def extract_candidate_text_blocks(self, page_num: int) -> List[Dict]:
+        """
+        提取页面文本，在遍历行和span时直接应用已知的标题过滤条件
+        （字体大小阈值、最小长度、文档标题、数字开头），只为通过过滤的块构建字体信息
+        
+        未通过过滤的块只保留文字和位置（is_light），仍参与左边距、页眉页脚和上下文分析；
+        通过过滤的块带有 is_candidate 标记
+        
+        Args:
+            page_num: 页码（0基）
+            
+        Returns:
+            List[Dict]: 文本块信息列表
+        """
+        budget_action = self.check_page_budget(page_num)
+        if budget_action:
+            # 超出预算的页面没有字体信息，不产生候选（降级页面仍参与左边距和上下文分析）
+            return self.extract_text_blocks_fast(page_num)
+        
+        text_dict = self.get_page_text(page_num).get_dict()
+        page_height = text_dict.get("height", 0)
+        min_font_size = self._pushdown_font_size()
+        
+        text_blocks = []
+        for block in text_dict["blocks"]:
+            if "lines" not in block:
+                continue
+            
+            # 只拼接文字并记录最大字号，不分配字体信息
+            line_texts = []
+            max_size = 0
+            for line in block["lines"]:
+                line_text = ""
+                for span in line["spans"]:
+                    span_text = span["text"]
+                    line_text += span_text
+                    if span.get("size", 0) > max_size and span_text.strip():
+                        max_size = span.get("size", 0)
+                if line_text.strip():
+                    line_texts.append(line_text.strip())
+            if not line_texts:
+                continue
+            
+            # 所有文字都小于字体阈值的块不可能通过步骤2，直接跳过候选检查
+            text = " ".join(line_texts)
+            if max_size >= min_font_size and self._is_candidate_text(text):
+                text_block = self._build_text_block(block, page_num, page_height)
+                text_block["is_candidate"] = True
+            else:
+                text_block = self._build_light_block(block["bbox"], line_texts, page_num, page_height)
+            text_blocks.append(text_block)
+        
+        # 构建本页的空间索引，供上下文分析使用
+        self.page_block_indexes[page_num] = BlockSpatialIndex(text_blocks)
+        
+        return text_blocks
+    
+    def _candidate_area_ratio(self, text_blocks: List[Dict]) -> float:
+        """
+        候选块合并区域（外接矩形）占页面面积的比例，用于决定字体信息是裁剪提取还是整页提取
+        
+        Args:
+            text_blocks: 一页的轻量文本块（已标记is_candidate）
+            
+        Returns:
+            float: 比例，没有候选块时为0
+        """
+        rects = [block['bbox'] for block in text_blocks if block.get('is_candidate')]
+        if not rects or not self.page_text:
+            return 0.0
+        page_rect = self.page_text.page.rect
+        union_area = ((max(r[2] for r in rects) - min(r[0] for r in rects))
+                      * (max(r[3] for r in rects) - min(r[1] for r in rects)))
+        return union_area / max(page_rect.width * page_rect.height, 1.0)
+    
+    def _build_light_block(self, bbox, line_texts: List[str], page_num: int, page_height: float) -> Dict:
+        """
+        构建只有文字和位置的轻量文本块（不含字体信息）
+        
+        Args:
+            bbox: 文本块边界框
+            line_texts: 块内各行文字（已去除首尾空白）
+            page_num: 页码（0基）
+            page_height: 页面高度
+            
+        Returns:
+            Dict: 轻量文本块信息
+        """
+        x0, y0, x1, y1 = bbox
+        return {
+            "text": " ".join(line_texts),
+            "bbox": [x0, y0, x1, y1],
+            "page": page_num + 1,
+            "page_height": page_height,
+            "lines": [{"text": line_text} for line_text in line_texts],
+            "position": {
+                "x": x0,
+                "y": y0,
+                "width": x1 - x0,
+                "height": y1 - y0,
+                "center_x": (x0 + x1) / 2,
+                "center_y": (y0 + y1) / 2,
+            },
+            "is_light": True,
+        }
+    
+    def _pushdown_font_size(self) -> float:
+        """
+        提取阶段可以提前应用的字体大小下限（未启用字体大小过滤时为0）
+        
+        Returns:
+            float: 字体大小下限
+        """
+        return self.font_size_threshold if self.enable_font_size_filter else 0
+    
+    def extract_block_font_info(self, light_blocks: List[Dict]) -> List[Optional[Dict]]:
+        """
+        第二级提取：只在候选块所在区域调用get_text("dict", clip=...)获取字体信息
+        同一页的候选块合并为一次裁剪提取，避免对同一页重复解析内容流
+        
+        Args:
+            light_blocks: extract_text_blocks_fast 返回的轻量文本块
+            
+        Returns:
+            List[Optional[Dict]]: 与输入顺序一致的完整文本块，区域内没有文字或文字都小于字体阈值时为None
+        """
+        results = [None] * len(light_blocks)
+        min_font_size = self._pushdown_font_size()
+        
+        page_groups = {}
+        for i, light_block in enumerate(light_blocks):
+            page_groups.setdefault(light_block.get('page', 1) - 1, []).append(i)
+        
+        for page_num, indexes in page_groups.items():
+            self.check_cancelled("提取字体信息", page_num + 1)
+            # 超出单页预算的页面不再提取字体信息
+            if page_num + 1 in self.page_budget_stats:
+                continue
+            rects = [[b - 1 for b in light_blocks[i]['bbox'][:2]] + [b + 1 for b in light_blocks[i]['bbox'][2:4]]
+                     for i in indexes]
+            clip = fitz.Rect(min(r[0] for r in rects), min(r[1] for r in rects),
+                             max(r[2] for r in rects), max(r[3] for r in rects))
+            
+            text_dict = self.doc[page_num].get_text("dict", clip=clip, flags=self.text_extraction_flags)
+            
+            # 按行的中心点把裁剪区域内的行分配回各个候选块
+            block_lines = [[] for _ in indexes]
+            for block in text_dict["blocks"]:
+                for line in block.get("lines", []):
+                    lx0, ly0, lx1, ly1 = line["bbox"]
+                    center_x, center_y = (lx0 + lx1) / 2, (ly0 + ly1) / 2
+                    for k, (x0, y0, x1, y1) in enumerate(rects):
+                        if x0 <= center_x <= x1 and y0 <= center_y <= y1:
+                            block_lines[k].append(line)
+                            break
+            
+            for k, i in enumerate(indexes):
+                if not block_lines[k]:
+                    continue
+                # 所有文字都小于字体阈值的块不可能通过步骤2，不再构建字体信息
+                if max((span.get("size", 0) for line in block_lines[k] for span in line["spans"]
+                        if span["text"].strip()), default=0) < min_font_size:
+                    continue
+                light_block = light_blocks[i]
+                text_block = self._build_text_block({"bbox": light_block['bbox'], "lines": block_lines[k]},
+                                                    page_num, text_dict.get("height", 0))
+                if text_block:
+                    # 以第一级提取的文字为准，保证与粗筛结果一致
+                    text_block['text'] = light_block['text']
+                    results[i] = text_block
+        
+        return results
+    
+    def _build_text_block(self, block: Dict, page_num: int, page_height: float) -> Optional[Dict]:
+        """
+        将get_text("dict")中的一个文本块转换为带字体信息的文本块
+        
+        Args:
+            block: get_text("dict")返回的块
+            page_num: 页码（0基）
+            page_height: 页面高度
+            
+        Returns:
+            Optional[Dict]: 文本块信息，没有有效文字时返回None
+        """
+        block_lines = []  # 收集当前块的所有行
+        
+        for line in block["lines"]:
+            line_text = ""
+            line_fonts = []  # 收集行内字体信息
+            line_bbox = line.get("bbox", [0, 0, 0, 0])  # 行的边界框
+            
+            for span in line["spans"]:
+                span_text = span["text"]
+                line_text += span_text
+                
+                # 收集详细的字体信息
+                font_info = {
+                    "text": span_text,
+                    "font": span.get("font", ""),
+                    "size": span.get("size", 0),
+                    "flags": span.get("flags", 0),  # 字体标志（粗体、斜体等）
+                    "color": span.get("color", 0),  # 文字颜色
+                    "bbox": span.get("bbox", [0, 0, 0, 0]),  # 文字边界框
+                }
+                if not self.drop_span_origin:
+                    font_info["origin"] = span.get("origin", [0, 0])  # 文字起始位置
+                line_fonts.append(font_info)
+            
+            if line_text.strip():
+                line_info = {
+                    "text": line_text.strip(),
+                    "fonts": line_fonts,
+                    "bbox": line_bbox,
+                    "page": page_num + 1
+                }
+                block_lines.append(line_info)
+        
+        # 将块内的所有行合并成一个文本块
+        if block_lines:
+            combined_text = " ".join([line["text"] for line in block_lines])
+            
+            # 计算主要字体信息（取最频繁出现的）
+            all_fonts = []
+            all_sizes = []
+            all_flags = []
+            all_colors = []
+            
+            for line in block_lines:
+                for font_info in line["fonts"]:
+                    if font_info["text"].strip():  # 只考虑非空文本
+                        all_fonts.append(font_info["font"])
+                        all_sizes.append(font_info["size"])
+                        all_flags.append(font_info["flags"])
+                        all_colors.append(font_info["color"])
+            
+            if all_sizes:
+                # 获取主要字体属性
+                main_font = max(set(all_fonts), key=all_fonts.count) if all_fonts else ""
+                main_size = max(set(all_sizes), key=all_sizes.count) if all_sizes else 0
+                main_flags = max(set(all_flags), key=all_flags.count) if all_flags else 0
+                main_color = max(set(all_colors), key=all_colors.count) if all_colors else 0
+                
+                # 计算位置信息
+                block_bbox = block.get("bbox", [0, 0, 0, 0])
+                
+                text_block = {
+                    "text": combined_text,
+                    "font": main_font,
+                    "size": main_size,
+                    "flags": main_flags,
+                    "color": main_color,
+                    "bbox": block_bbox,
+                    "page": page_num + 1,
+                    "page_height": page_height,
+                    "lines": block_lines,  # 保留详细的行信息
+                    # 添加更多分析信息
+                    "position": {
+                        "x": block_bbox[0],
+                        "y": block_bbox[1],
+                        "width": block_bbox[2] - block_bbox[0],
+                        "height": block_bbox[3] - block_bbox[1],
+                        "center_x": (block_bbox[0] + block_bbox[2]) / 2,
+                        "center_y": (block_bbox[1] + block_bbox[3]) / 2,
+                    },
+                    "font_analysis": {
+                        "all_fonts": list(set(all_fonts)),
+                        "all_sizes": list(set(all_sizes)),
+                        "all_flags": list(set(all_flags)),
+                        "all_colors": list(set(all_colors)),
+                        "size_range": [min(all_sizes), max(all_sizes)] if all_sizes else [0, 0],
+                        "is_bold": bool(main_flags & 2**4),  # 检查粗体标志
+                        "is_italic": bool(main_flags & 2**1),  # 检查斜体标志
+                        "is_superscript": bool(main_flags & 2**0),  # 检查上标
+                        "is_subscript": bool(main_flags & 2**1),  # 检查下标
+                    }
+                }
+                # 有界内存模式：主要字体属性已经算出，逐span的字体明细只有调试输出使用，不再保留
+                if self.max_memory_mb is not None and not self.enable_debug:
+                    for line in block_lines:
+                        del line["fonts"]
+                return text_block
+        return None
+    
+    def get_page_block_index(self, page_num: int) -> BlockSpatialIndex:
+        """
+        获取页面的文本块空间索引（未构建时先提取页面文本）
+        
+        Args:
+            page_num: 页码（0基）
+            
+        Returns:
+            BlockSpatialIndex: 页面空间索引
+        """
+        if page_num not in self.page_block_indexes:
+            self.extract_text_with_font_info(page_num)
+        return self.page_block_indexes[page_num]
+    
+    def release_page_block_index(self, page_num: int):
+        """
+        释放页面的空间索引（逐页遍历中本页的上下文计算完成后调用，
+        各页的文本块不会在整个任务期间累积在内存中；之后仍需要时由get_page_block_index重新提取）
         
-        # 手动控制选项
-        self.exclude_titles = []  # 手动排除的标题列表
-        self.include_titles = []  # 手动包含的标题列表
+        Args:
+            page_num: 页码（0基）
+        """
+        self.page_block_indexes.pop(page_num, None)
+    
+    def build_block_context(self, block: Dict) -> Dict:
+        """
+        根据空间索引构建文本块的上下文信息（上一行、下一行文本）
         
-        # 标题格式过滤选项
-        self.require_numeric_start = False  # 是否要求标题必须以数字开头
+        Args:
+            block: 文本块信息
+            
+        Returns:
+            Dict: 上下文信息，供is_text_independent使用
+        """
+        bbox = block.get('bbox', [0, 0, 0, 0])
+        index = self.get_page_block_index(block.get('page', 1) - 1)
         
-        # 大模型API配置
-        load_dotenv()
-        self.api_key = os.environ.get("API_KEY", "")
-        self.api_url = "https://lab.iwhalecloud.com/gpt-proxy/v1/chat/completions"
+        above = [b for b in index.above(bbox, self.context_search_distance) if b is not block]
+        below = [b for b in index.below(bbox, self.context_search_distance) if b is not block]
         
-        # 文档标题相关
-        self.document_title_text = None  # 文档标题文本，避免被添加为书签
+        return {
+            "prev_line_text": above[0]['lines'][-1]['text'] if above else "",
+            "next_line_text": below[0]['lines'][0]['text'] if below else "",
+            "is_single_line_block": len(block.get('lines', [])) <= 1,
+        }
     
-    def open_pdf(self) -> bool:
+    def get_page_table_regions(self, page_num: int) -> List[Tuple[float, float, float, float]]:
         """
-        打开PDF文件
+        获取页面中由矢量线框构成的表格区域（结果按页缓存，只计算一次）
         
+        Args:
+            page_num: 页码（0基）
+            
         Returns:
-            bool: 是否成功打开
+            List[Tuple]: 表格区域列表 (x0, y0, x1, y1)
         """
-        try:
-            self.doc = fitz.open(self.pdf_path)
-            return True
-        except Exception as e:
-            print(f"错误：无法打开PDF文件 {self.pdf_path}: {e}")
-            return False
+        if page_num in self.page_table_regions:
+            return self.page_table_regions[page_num]
+        
+        start_time = time.perf_counter()
+        page = self.doc[page_num]
+        drawings = page.get_cdrawings()
+        regions = self._detect_ruled_regions(drawings, page.rect) if drawings else []
+        elapsed = time.perf_counter() - start_time
+        
+        self.page_table_regions[page_num] = regions
+        
+        stats = self.table_detection_stats
+        stats['pages'] += 1
+        stats['time'] += elapsed
+        if drawings:
+            stats['drawing_pages'] += 1
+            stats['regions'] += len(regions)
+        if elapsed > stats['max_page_time']:
+            stats['max_page_time'] = elapsed
+            stats['max_page'] = page_num + 1
+        if elapsed > 0.05:
+            print(f"  表格检测耗时较长: 第{page_num + 1}页 {len(drawings)} 个矢量路径, 耗时 {elapsed * 1000:.1f}ms")
+        
+        return regions
     
-    def close_pdf(self):
-        """关闭PDF文件"""
-        if self.doc:
-            self.doc.close()
+    def _detect_ruled_regions(self, drawings: List[Dict], page_rect) -> List[Tuple[float, float, float, float]]:
+        """
+        从页面矢量路径中识别表格线框区域
+        把水平线、竖直线（包括描边矩形的边和细长的填充矩形）按相交关系聚类，
+        至少有3条横线和3条竖线的簇视为表格；覆盖大半个页面的簇是页面边框，
+        去掉贯穿整个簇的边框线和通栏横线后再在内部查找表格
+        
+        Args:
+            drawings: page.get_cdrawings() 的结果
+            page_rect: 页面矩形
+            
+        Returns:
+            List[Tuple]: 表格区域列表 (x0, y0, x1, y1)
+        """
+        min_length = self.table_min_segment_length
+        segments = []  # {'bbox': [...], 'horizontal': bool}
+        
+        def add_segment(x0, y0, x1, y1):
+            x0, x1 = min(x0, x1), max(x0, x1)
+            y0, y1 = min(y0, y1), max(y0, y1)
+            if y1 - y0 <= 2 and x1 - x0 >= min_length:
+                segments.append({'bbox': [x0, y0, x1, y1], 'horizontal': True})
+            elif x1 - x0 <= 2 and y1 - y0 >= min_length:
+                segments.append({'bbox': [x0, y0, x1, y1], 'horizontal': False})
+        
+        for path in drawings:
+            stroked = 's' in path.get('type', '')
+            for item in path.get('items', []):
+                kind = item[0]
+                if kind == 'l':
+                    (ax, ay), (bx, by) = item[1][:2], item[2][:2]
+                    add_segment(ax, ay, bx, by)
+                elif kind in ('re', 'qu'):
+                    x0, y0, x1, y1 = fitz.Rect(item[1]) if kind == 're' else fitz.Quad(item[1]).rect
+                    if stroked:
+                        add_segment(x0, y0, x1, y0)
+                        add_segment(x0, y1, x1, y1)
+                        add_segment(x0, y0, x0, y1)
+                        add_segment(x1, y0, x1, y1)
+                    else:
+                        # 仅填充的细长矩形常被用来画表格线
+                        add_segment(x0, y0, x1, y1)
+        
+        page_area = max(page_rect.width * page_rect.height, 1.0)
+        regions = []
+        for members in self._cluster_segments(segments):
+            region = self._ruled_cluster_region(members)
+            if region is None:
+                continue
+            if (region[2] - region[0]) * (region[3] - region[1]) <= page_area * self.table_max_page_coverage:
+                regions.append(region)
+                continue
+            
+            # 页面边框（常带页眉横线）：去掉贯穿整个簇的线段，只保留内部的表格
+            width, height = region[2] - region[0], region[3] - region[1]
+            inner = [m for m in members
+                     if (m['bbox'][2] - m['bbox'][0] < width * 0.9 if m['horizontal']
+                         else m['bbox'][3] - m['bbox'][1] < height * 0.9)]
+            for inner_members in self._cluster_segments(inner):
+                inner_region = self._ruled_cluster_region(inner_members)
+                if (inner_region is not None and (inner_region[2] - inner_region[0]) * (inner_region[3] - inner_region[1])
+                        <= page_area * self.table_max_page_coverage):
+                    regions.append(inner_region)
+        
+        return regions
     
-    def extract_text_with_font_info(self, page_num: int) -> List[Dict]:
+    def _cluster_segments(self, segments: List[Dict]) -> List[List[Dict]]:
         """
-        提取页面文本及字体信息
+        把相交（或端点相距2pt以内）的线段聚成簇
         
         Args:
-            page_num: 页码
+            segments: 线段列表 {'bbox': [...], 'horizontal': bool}
             
         Returns:
-            List[Dict]: 文本块信息列表
+            List[List[Dict]]: 线段簇列表（少于4条线段时返回空列表）
         """
-        page = self.doc[page_num]
-        text_dict = page.get_text("dict")
+        if len(segments) < 4:
+            return []
         
-        text_blocks = []
-        for block in text_dict["blocks"]:
-            if "lines" in block:
-                block_lines = []  # 收集当前块的所有行
-                
-                for line in block["lines"]:
-                    line_text = ""
-                    line_fonts = []  # 收集行内字体信息
-                    line_bbox = line.get("bbox", [0, 0, 0, 0])  # 行的边界框
-                    
-                    for span in line["spans"]:
-                        span_text = span["text"]
-                        line_text += span_text
-                        
-                        # 收集详细的字体信息
-                        font_info = {
-                            "text": span_text,
-                            "font": span.get("font", ""),
-                            "size": span.get("size", 0),
-                            "flags": span.get("flags", 0),  # 字体标志（粗体、斜体等）
-                            "color": span.get("color", 0),  # 文字颜色
-                            "bbox": span.get("bbox", [0, 0, 0, 0]),  # 文字边界框
-                            "origin": span.get("origin", [0, 0]),  # 文字起始位置
-                        }
-                        line_fonts.append(font_info)
-                    
-                    if line_text.strip():
-                        line_info = {
-                            "text": line_text.strip(),
-                            "fonts": line_fonts,
-                            "bbox": line_bbox,
-                            "page": page_num + 1
-                        }
-                        block_lines.append(line_info)
-                
-                # 将块内的所有行合并成一个文本块
-                if block_lines:
-                    combined_text = " ".join([line["text"] for line in block_lines])
-                    
-                    # 计算主要字体信息（取最频繁出现的）
-                    all_fonts = []
-                    all_sizes = []
-                    all_flags = []
-                    all_colors = []
-                    
-                    for line in block_lines:
-                        for font_info in line["fonts"]:
-                            if font_info["text"].strip():  # 只考虑非空文本
-                                all_fonts.append(font_info["font"])
-                                all_sizes.append(font_info["size"])
-                                all_flags.append(font_info["flags"])
-                                all_colors.append(font_info["color"])
-                    
-                    if all_sizes:
-                        # 获取主要字体属性
-                        main_font = max(set(all_fonts), key=all_fonts.count) if all_fonts else ""
-                        main_size = max(set(all_sizes), key=all_sizes.count) if all_sizes else 0
-                        main_flags = max(set(all_flags), key=all_flags.count) if all_flags else 0
-                        main_color = max(set(all_colors), key=all_colors.count) if all_colors else 0
-                        
-                        # 计算位置信息
-                        block_bbox = block.get("bbox", [0, 0, 0, 0])
-                        
-                        text_block = {
-                            "text": combined_text,
-                            "font": main_font,
-                            "size": main_size,
-                            "flags": main_flags,
-                            "color": main_color,
-                            "bbox": block_bbox,
-                            "page": page_num + 1,
-                            "lines": block_lines,  # 保留详细的行信息
-                            # 添加更多分析信息
-                            "position": {
-                                "x": block_bbox[0],
-                                "y": block_bbox[1],
-                                "width": block_bbox[2] - block_bbox[0],
-                                "height": block_bbox[3] - block_bbox[1],
-                                "center_x": (block_bbox[0] + block_bbox[2]) / 2,
-                                "center_y": (block_bbox[1] + block_bbox[3]) / 2,
-                            },
-                            "font_analysis": {
-                                "all_fonts": list(set(all_fonts)),
-                                "all_sizes": list(set(all_sizes)),
-                                "all_flags": list(set(all_flags)),
-                                "all_colors": list(set(all_colors)),
-                                "size_range": [min(all_sizes), max(all_sizes)] if all_sizes else [0, 0],
-                                "is_bold": bool(main_flags & 2**4),  # 检查粗体标志
-                                "is_italic": bool(main_flags & 2**1),  # 检查斜体标志
-                                "is_superscript": bool(main_flags & 2**0),  # 检查上标
-                                "is_subscript": bool(main_flags & 2**1),  # 检查下标
-                            }
-                        }
-                        text_blocks.append(text_block)
+        # 借助网格索引查找相交线段，用并查集聚类
+        segment_index = BlockSpatialIndex(segments)
+        parent = list(range(len(segments)))
+        position = {id(segment): i for i, segment in enumerate(segments)}
+        
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+        
+        for i, segment in enumerate(segments):
+            x0, y0, x1, y1 = segment['bbox']
+            for other in segment_index.query((x0 - 2, y0 - 2, x1 + 2, y1 + 2)):
+                root_a, root_b = find(i), find(position[id(other)])
+                if root_a != root_b:
+                    parent[root_b] = root_a
+        
+        clusters = {}
+        for i, segment in enumerate(segments):
+            clusters.setdefault(find(i), []).append(segment)
+        return list(clusters.values())
+    
+    def _ruled_cluster_region(self, members: List[Dict]) -> Optional[Tuple[float, float, float, float]]:
+        """
+        判断线段簇是否构成表格网格
         
-        return text_blocks
+        Args:
+            members: 线段簇
+            
+        Returns:
+            Optional[Tuple]: 表格区域 (x0, y0, x1, y1)，不是表格时返回None
+        """
+        rows = {round(m['bbox'][1]) for m in members if m['horizontal']}
+        cols = {round(m['bbox'][0]) for m in members if not m['horizontal']}
+        # 单个边框（2横2竖）或边框加一条分隔线不算表格，横竖方向都必须有内部分隔线
+        if len(rows) < 3 or len(cols) < 3:
+            return None
+        return (
+            min(m['bbox'][0] for m in members),
+            min(m['bbox'][1] for m in members),
+            max(m['bbox'][2] for m in members),
+            max(m['bbox'][3] for m in members),
+        )
+    
+    def is_in_table_region(self, page_num: int, bbox) -> bool:
+        """
+        判断文本块是否位于表格线框内
+        
+        Args:
+            page_num: 页码（0基）
+            bbox: 文本块边界框
+            
+        Returns:
+            bool: 是否位于表格区域内
+        """
+        if not self.enable_table_filter or not bbox or len(bbox) < 4:
+            return False
+        
+        tolerance = 2.0
+        x0, y0, x1, y1 = bbox[:4]
+        for rx0, ry0, rx1, ry1 in self.get_page_table_regions(page_num):
+            if (x0 >= rx0 - tolerance and y0 >= ry0 - tolerance and
+                    x1 <= rx1 + tolerance and y1 <= ry1 + tolerance):
+                return True
+        return False
+    
+    def print_table_detection_stats(self):
+        """输出表格区域检测的耗时统计"""
+        stats = self.table_detection_stats
+        if not stats['pages']:
+            return
+        print(f"  表格区域检测: 检测 {stats['pages']} 页, 其中 {stats['drawing_pages']} 页含矢量图形, "
+              f"识别 {stats['regions']} 个表格区域, 总耗时 {stats['time'] * 1000:.1f}ms, "
+              f"最慢第{stats['max_page']}页 {stats['max_page_time'] * 1000:.1f}ms")
     
     def is_likely_toc_text(self, text: str, context: Dict = None) -> Tuple[bool, int]:
         """
@@ -316,9 +1802,8 @@ class PDFBookmarkTool:
                 return False, 0
         
         # 检查文本独立性（必须是独立的一行，不能前后有其他文字）
-        # 暂时禁用过于严格的独立性检查
-        # if context and not self.is_text_independent(text, context):
-        #     return False, 0
+        if context and self.enable_context_filter and not self.is_text_independent(text, context):
+            return False, 0
         
         # 检查各种目录格式并确定层级
         for pattern in self.toc_patterns:
@@ -681,8 +2166,13 @@ class PDFBookmarkTool:
         """
         toc_entries = []
         
-        # 设置PDF文件最左边x坐标作为参考
-        first_page_blocks = self.extract_text_with_font_info(0)
+        pages = self.get_analysis_pages()
+        if not pages:
+            print("没有需要分析的页面")
+            return toc_entries
+        
+        # 设置PDF文件最左边x坐标作为参考（取第一个分析页面）
+        first_page_blocks = self.extract_text_with_font_info(pages[0])
         self.document_leftmost_x = self.detect_document_leftmost_x_coordinate(first_page_blocks)
         print(f"检测到PDF文件最左边x坐标参考值: {self.document_leftmost_x}")
         
@@ -690,17 +2180,20 @@ class PDFBookmarkTool:
         print("开始自动识别标题...")
         
         # 遍历所有页面查找目录条目
-        for page_num in range(len(self.doc)):
+        self.begin_memory_windows()
+        for page_num in pages:
+            self.check_cancelled("识别标题", page_num + 1)
             text_blocks = self.extract_text_with_font_info(page_num)
             
             for block in text_blocks:
                 text = block.get('text', '').strip()
                 
-                if not text:
+                # 超出单页预算而降级的页面没有字体信息，不参与标题识别
+                if not text or block.get('is_light'):
                     continue
                     
                 # 检查是否为目录文本
-                is_toc, level = self.is_likely_toc_text(text, block)
+                is_toc, level = self.is_likely_toc_text(text, self.build_block_context(block))
                 
                 if is_toc:
                     # 排除文档标题
@@ -743,7 +2236,13 @@ class PDFBookmarkTool:
                     }
                     
                     toc_entries.append(entry)
+            
+            self.release_page_block_index(page_num)
+            if self.memory_window_due(page_num):
+                self.trim_memory_window(page_num)
         
+        self.release_page_text()
+        self.print_page_budget_stats()
         print(f"自动识别完成，找到 {len(toc_entries)} 个标题")
         
         # 收集标题字体大小用于后续分析
@@ -761,11 +2260,19 @@ class PDFBookmarkTool:
         toc_entries = []
         print(f"主动搜索包含标题: {self.include_titles}")
         
-        # 获取所有文本块
+        # 只保留包含任一指定标题的文本块（其余文本块不可能匹配）
+        include_titles = [include_title.strip() for include_title in self.include_titles]
         all_text_blocks = []
+        self.begin_memory_windows()
         for page_num in range(len(self.doc)):
+            self.check_cancelled("搜索包含标题", page_num + 1)
             page_text_blocks = self.extract_text_with_font_info(page_num)
-            all_text_blocks.extend(page_text_blocks)
+            all_text_blocks.extend(block for block in page_text_blocks
+                                   if any(title in block.get('text', '').strip() for title in include_titles))
+            self.release_page_block_index(page_num)
+            if self.memory_window_due(page_num):
+                self.trim_memory_window(page_num)
+        self.release_page_text()
         
         added_count = 0
         
@@ -2391,8 +3898,18 @@ class PDFBookmarkTool:
             #     filter_reason = "疑似表格内容"
             
             # 3. 检查上下文是否为表格环境
-            # 通过检查相邻条目是否有相似的结构来判断
-            if i > 0 and i < len(toc_entries) - 1:
+            # 优先使用页面几何信息：位于表格线框内，或同一行右侧还有多个文本块，说明处于表格中
+            row_cells = self._count_row_neighbours(entry)
+            page = entry.get('source_page', entry.get('page', 1))
+            if entry.get('bbox') and self.doc is not None and self.is_in_table_region(page - 1, entry['bbox']):
+                should_filter = True
+                filter_reason = "疑似表格内容（位于表格线框内）"
+            elif row_cells >= 2:
+                should_filter = True
+                filter_reason = f"疑似表格内容（同一行右侧有 {row_cells} 个文本块）"
+            
+            # 没有几何信息时，通过检查相邻条目是否有相似的结构来判断
+            elif row_cells < 0 and i > 0 and i < len(toc_entries) - 1:
                 prev_title = toc_entries[i-1]["title"]
                 next_title = toc_entries[i+1]["title"]
                 
@@ -2433,6 +3950,37 @@ class PDFBookmarkTool:
         print(f"表格和前缀过滤完成，过滤后条目数: {len(filtered_entries)}")
         return filtered_entries
     
+    def _count_row_neighbours(self, entry: Dict) -> int:
+        """
+        统计条目所在行右侧的文本块数量
+        
+        Args:
+            entry: 目录条目（需包含page以及bbox或x/y坐标）
+            
+        Returns:
+            int: 右侧文本块数量，无法获取几何信息时返回-1
+        """
+        page = entry.get('source_page', entry.get('page'))
+        bbox = entry.get('bbox')
+        if not bbox or len(bbox) < 4 or bbox[2] <= bbox[0]:
+            if 'x' not in entry or 'y' not in entry:
+                return -1
+            # 匹配流程只记录了行的左上角，用一个窄条近似该行
+            x, y = entry['x'], entry['y']
+            bbox = [x, y, x + 1.0, y + entry.get('font_size', 12)]
+        if not page or self.doc is None or page > len(self.doc):
+            return -1
+        
+        index = self.get_page_block_index(page - 1)
+        x0, y0, x1, y1 = bbox[:4]
+        # 只统计与当前行垂直方向大部分重叠的文本块，避免把下一段文字计入
+        height = max(y1 - y0, 1.0)
+        neighbours = [
+            b for b in index.right_of(bbox, self.table_row_search_distance)
+            if b['bbox'][0] > x1 and min(y1, b['bbox'][3]) - max(y0, b['bbox'][1]) >= height * 0.5
+        ]
+        return len(neighbours)
+    
     def add_bookmarks(self, toc_entries: List[Dict]) -> Tuple[bool, Dict]:
         """
         添加书签到PDF
@@ -2444,7 +3992,8 @@ class PDFBookmarkTool:
             Tuple[bool, Dict]: (是否成功, 统计信息)
         """
         try:
-            # 清除现有书签
+            # 清除现有书签（先记录原有书签，用于判断书签是否有变化）
+            self.get_existing_toc()
             self.doc.set_toc([])
             
             if not toc_entries:
@@ -2457,7 +4006,10 @@ class PDFBookmarkTool:
             
             # 预过滤：去除表格内容和特殊前缀文本
             print("步骤1: 过滤表格内容和特殊前缀文本...")
-            pre_filtered_entries = self.filter_table_and_prefix_entries(toc_entries)
+            if self.skip_for_deadline("添加书签", "跳过表格内容和特殊前缀预过滤"):
+                pre_filtered_entries = toc_entries
+            else:
+                pre_filtered_entries = self.filter_table_and_prefix_entries(toc_entries)
             after_pre_filter = len(pre_filtered_entries)
             print(f"预过滤完成，剩余 {after_pre_filter} 个条目")
             
@@ -2512,17 +4064,29 @@ class PDFBookmarkTool:
                 print("错误：TOC结构验证失败")
                 return False, {}
             
-            # 设置新的目录
-            self.doc.set_toc(toc)
+            self.set_proposed_toc(toc, final_entries)
+            
+            # 与原有书签完全一致时恢复原书签，不修改文档
+            self.outline_unchanged = self.is_toc_unchanged(toc)
+            if self.outline_unchanged:
+                print("书签与PDF原有书签完全一致，不修改PDF")
+                self.doc.set_toc(self.get_existing_toc())
+            else:
+                # 设置新的目录
+                self.doc.set_toc(toc)
             
             # 构建统计信息
             stats = {
+                'status': 'unchanged' if self.outline_unchanged else 'updated',
+                'source': self.outline_source,
                 'original': original_count,
                 'after_pre_filter': after_pre_filter,
                 # 'after_semantic_filter': after_semantic_filter,
                 'after_normalize': after_normalize,
                 'after_reorder': after_reorder,
-                'final': final_count
+                'final': final_count,
+                'page_budget': self.get_page_budget_summary(),
+                'deadline': self.get_deadline_summary()
             }
             
             return True, stats
@@ -2532,6 +4096,270 @@ class PDFBookmarkTool:
             print(f"错误详情：在处理第 {len(toc) if 'toc' in locals() else 0} 个条目时出错")
             return False, {}
     
+    def get_result_cache_key(self, mode: str, extra_file: Optional[str] = None) -> str:
+        """
+        计算结果缓存键：输入PDF内容、处理模式、影响结果的选项、辅助文件内容和工具版本的SHA-256
+        
+        Args:
+            mode: 处理模式
+            extra_file: 辅助文件（Markdown或书签文件）路径
+            
+        Returns:
+            str: 十六进制的缓存键
+        """
+        digest = hashlib.sha256()
+        if self.pdf_stream is not None:
+            digest.update(self.pdf_stream)
+        else:
+            self._update_file_digest(digest, self.pdf_path)
+        
+        options = {name: getattr(self, name) for name in RESULT_CACHE_OPTIONS}
+        digest.update(json.dumps({"mode": mode, "options": options}, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8'))
+        if extra_file:
+            self._update_file_digest(digest, extra_file)
+        
+        # 工具版本：本模块的源码和PyMuPDF版本，任一变化都会使旧结果失效
+        self._update_file_digest(digest, os.path.abspath(__file__))
+        digest.update(str(getattr(fitz, "VersionBind", "")).encode('utf-8'))
+        return digest.hexdigest()
+    
+    def _update_file_digest(self, digest, path: str):
+        """把文件内容分块加入哈希"""
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+    
+    def load_cached_result(self, mode: str, extra_file: Optional[str] = None) -> bool:
+        """
+        查找结果缓存，命中时直接把缓存的书签写入文档
+        
+        Args:
+            mode: 处理模式
+            extra_file: 辅助文件（Markdown或书签文件）路径
+            
+        Returns:
+            bool: 是否命中（命中时已设置书签，调用方直接写出结果）
+        """
+        self.cache_key = None
+        if not self.cache_dir:
+            return False
+        
+        try:
+            self.cache_key = self.get_result_cache_key(mode, extra_file)
+            cache_path = os.path.join(self.cache_dir, f"{self.cache_key}.json")
+            if not os.path.exists(cache_path):
+                return False
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            # 更新修改时间，作为最近使用时间
+            os.utime(cache_path)
+        except (OSError, ValueError) as e:
+            print(f"警告：读取结果缓存失败: {e}")
+            return False
+        
+        toc = []
+        for level, title, page, *rest in cached['toc']:
+            entry = [level, title, page]
+            if rest and rest[0]:
+                dest = dict(rest[0])
+                if dest.get('to') is not None:
+                    dest['to'] = fitz.Point(*dest['to'])
+                entry.append(dest)
+            toc.append(entry)
+        
+        self.outline_source = cached.get('source')
+        self.proposed_toc = cached.get('proposed_toc', [])
+        self.outline_unchanged = self.is_toc_unchanged(toc)
+        if not self.outline_unchanged:
+            self.doc.set_toc(toc)
+        print(f"结果缓存命中：{len(toc)} 个书签（来源: {self.outline_source}），跳过提取和匹配")
+        return True
+    
+    def store_cached_result(self, stats: Dict):
+        """
+        把本次的最终书签和统计信息写入结果缓存（降级或跳过了页面的结果与耗时有关，不缓存）
+        
+        Args:
+            stats: 统计信息
+        """
+        if not self.cache_dir or not self.cache_key:
+            return
+        page_budget = self.get_page_budget_summary()
+        if self.degradations or page_budget['degraded'] or page_budget['skipped']:
+            print("结果受截止时间或单页预算影响，不写入缓存")
+            return
+        
+        toc = []
+        for level, title, page, *rest in self.doc.get_toc(simple=False):
+            entry = [level, title, page]
+            if rest and isinstance(rest[0], dict) and rest[0].get('kind') == fitz.LINK_GOTO:
+                to = rest[0].get('to')
+                entry.append({
+                    'kind': fitz.LINK_GOTO,
+                    'page': rest[0].get('page'),
+                    'to': [to.x, to.y] if to is not None else None,
+                    'zoom': rest[0].get('zoom', 0),
+                })
+            toc.append(entry)
+        cached = {
+            'key': self.cache_key,
+            'source': self.outline_source,
+            'toc': toc,
+            'proposed_toc': self.proposed_toc,
+            'stats': stats,
+        }
+        
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            cache_path = os.path.join(self.cache_dir, f"{self.cache_key}.json")
+            # 先写临时文件再替换，多个进程（或多台机器）共享缓存目录时不会读到不完整的结果
+            part_path = f"{cache_path}.{os.getpid()}.part"
+            with open(part_path, 'w', encoding='utf-8') as f:
+                json.dump(cached, f, ensure_ascii=False, default=str)
+            os.replace(part_path, cache_path)
+            self._evict_result_cache()
+        except OSError as e:
+            print(f"警告：写入结果缓存失败: {e}")
+    
+    def _evict_result_cache(self):
+        """缓存目录（含页面记录子目录）超出大小上限时，按最近使用时间从旧到新删除结果和页面记录"""
+        entries = []
+        for directory, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if not name.endswith('.json'):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    info = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((info.st_mtime, info.st_size, path))
+        
+        total = sum(size for _, size, _ in entries)
+        limit = self.cache_max_mb * 1024 * 1024
+        for _, size, path in sorted(entries):
+            if total <= limit:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+    
+    def set_proposed_toc(self, toc: List, entries: Optional[List[Dict]] = None):
+        """
+        记录本次计算出的最终书签及其来源位置，供预览输出
+        
+        Args:
+            toc: 最终TOC列表 [[层级, 标题, 页码, ...], ...]
+            entries: 与toc一一对应的书签条目（文本块），没有来源信息时为None
+        """
+        self.proposed_toc = []
+        for i, item in enumerate(toc):
+            bookmark = {'level': item[0], 'title': item[1], 'page': item[2]}
+            if entries is not None and i < len(entries) and not entries[i].get('from_outline'):
+                entry = entries[i]
+                bookmark['source'] = {
+                    'page': entry.get('source_page', entry.get('page', item[2])),
+                    'x': round(entry.get('x', entry.get('x_coordinate', 0)), 2),
+                    'y': round(entry.get('y', entry.get('y_coordinate', 0)), 2),
+                    'font_size': round(entry.get('font_size', 0), 2),
+                }
+            self.proposed_toc.append(bookmark)
+    
+    def write_preview(self) -> bool:
+        """
+        把本次计算出的最终书签以JSON写到preview_output，不写出PDF
+        
+        Returns:
+            bool: 是否成功
+        """
+        try:
+            with self._open_text_output(self.preview_output) as f:
+                json.dump(self.proposed_toc, f, ensure_ascii=False, indent=2)
+            if self.preview_output != "-":
+                print(f"书签预览已保存到: {self.preview_output}")
+            return True
+        except Exception as e:
+            print(f"错误：写出书签预览失败: {e}")
+            return False
+    
+    def write_results(self, output_path: Optional[str] = None) -> bool:
+        """
+        输出处理结果：预览模式只写出书签预览，否则保存PDF并写出书签文件
+        
+        Args:
+            output_path: 输出PDF路径
+            
+        Returns:
+            bool: 是否成功
+        """
+        if self.preview_output:
+            return self.write_preview()
+        return self.save_pdf(output_path) and self.write_outline_outputs()
+    
+    def load_toc_file(self, toc_path: str) -> List:
+        """
+        读取已审阅的书签JSON（预览输出或--extract-only导出的格式）
+        
+        Args:
+            toc_path: JSON文件路径
+            
+        Returns:
+            List: TOC列表 [[层级, 标题, 页码], ...]（页码1基，已限制在文档范围内）
+        """
+        with open(toc_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        
+        toc = []
+        for i, item in enumerate(data):
+            if isinstance(item, dict):
+                level, title, page = item.get('level', 1), item['title'], item['page']
+            else:
+                level, title, page = item[0], item[1], item[2]
+            page = min(max(int(page), 1), len(self.doc))
+            toc.append([int(level), str(title), page])
+        return toc
+    
+    def process_with_toc_file(self, toc_path: str, output_path: Optional[str] = None) -> bool:
+        """
+        直接写入已审阅的书签，跳过文本提取和匹配
+        
+        Args:
+            toc_path: 书签JSON文件路径
+            output_path: 输出文件路径
+            
+        Returns:
+            bool: 是否成功
+        """
+        print(f"使用已审阅的书签进行处理: {toc_path}")
+        if not self.open_pdf():
+            print("❌ 无法打开PDF文件")
+            return False
+        
+        try:
+            toc = self.load_toc_file(toc_path)
+        except (OSError, ValueError, KeyError, IndexError, TypeError) as e:
+            print(f"错误：无法读取书签文件 {toc_path}: {e}")
+            return False
+        
+        if not toc:
+            print("书签文件为空")
+            return False
+        if not self.validate_toc_structure(toc):
+            print("错误：TOC结构验证失败")
+            return False
+        
+        self.outline_source = "apply_toc"
+        self.set_proposed_toc(toc)
+        self.outline_unchanged = self.is_toc_unchanged(toc)
+        if self.outline_unchanged:
+            print("书签与PDF原有书签完全一致，不修改PDF")
+        else:
+            self.doc.set_toc(toc)
+        print(f"共写入 {len(toc)} 个书签")
+        return self.write_results(output_path)
+    
     def validate_toc_structure(self, toc: List) -> bool:
         """
         验证TOC结构是否符合PyMuPDF的要求（使用更宽松的验证）
@@ -2583,29 +4411,191 @@ class PDFBookmarkTool:
         
         return True
     
-    def save_pdf(self, output_path: Optional[str] = None) -> bool:
+    def save_pdf(self, output_path: Optional[str] = None) -> bool:
+        """
+        保存PDF文件
+        
+        Args:
+            output_path: 输出路径，如果为None则生成新文件名，"-"表示写到标准输出
+            
+        Returns:
+            bool: 是否成功
+        """
+        # 已取消的任务不写出PDF
+        self.check_cancelled("保存")
+        if output_path == "-":
+            try:
+                stdout = sys.__stdout__.buffer
+                stdout.write(self.get_pdf_bytes())
+                stdout.flush()
+                return True
+            except Exception as e:
+                print(f"错误：输出PDF到标准输出失败: {e}")
+                return False
+        
+        part_path = None
+        try:
+            if output_path:
+                save_path = output_path
+            else:
+                # 生成新的文件名避免覆盖原文件时的问题
+                base_name = self.pdf_path.rsplit('.', 1)[0]
+                save_path = f"{base_name}_with_bookmarks.pdf"
+            # 先写入临时文件再替换，保存中途被终止时不会留下写了一半的输出文件
+            part_path = save_path + ".part"
+            
+            if self.outline_unchanged:
+                return self._write_unchanged_output(save_path, part_path)
+            
+            if self.incremental_save:
+                if self._save_incremental(save_path, part_path):
+                    return True
+                print("  原文件不支持增量保存（如打开时经过修复），改为完整保存")
+            
+            self._save_with_options(part_path, self._get_save_options())
+            os.replace(part_path, save_path)
+            return True
+        except Exception as e:
+            print(f"错误：保存PDF失败: {e}")
+            if part_path and os.path.exists(part_path):
+                os.remove(part_path)
+            return False
+    
+    def get_pdf_bytes(self) -> bytes:
+        """
+        获取添加书签后的PDF内容（写到内存，不写文件），保存方式与save_pdf一致
+        
+        Returns:
+            bytes: PDF内容
+        """
+        if self.outline_unchanged:
+            if self.source_path:
+                with open(self.source_path, "rb") as f:
+                    return f.read()
+            return bytes(self.pdf_stream)
+        
+        if self.incremental_save and self.doc.can_save_incrementally():
+            # 增量更新只能追加到文件，借助临时文件完成
+            with tempfile.TemporaryDirectory() as temp_dir:
+                temp_path = os.path.join(temp_dir, "incremental.pdf")
+                self._save_incremental(temp_path, temp_path + ".part")
+                with open(temp_path, "rb") as f:
+                    return f.read()
+        
+        return self._save_with_options(None, self._get_save_options())
+    
+    def _get_save_options(self) -> Dict:
+        """
+        当前保存配置对应的doc.save()参数（临近截止时间或对象过多时跳过重复对象合并）
+        
+        Returns:
+            Dict: 保存参数
+        """
+        options = dict(SAVE_PROFILES[self.save_profile])
+        if options["garbage"] > 1:
+            skip_dedup = self.skip_for_deadline("保存", f"跳过重复对象合并（garbage={options['garbage']}改为garbage=1）")
+            if not skip_dedup and self.deadline_seconds and self.doc.xref_length() > self.deadline_max_dedup_objects:
+                self.record_degradation("保存", f"文档有 {self.doc.xref_length()} 个对象，跳过重复对象合并（garbage={options['garbage']}改为garbage=1）")
+                skip_dedup = True
+            if skip_dedup:
+                options["garbage"] = 1
+        return options
+    
+    def _write_unchanged_output(self, save_path: str, part_path: str) -> bool:
+        """
+        书签没有变化时的输出：不重新保存PDF，按unchanged_output硬链接或复制原文件到输出路径
+        输出路径就是原文件或已有内容相同的文件时不做任何写入（不改变文件修改时间）
+        
+        Args:
+            save_path: 输出路径
+            part_path: 临时文件路径
+            
+        Returns:
+            bool: 是否成功
+        """
+        if self.source_path and os.path.exists(save_path) and (
+                os.path.samefile(save_path, self.source_path)
+                or filecmp.cmp(save_path, self.source_path, shallow=False)):
+            print(f"  书签未变化，输出文件已与原文件一致: {save_path}")
+            return True
+        
+        if self.unchanged_output == "skip":
+            print("  书签未变化，不写出PDF")
+            return True
+        
+        if self.unchanged_output == "link" and self.source_path:
+            try:
+                os.link(self.source_path, part_path)
+                os.replace(part_path, save_path)
+                print("  书签未变化，已将原文件硬链接到输出路径")
+                return True
+            except OSError as e:
+                # 跨文件系统、文件系统不支持硬链接等情况改为复制
+                print(f"  无法创建硬链接（{e}），改为复制原文件")
+        
+        self._write_source_copy(part_path)
+        os.replace(part_path, save_path)
+        print("  书签未变化，已将原文件复制到输出路径")
+        return True
+    
+    def _save_with_options(self, path: Optional[str], options: Dict) -> Optional[bytes]:
         """
-        保存PDF文件
+        按保存配置完整保存，跳过当前PyMuPDF版本不支持的选项
         
         Args:
-            output_path: 输出路径，如果为None则生成新文件名
+            path: 保存路径，None表示用doc.write()（即doc.tobytes()）写到内存
+            options: doc.save()的参数
             
         Returns:
-            bool: 是否成功
-        """
+            Optional[bytes]: 写到内存时返回PDF内容
+        """
+        writer = self.doc.save if path else self.doc.write
+        writer_args = (path,) if path else ()
+        supported = inspect.signature(writer).parameters
+        unsupported = [name for name in options if name not in supported]
+        if unsupported:
+            print(f"  当前PyMuPDF版本不支持保存选项 {unsupported}，已忽略")
+            options = {name: value for name, value in options.items() if name in supported}
+        
+        if not options.get("linear"):
+            return writer(*writer_args, **options)
         try:
-            if output_path:
-                save_path = output_path
-            else:
-                # 生成新的文件名避免覆盖原文件时的问题
-                base_name = self.pdf_path.rsplit('.', 1)[0]
-                save_path = f"{base_name}_with_bookmarks.pdf"
-            
-            self.doc.save(save_path, garbage=4, deflate=True)
-            return True
+            return writer(*writer_args, **options)
         except Exception as e:
-            print(f"错误：保存PDF失败: {e}")
+            # MuPDF 1.24起不再支持线性化
+            print(f"  线性化保存失败（{e}），改为普通保存")
+            options.pop("linear")
+            return writer(*writer_args, **options)
+    
+    def _save_incremental(self, save_path: str, part_path: str) -> bool:
+        """
+        增量保存：原文件内容原样保留，只在末尾追加新的书签（大纲）对象和交叉引用表
+        输出到原文件时直接追加；输出到其他路径（或从内存打开）时先复制原文件，在副本上写入书签后追加
+        
+        Args:
+            save_path: 输出路径
+            part_path: 临时文件路径
+            
+        Returns:
+            bool: 是否已保存（原文件不支持增量保存时返回False）
+        """
+        if not self.doc.can_save_incrementally():
             return False
+        
+        # 从内存打开的文档不能直接追加，需要先写出原文件内容
+        if self.pdf_stream is None and os.path.abspath(save_path) == os.path.abspath(self.source_path):
+            self.doc.saveIncr()
+            return True
+        
+        self._write_source_copy(part_path)
+        copy_doc = fitz.open(part_path)
+        try:
+            copy_doc.set_toc(self.doc.get_toc(simple=False))
+            copy_doc.saveIncr()
+        finally:
+            copy_doc.close()
+        os.replace(part_path, save_path)
+        return True
     
     def print_debug_info(self, text_blocks: List[Dict], output_file: str = "pdf_debug_info.txt"):
         """
@@ -2898,39 +4888,48 @@ class PDFBookmarkTool:
 
     def detect_document_leftmost_x_coordinate(self, text_blocks: List[Dict]) -> float:
         """
-        检测PDF文件所有内容的最左边x坐标
+        检测PDF文件内容的左边距x坐标
+        使用量化直方图选取有足够支持的最小x，而不是简单取最小值
         
         Args:
             text_blocks: 所有文本块
             
         Returns:
-            float: PDF文件所有内容的最左边x坐标
+            float: PDF文件内容的左边距x坐标
         """
         if not text_blocks:
             print("⚠️ 无法找到文本块，使用默认X坐标")
             return 0
         
-        # 收集所有文本块的x坐标
-        all_x_coords = []
-        
+        estimator = self._create_left_margin_estimator()
         for block in text_blocks:
-            # 获取文本块的x坐标
-            x_coordinate = block.get('position', {}).get('x', 0)
-            if x_coordinate == 0:
-                bbox = block.get('bbox', [0, 0, 0, 0])
-                if len(bbox) >= 4:
-                    x_coordinate = bbox[0]
-            
-            if x_coordinate > 0:
-                all_x_coords.append(x_coordinate)
+            estimator.add_page(block.get('page', 1), [block])
+        
+        return self._report_leftmost_x(estimator)
+    
+    def _create_left_margin_estimator(self) -> LeftMarginEstimator:
+        """创建与当前X坐标容差配置一致的左边距估计器"""
+        return LeftMarginEstimator(window=self.x_coordinate_tolerance,
+                                   min_page_ratio=self.leftmost_x_min_page_ratio,
+                                   max_min_pages=self.leftmost_x_max_min_pages)
+    
+    def _report_leftmost_x(self, estimator: LeftMarginEstimator) -> float:
+        """
+        从估计器中取出左边距并输出说明
         
-        if not all_x_coords:
+        Args:
+            estimator: 已累积数据的左边距估计器
+            
+        Returns:
+            float: 左边距x坐标，无法估计时返回0
+        """
+        leftmost_x = estimator.estimate()
+        if leftmost_x is None:
             print("⚠️ 无法找到有效的x坐标，使用默认值")
             return 0
         
-        # 找到最左边的x坐标
-        leftmost_x = min(all_x_coords)
-        
+        if estimator.min_x is not None and leftmost_x - estimator.min_x > self.x_coordinate_tolerance:
+            print(f"📍 忽略游离文本块的x坐标: {estimator.min_x:.1f}")
         print(f"📍 检测到PDF文件最左边x坐标: {leftmost_x:.1f}")
         print(f"📍 所有标题必须与此坐标对齐（容差: {self.x_coordinate_tolerance}px）")
         
@@ -2982,6 +4981,41 @@ class PDFBookmarkTool:
             print(f"提取书签时发生错误: {str(e)}")
             return []
     
+    def write_outline_outputs(self) -> bool:
+        """
+        把当前文档中的书签（即本次计算出的书签）写到outline_outputs中的各个文件，不重新打开PDF
+        
+        Returns:
+            bool: 是否全部成功
+        """
+        if not self.outline_outputs:
+            return True
+        bookmarks = self.extract_existing_bookmarks()
+        success = True
+        for output_path, format_type in self.outline_outputs:
+            success = self.export_bookmarks(bookmarks, output_path, format_type) and success
+        return success
+    
+    @contextlib.contextmanager
+    def _open_text_output(self, output_path: str, newline: Optional[str] = None):
+        """
+        打开文本输出，"-"表示标准输出（内容写完后一次性以UTF-8写到标准输出）
+        
+        Args:
+            output_path: 输出路径
+            newline: 换行符处理方式，同open()
+        """
+        if output_path != "-":
+            with open(output_path, 'w', newline=newline, encoding='utf-8') as f:
+                yield f
+            return
+        
+        buffer = io.StringIO(newline=newline)
+        yield buffer
+        stdout = sys.__stdout__.buffer
+        stdout.write(buffer.getvalue().encode('utf-8'))
+        stdout.flush()
+    
     def export_bookmarks(self, bookmarks, output_path, format_type='json', include_page_info=True, include_level_info=True):
         """
         导出书签到文件
@@ -3028,12 +5062,12 @@ class PDFBookmarkTool:
             
             export_data.append(item)
         
-        with open(output_path, 'w', encoding='utf-8') as f:
+        with self._open_text_output(output_path) as f:
             json.dump(export_data, f, ensure_ascii=False, indent=2)
     
     def _export_to_txt(self, bookmarks, output_path, include_page_info, include_level_info):
         """导出为文本格式"""
-        with open(output_path, 'w', encoding='utf-8') as f:
+        with self._open_text_output(output_path) as f:
             f.write("PDF书签列表\n")
             f.write("=" * 50 + "\n\n")
             
@@ -3062,7 +5096,7 @@ class PDFBookmarkTool:
         """导出为CSV格式"""
         import csv
         
-        with open(output_path, 'w', newline='', encoding='utf-8') as f:
+        with self._open_text_output(output_path, newline='') as f:
             fieldnames = ['title']
             if include_level_info:
                 fieldnames.append('level')
@@ -3100,93 +5134,952 @@ class PDFBookmarkTool:
         if not self.open_pdf():
             return False
         
+        self.start_deadline()
+        self.reset_partial_results()
         try:
             print(f"开始新的自动书签处理流程: {self.pdf_path}")
             print(f"总页数: {len(self.doc)}")
             
-            # 步骤1: 通过x坐标过滤数据
-            print("步骤1: 通过x坐标过滤数据...")
-            dataList1 = self._filter_by_x_coordinate()
-            print(f"x坐标过滤后得到 {len(dataList1)} 个文本块")
+            # 相同输入和选项的结果已缓存时直接写出
+            if self.load_cached_result("auto"):
+                return self.write_results(output_path)
+            
+            # 复用原有书签：覆盖全文时不做任何提取
+            reused_toc = None
+            if self.reuse_outline:
+                reused_toc = self.prepare_outline_reuse()
+                if reused_toc is not None and not self.restricted_pages:
+                    self.outline_source = "existing_outline"
+                    self.set_proposed_toc(reused_toc)
+                    self.outline_unchanged = True
+                    print(f"最终添加了 {len(reused_toc)} 个书签（复用原有书签）")
+                    return self.write_results(output_path)
+            
+            treeList = None
+            if reused_toc is not None:
+                self.outline_source = "existing_outline+heuristic"
+                treeList = self._merge_existing_outline(reused_toc, self._extract_heading_tree())
+            else:
+                # 依次尝试结构树、目录页链接、印刷目录页文本，找到时跳过全文扫描
+                finders = [
+                    ("struct_tree", self.enable_struct_tree, self.find_headings_from_struct_tree),
+                    ("toc_links", self.enable_toc_links, self.find_headings_from_toc_links),
+                    ("toc_text", self.enable_toc_text, self.find_headings_from_toc_text),
+                ]
+                for source, enabled, finder in finders:
+                    if enabled:
+                        treeList = finder()
+                        if treeList is not None:
+                            self.outline_source = source
+                            break
+            if treeList is None:
+                self.outline_source = "heuristic"
+                treeList = self._extract_heading_tree()
             
-            if not dataList1:
-                print("警告：x坐标过滤后没有找到任何数据")
+            if not treeList:
                 return False
             
-            # 步骤2: 通过font-threshold过滤
-            print("步骤2: 通过font-threshold过滤...")
-            dataList2 = self._filter_by_font_threshold(dataList1)
-            print(f"字体阈值过滤后得到 {len(dataList2)} 个文本块")
+            # 步骤5: 将treeList加为书签
+            self.check_cancelled("添加书签")
+            print("步骤5: 添加书签...")
+            success, bookmark_stats = self._add_tree_bookmarks(treeList)
             
-            if not dataList2:
-                print("警告：字体阈值过滤后没有找到任何数据")
+            if success:
+                if bookmark_stats:
+                    print(f"最终添加了 {bookmark_stats.get('final', 0)} 个书签， 共 {bookmark_stats.get('levels', 0)} 个层级")
+                    print(f"书签来源: {bookmark_stats.get('source')}")
+                    page_budget = bookmark_stats.get('page_budget', {})
+                    if page_budget.get('degraded') or page_budget.get('skipped'):
+                        print(f"超出单页预算的页面: 降级 {page_budget['degraded']}, 跳过 {page_budget['skipped']}")
+                self.print_deadline_summary()
+                self.store_cached_result(bookmark_stats)
+                
+                # 保存文件（以及同时输出的书签文件），预览模式只输出书签
+                if self.write_results(output_path):
+                    return True
+                else:
+                    return False
+            else:
+                print("添加书签失败")
                 return False
+                
+        except ProcessCancelled:
+            raise
+        except Exception as e:
+            print(f"错误：处理PDF时发生异常: {e}")
+            return False
+        finally:
+            self.close_pdf()
+    
+    def _extract_heading_tree(self) -> List[Dict]:
+        """
+        自动书签流程的步骤1-4：从待分析页面提取标题并构建层级树
+        
+        Returns:
+            List[Dict]: 层级树结构列表 (treeList)，没有找到标题时为空列表
+        """
+        # 步骤1: 通过x坐标过滤数据
+        print("步骤1: 通过x坐标过滤数据...")
+        dataList1 = self._filter_by_x_coordinate()
+        print(f"x坐标过滤后得到 {len(dataList1)} 个文本块")
+        
+        if not dataList1:
+            print("警告：x坐标过滤后没有找到任何数据")
+            return []
+        
+        # 步骤2: 通过font-threshold过滤
+        self.check_cancelled("字体阈值过滤")
+        print("步骤2: 通过font-threshold过滤...")
+        dataList2 = self._filter_by_font_threshold(dataList1)
+        print(f"字体阈值过滤后得到 {len(dataList2)} 个文本块")
+        
+        if not dataList2:
+            print("警告：字体阈值过滤后没有找到任何数据")
+            return []
+        
+        # 步骤3: 根据y坐标排序
+        print("步骤3: 根据y坐标排序...")
+        dataList3 = self._sort_by_y_coordinate(dataList2)
+        print(f"y坐标排序完成，共 {len(dataList3)} 个文本块")
+        self.partial_results["candidates"] = dataList3
+        
+        # 步骤4: 根据字体大小构建层级树结构
+        self.check_cancelled("构建层级树")
+        print("步骤4: 根据字体大小构建层级树结构...")
+        treeList = self._build_hierarchy_tree(dataList3)
+        print(f"构建层级树完成，共 {len(treeList)} 个节点")
+        
+        if not treeList:
+            print("警告：构建层级树后没有找到任何节点")
+            return []
+        
+        return treeList
+    
+    def get_uncovered_page_ranges(self, toc: List) -> List[Tuple[int, int]]:
+        """
+        计算没有被书签覆盖的页面范围：连续outline_gap_pages页以上没有任何书签指向的页面
+        
+        Args:
+            toc: 书签列表 [[层级, 标题, 页码, ...], ...]（页码1基，无效目标为-1）
+            
+        Returns:
+            List[Tuple[int, int]]: 未覆盖的页面范围 [(起始页, 结束页), ...]（0基，闭区间）
+        """
+        page_count = len(self.doc)
+        targets = sorted(set(item[2] - 1 for item in toc if 1 <= item[2] <= page_count))
+        ranges = []
+        previous = -1
+        for target in targets + [page_count]:
+            if target - previous - 1 >= self.outline_gap_pages:
+                ranges.append((previous + 1, target - 1))
+            previous = target
+        return ranges
+    
+    def prepare_outline_reuse(self) -> Optional[List]:
+        """
+        读取并检查PDF原有书签，把之后的分析限制在未覆盖的页面
+        
+        Returns:
+            Optional[List]: 可复用的原有书签（get_toc(simple=False)格式），没有或无效时返回None
+        """
+        existing_toc = self.doc.get_toc(simple=False)
+        if not existing_toc:
+            print("PDF中没有原有书签，分析全部页面")
+            return None
+        if not self.validate_toc_structure(existing_toc):
+            print("原有书签结构无效，分析全部页面")
+            return None
+        
+        uncovered = self.get_uncovered_page_ranges(existing_toc)
+        self.restricted_pages = set()
+        for start, end in uncovered:
+            self.restricted_pages.update(range(start, end + 1))
+        
+        if not uncovered:
+            print(f"原有书签（{len(existing_toc)} 个）覆盖全文，跳过提取")
+        else:
+            ranges_text = ",".join(f"{start + 1}-{end + 1}" for start, end in uncovered)
+            print(f"原有书签 {len(existing_toc)} 个，只分析未覆盖的 {len(self.restricted_pages)} 页: {ranges_text}")
+        return existing_toc
+    
+    def _merge_existing_outline(self, existing_toc: List, tree_list: List[Dict]) -> List[Dict]:
+        """
+        把从未覆盖页面提取的层级树插入原有书签：原有书签保持原来的顺序，每个新标题插在
+        第一个目标页码大于它的原有书签之前（没有时放在末尾），无效目标（-1）的原有书签不参与比较
+        
+        Args:
+            existing_toc: 原有书签（get_toc(simple=False)格式）
+            tree_list: 从未覆盖页面提取的层级树结构列表
+            
+        Returns:
+            List[Dict]: 合并后的层级树结构列表
+        """
+        existing_nodes = []
+        for level, title, page, *rest in existing_toc:
+            existing_nodes.append({
+                'title': title,
+                'level': level,
+                'page': page,
+                'source_page': page,
+                'target_page': page,
+                'dest': rest[0] if rest else None,
+                'from_outline': True,
+            })
+        
+        # 按插入位置（原有书签的下标）分组，同一位置的新标题保持提取顺序
+        inserted = {}
+        for node in tree_list:
+            position = len(existing_nodes)
+            for index, existing in enumerate(existing_nodes):
+                if existing['target_page'] >= 1 and existing['target_page'] > node['target_page']:
+                    position = index
+                    break
+            inserted.setdefault(position, []).append(node)
+        
+        merged = []
+        for index, existing in enumerate(existing_nodes):
+            merged.extend(inserted.get(index, []))
+            merged.append(existing)
+        merged.extend(inserted.get(len(existing_nodes), []))
+        print(f"合并原有书签 {len(existing_toc)} 个和新提取的标题 {len(tree_list)} 个")
+        return merged
+    
+    def find_headings_from_struct_tree(self) -> Optional[List[Dict]]:
+        """
+        从带标签PDF的结构树（StructTreeRoot）生成书签：按文档顺序遍历结构元素，
+        H1..H6（以及经RoleMap映射到它们的自定义角色）直接给出层级，标题文本取自ActualText
+        或对应的标记内容（MCID），再在所在页上核对标题
+        
+        Returns:
+            Optional[List[Dict]]: 层级树结构列表（格式同_build_hierarchy_tree），没有结构树或其中没有标题时返回None
+        """
+        print("查找结构树...")
+        root_xref = self._get_xref_value(self.doc.pdf_catalog(), "StructTreeRoot")
+        if not root_xref:
+            print("  PDF没有结构树")
+            return None
+        
+        role_map = {}
+        role_type, role_value = self.doc.xref_get_key(root_xref, "RoleMap")
+        if role_type == "xref":
+            role_type, role_value = "dict", self.doc.xref_object(int(role_value.split()[0]), compressed=True)
+        if role_type == "dict":
+            role_map = dict(re.findall(r'/([^\s/<>\[\]()]+)\s*/([^\s/<>\[\]()]+)', role_value))
+        
+        page_numbers = {self.doc.page_xref(page_num): page_num for page_num in range(len(self.doc))}
+        headings = []
+        visited = set()
+        # 深度优先、按文档顺序遍历：(元素xref, 继承的页码, 外层分节元素的数量)
+        stack = [(kid, None, 0) for kid in reversed(self._get_struct_kids(root_xref))]
+        while stack:
+            item, page_num, section_depth = stack.pop()
+            if not isinstance(item, int) or item in visited:
+                continue
+            visited.add(item)
+            self.check_cancelled("读取结构树")
             
-            # 步骤3: 根据y坐标排序
-            print("步骤3: 根据y坐标排序...")
-            dataList3 = self._sort_by_y_coordinate(dataList2)
-            print(f"y坐标排序完成，共 {len(dataList3)} 个文本块")
+            role = self._get_name_value(item, "S")
+            if role is None:
+                continue
+            role = role_map.get(role, role)
+            page_ref = self._get_xref_value(item, "Pg")
+            if page_ref in page_numbers:
+                page_num = page_numbers[page_ref]
+            
+            if role in STRUCT_HEADING_ROLES:
+                heading = self._read_struct_heading(item, page_num, page_numbers)
+                if heading:
+                    level = STRUCT_HEADING_ROLES[role] or max(section_depth, 1)
+                    headings.append(dict(heading, level=level))
+                continue
             
-            # 步骤4: 根据字体大小构建层级树结构
-            print("步骤4: 根据字体大小构建层级树结构...")
-            treeList = self._build_hierarchy_tree(dataList3)
-            print(f"构建层级树完成，共 {len(treeList)} 个节点")
+            child_depth = section_depth + (1 if role in STRUCT_SECTION_ROLES else 0)
+            stack.extend((kid, page_num, child_depth) for kid in reversed(self._get_struct_kids(item)))
+        
+        if not headings:
+            print("  结构树中没有标题元素")
+            return None
+        
+        # 读取标记内容中的标题文本（按页缓存，每页只解析一次内容流）
+        reader = MarkedContentReader(self.doc)
+        marked_text = {}
+        entries = []
+        for heading in headings:
+            title = heading['title']
+            if not title and heading['marked_content']:
+                parts = []
+                for mcid_page, mcid in heading['marked_content']:
+                    if mcid_page not in marked_text:
+                        self.check_cancelled("读取标记内容", mcid_page + 1)
+                        marked_text[mcid_page] = reader.read_page(mcid_page)
+                    parts.append(marked_text[mcid_page].get(mcid, ""))
+                title = re.sub(r'\s+', ' ', "".join(parts)).strip()
+            if title and heading['page'] is not None:
+                entries.append({
+                    'title': title,
+                    'candidates': [title],
+                    'level': heading['level'],
+                    'target_page': heading['page'],
+                })
+        
+        print(f"  结构树中有 {len(headings)} 个标题元素，读取到 {len(entries)} 个标题文本")
+        if len(entries) < self.toc_min_verified * len(headings):
+            print("  读取到文本的标题比例过低，不采用")
+            return None
+        return self._build_tree_from_toc_entries(entries, "结构树")
+    
+    def _get_xref_value(self, xref: int, key: str) -> Optional[int]:
+        """读取PDF对象中引用类型的键值，返回被引用对象的xref，不是引用时返回None"""
+        value_type, value = self.doc.xref_get_key(xref, key)
+        if value_type == "xref":
+            return int(value.split()[0])
+        return None
+    
+    def _get_name_value(self, xref: int, key: str) -> Optional[str]:
+        """读取PDF对象中名称类型的键值（不带"/"），不是名称时返回None"""
+        value_type, value = self.doc.xref_get_key(xref, key)
+        if value_type == "name":
+            return value.lstrip("/")
+        return None
+    
+    def _get_struct_kids(self, xref: int) -> List:
+        """
+        读取结构元素的子节点（K）
+        
+        Args:
+            xref: 结构元素的xref
             
-            if not treeList:
-                print("警告：构建层级树后没有找到任何节点")
-                return False
+        Returns:
+            List: 子节点列表，每项为结构元素或MCR对象的xref（int）、
+                  标记内容编号（'mcid', MCID, 页面xref或None）
+        """
+        value_type, value = self.doc.xref_get_key(xref, "K")
+        if value_type == "xref":
+            return [int(value.split()[0])]
+        if value_type == "int":
+            return [("mcid", int(value), None)]
+        if value_type not in ("array", "dict"):
+            return []
+        
+        kids = []
+        for inline, ref, mcid in re.findall(r'(<<.*?>>)|(\d+)\s+\d+\s+R|(\d+)', value):
+            if inline:
+                # 内联的标记内容引用（MCR），对象引用（OBJR）不含文本，忽略
+                mcid_match = re.search(r'/MCID\s+(\d+)', inline)
+                page_match = re.search(r'/Pg\s+(\d+)\s+\d+\s+R', inline)
+                if mcid_match:
+                    kids.append(("mcid", int(mcid_match.group(1)), int(page_match.group(1)) if page_match else None))
+            elif ref:
+                kids.append(int(ref))
+            else:
+                kids.append(("mcid", int(mcid), None))
+        return kids
+    
+    def _read_struct_heading(self, xref: int, page_num: Optional[int], page_numbers: Dict) -> Optional[Dict]:
+        """
+        读取标题元素：ActualText（或Alt、T）作为标题文本，否则收集其下所有标记内容的(页码, MCID)
+        
+        Args:
+            xref: 标题元素的xref
+            page_num: 继承的页码（0基）
+            page_numbers: 页面xref -> 页码（0基）
             
-            # 步骤5: 将treeList加为书签
-            print("步骤5: 添加书签...")
-            success, bookmark_stats = self._add_tree_bookmarks(treeList)
+        Returns:
+            Optional[Dict]: {'title', 'page', 'marked_content'}，无法确定所在页时返回None
+        """
+        title = ""
+        for key in ("ActualText", "Alt", "T"):
+            value_type, value = self.doc.xref_get_key(xref, key)
+            if value_type == "string" and value.strip():
+                title = re.sub(r'\s+', ' ', value).strip()
+                break
+        
+        marked_content = []
+        visited = set()
+        stack = [(kid, page_num) for kid in reversed(self._get_struct_kids(xref))]
+        while stack:
+            kid, kid_page = stack.pop()
+            if isinstance(kid, tuple):
+                _, mcid, page_ref = kid
+                mcid_page = page_numbers.get(page_ref, kid_page)
+                if mcid_page is not None:
+                    marked_content.append((mcid_page, mcid))
+                continue
+            if kid in visited:
+                continue
+            visited.add(kid)
+            page_ref = self._get_xref_value(kid, "Pg")
+            kid_page = page_numbers.get(page_ref, kid_page)
+            if self._get_name_value(kid, "Type") == "MCR":
+                value_type, value = self.doc.xref_get_key(kid, "MCID")
+                if value_type == "int" and kid_page is not None:
+                    marked_content.append((kid_page, int(value)))
+                continue
+            stack.extend((child, kid_page) for child in reversed(self._get_struct_kids(kid)))
+        
+        page = marked_content[0][0] if marked_content else page_num
+        if page is None:
+            return None
+        return {'title': title, 'page': page, 'marked_content': marked_content}
+    
+    def find_headings_from_toc_links(self) -> Optional[List[Dict]]:
+        """
+        从印刷目录页上的内部链接生成书签：链接文字是标题，链接目标是标题所在页，
+        层级取自条目的缩进，只在目标页上核对标题
+        
+        Returns:
+            Optional[List[Dict]]: 层级树结构列表（格式同_build_hierarchy_tree），没有可用的目录页链接时返回None
+        """
+        print("查找目录页链接...")
+        named_destinations = None
+        entries = []
+        toc_pages = []
+        for page_num in range(min(self.toc_scan_pages, len(self.doc))):
+            self.check_cancelled("查找目录页链接", page_num + 1)
+            links = []
+            for link in self.doc[page_num].get_links():
+                target_page = link.get('page', -1) if link.get('kind') == fitz.LINK_GOTO else -1
+                name = link.get('nameddest') or link.get('name')
+                if target_page < 0 and name and link.get('kind') in (fitz.LINK_GOTO, fitz.LINK_NAMED):
+                    # 命名目标（如Word的_Toc...书签）：解析文档的目标名称表
+                    if named_destinations is None:
+                        named_destinations = self._resolve_named_destinations()
+                    target_page = named_destinations.get(name, {}).get('page', -1)
+                if 0 <= target_page < len(self.doc) and target_page != page_num:
+                    links.append((fitz.Rect(link['from']), target_page))
+            
+            page_entries = []
+            if len(links) >= self.toc_link_min_links:
+                page_entries = self._read_toc_link_entries(page_num, links)
+                if not self._is_toc_link_page(page_entries):
+                    print(f"  第 {page_num + 1} 页的链接不像目录条目（没有页码或目标页不递增），跳过")
+                    page_entries = []
+            if page_entries:
+                toc_pages.append(page_num)
+                seen = set((entry['title'], entry['target_page']) for entry in entries)
+                for entry in page_entries:
+                    # 同一条目可能有多个链接（如标题和页码分别链接到不同行），只保留一个
+                    if (entry['title'], entry['target_page']) not in seen:
+                        seen.add((entry['title'], entry['target_page']))
+                        entries.append(entry)
+            elif toc_pages:
+                # 目录页是连续的，目录结束后不再查找
+                break
+        
+        if not entries:
+            print("  没有找到目录页链接")
+            return None
+        print(f"  目录页: {', '.join(str(page_num + 1) for page_num in toc_pages)}，共 {len(entries)} 个链接条目")
+        
+        self._assign_indent_levels(entries)
+        return self._build_tree_from_toc_entries(entries, "目录页链接")
+    
+    def _is_toc_link_page(self, entries: List[Dict]) -> bool:
+        """
+        判断一页的链接条目是否像目录：大多数行带引导符或行尾页码，目标页按阅读顺序递增，
+        且指向足够多的不同页面（正文中的引用链接没有页码，且都指向参考文献页）
+        
+        Args:
+            entries: 该页的链接条目列表（按阅读顺序）
+            
+        Returns:
+            bool: 是否视为目录页
+        """
+        if not entries:
+            return False
+        targets = [entry['target_page'] for entry in entries]
+        if len(set(targets)) < self.toc_link_min_links:
+            return False
+        with_page_number = sum(1 for entry in entries if entry['has_page_number'])
+        if with_page_number < self.toc_link_min_entry_ratio * len(entries):
+            return False
+        increasing = sum(1 for previous, target in zip(targets, targets[1:]) if target >= previous)
+        return increasing >= self.toc_link_min_entry_ratio * (len(targets) - 1)
+    
+    def _build_tree_from_toc_entries(self, entries: List[Dict], source_name: str) -> Optional[List[Dict]]:
+        """
+        只在目标页上核对目录条目的标题，核对通过的比例足够时生成层级树
+        
+        Args:
+            entries: 目录条目列表，包含候选标题candidates、层级level和目标页target_page（0基）
+            source_name: 来源名称（用于日志）
+            
+        Returns:
+            Optional[List[Dict]]: 层级树结构列表（格式同_build_hierarchy_tree），核对未通过时返回None
+        """
+        verified = 0
+        for entry in entries:
+            self.check_cancelled(f"核对{source_name}", entry['target_page'] + 1)
+            page_text = self.get_page_text(entry['target_page'])
+            for title in entry['candidates']:
+                rects = page_text.search_for(title)
+                if rects:
+                    entry['title'] = title
+                    entry['x_coordinate'] = rects[0].x0
+                    entry['y_coordinate'] = rects[0].y0
+                    entry['verified'] = True
+                    verified += 1
+                    break
+        self.release_page_text()
+        
+        ratio = verified / len(entries)
+        print(f"  目标页核对: {verified}/{len(entries)} 个标题找到")
+        if ratio < self.toc_min_verified:
+            print("  核对通过的比例过低，不采用")
+            return None
+        
+        tree_list = []
+        for entry in entries:
+            if not entry.get('verified'):
+                print(f"  警告：标题 '{entry['title'][:30]}' 未在第 {entry['target_page'] + 1} 页找到，仍按目录添加")
+            tree_list.append({
+                'title': entry['title'],
+                'level': entry['level'],
+                'page': entry['target_page'] + 1,
+                'source_page': entry['target_page'] + 1,
+                'target_page': entry['target_page'] + 1,
+                'font_size': 0,
+                'x_coordinate': entry.get('x_coordinate', 0),
+                'y_coordinate': entry.get('y_coordinate', 0),
+                'number_sequence': self.extract_number_sequence(entry['title']),
+            })
+        print(f"从{source_name}生成 {len(tree_list)} 个书签，跳过全文分析")
+        return tree_list
+    
+    def find_headings_from_toc_text(self) -> Optional[List[Dict]]:
+        """
+        解析印刷目录页的文本（“标题 ........ 页码”）生成书签：按右对齐页码和引导符的密度识别目录页，
+        印刷页码通过页面标签或页码偏移换算为物理页，只在目标页上核对标题
+        
+        Returns:
+            Optional[List[Dict]]: 层级树结构列表（格式同_build_hierarchy_tree），没有可用的目录页时返回None
+        """
+        print("查找印刷目录页...")
+        entries = []
+        toc_pages = []
+        for page_num in range(min(self.toc_scan_pages, len(self.doc))):
+            self.check_cancelled("查找印刷目录页", page_num + 1)
+            page_entries = self._read_toc_text_entries(page_num)
+            if page_entries:
+                toc_pages.append(page_num)
+                entries.extend(page_entries)
+            elif toc_pages:
+                # 目录页是连续的，目录结束后不再查找
+                break
+        self.release_page_text()
+        
+        if not entries:
+            print("  没有找到印刷目录页")
+            return None
+        print(f"  目录页: {', '.join(str(page_num + 1) for page_num in toc_pages)}，共 {len(entries)} 个目录行")
+        
+        if not self._map_printed_pages(entries, toc_pages[-1]):
+            print("  无法把印刷页码换算为物理页码")
+            return None
+        entries = [entry for entry in entries if entry.get('target_page') is not None]
+        
+        self._assign_indent_levels(entries)
+        return self._build_tree_from_toc_entries(entries, "印刷目录页")
+    
+    def _read_toc_text_entries(self, page_num: int) -> List[Dict]:
+        """
+        读取一页中的目录行（标题后跟引导符或空白和右对齐的页码），目录行数量或密度不足时视为非目录页
+        
+        Args:
+            page_num: 页码（0基）
+            
+        Returns:
+            List[Dict]: 条目列表，包含候选标题candidates、缩进indent和印刷页码printed_page，非目录页返回空列表
+        """
+        # 按基线把单词分成视觉行（标题、引导符和页码常常是不同的文本块）
+        rows = []
+        for word in sorted(self.get_page_text(page_num).get_words(), key=lambda w: w[3]):
+            if rows and word[3] - rows[-1][-1][3] <= self.toc_indent_tolerance / 2:
+                rows[-1].append(word)
+            else:
+                rows.append([word])
+        
+        # 多栏目录的同一视觉行上有多个条目：在页码之后断开
+        lines = []
+        for row in rows:
+            row.sort(key=lambda w: w[0])
+            lines.append([])
+            for word in row:
+                if lines[-1] and self._match_toc_line(lines[-1]):
+                    lines.append([])
+                lines[-1].append(word)
+        
+        matches = []
+        for line_words in lines:
+            match = self._match_toc_line(line_words)
+            if match:
+                matches.append((match, line_words))
+        if len(matches) < self.toc_text_min_entries or len(matches) < self.toc_text_min_density * len(lines):
+            return []
+        
+        # 水平范围相互重叠的条目属于同一栏，右对齐在栏内计算，缩进换算到第一栏的位置
+        columns = []
+        for match, line_words in sorted(matches, key=lambda item: item[1][0][0]):
+            left, right = line_words[0][0], line_words[-1][2]
+            if columns and left < columns[-1]['right']:
+                columns[-1]['right'] = max(columns[-1]['right'], right)
+                columns[-1]['matches'].append((match, line_words))
+            else:
+                columns.append({'left': left, 'right': right, 'matches': [(match, line_words)]})
+        
+        entries = []
+        for column in columns:
+            # 目录页码右对齐：只保留页码右端与栏内最右侧页码对齐的行
+            for match, line_words in sorted(column['matches'], key=lambda item: item[1][0][1]):
+                if column['right'] - line_words[-1][2] > self.toc_indent_tolerance * 3:
+                    continue
+                title = match.group(1).strip()
+                entries.append({
+                    'title': title,
+                    'candidates': [title],
+                    'indent': line_words[0][0] - column['left'] + columns[0]['left'],
+                    'printed_page': match.group(3),
+                    'toc_page': page_num,
+                })
+        return entries if len(entries) >= self.toc_text_min_entries else []
+    
+    def _match_toc_line(self, line_words: List[Tuple]) -> Optional[re.Match]:
+        """
+        判断一组单词（按x排序）是否构成目录行：标题后跟引导符和页码，或者跟一个与标题有明显间隔的单独页码
+        （"Chapter 1"、"Part II"等以数字结尾的标题不算）
+        
+        Args:
+            line_words: get_words返回的单词列表
+            
+        Returns:
+            Optional[re.Match]: TOC_LINE_PATTERN的匹配结果（标题、引导符、页码三组），不是目录行时返回None
+        """
+        match = re.match(TOC_LINE_PATTERN, " ".join(w[4] for w in line_words).strip())
+        if not match or match.group(2).strip():
+            return match
+        if len(line_words) < 2 or line_words[-1][4] != match.group(3):
+            return None
+        return match if line_words[-1][0] - line_words[-2][2] > self.toc_indent_tolerance * 3 else None
+    
+    def _map_printed_pages(self, entries: List[Dict], last_toc_page: int) -> bool:
+        """
+        把目录条目的印刷页码换算为物理页码（写入target_page，无法换算的为None）
+        有页面标签时按标签查找；否则在几个条目上试探偏移量（物理页 = 印刷页 - 1 + 偏移），取票数最多的偏移
+        
+        Args:
+            entries: 目录条目列表
+            last_toc_page: 最后一个目录页的页码（0基），目标页必须在它之后
+            
+        Returns:
+            bool: 是否至少有一个条目换算成功
+        """
+        if self.doc.get_page_labels():
+            # 从目录之后逐页读取标签，所有印刷页码都找到后停止
+            wanted = set(entry['printed_page'] for entry in entries)
+            label_pages = {}
+            for page_num in range(last_toc_page + 1, len(self.doc)):
+                label = self.doc[page_num].get_label()
+                if label in wanted:
+                    label_pages.setdefault(label, page_num)
+                    if len(label_pages) == len(wanted):
+                        break
+            for entry in entries:
+                entry['target_page'] = label_pages.get(entry['printed_page'])
+            print("  按页面标签换算印刷页码")
+            return any(entry['target_page'] is not None for entry in entries)
+        
+        numbered = [entry for entry in entries if entry['printed_page'].isdigit()]
+        if not numbered:
+            return False
+        
+        # 在均匀分布的3个条目上试探偏移量
+        probes = [numbered[i * (len(numbered) - 1) // 2] for i in range(3)] if len(numbered) >= 3 else numbered
+        votes = {}
+        for entry in probes:
+            printed = int(entry['printed_page'])
+            for offset in range(self.toc_page_offset_limit + 1):
+                page_num = printed - 1 + offset
+                if page_num <= last_toc_page:
+                    continue
+                if page_num >= len(self.doc):
+                    break
+                self.check_cancelled("估计页码偏移", page_num + 1)
+                if self.get_page_text(page_num).search_for(entry['title']):
+                    votes[offset] = votes.get(offset, 0) + 1
+                    break
+        self.release_page_text()
+        if not votes:
+            return False
+        
+        offset = max(votes, key=votes.get)
+        print(f"  印刷页码偏移: {offset}")
+        for entry in entries:
+            page_num = int(entry['printed_page']) - 1 + offset if entry['printed_page'].isdigit() else -1
+            entry['target_page'] = page_num if last_toc_page < page_num < len(self.doc) else None
+        return True
+    
+    def _resolve_named_destinations(self) -> Dict:
+        """
+        解析文档的命名目标表
+        
+        Returns:
+            Dict: 目标名称 -> {'page': 页码(0基), ...}，旧版PyMuPDF或解析失败时为空字典
+        """
+        try:
+            return self.doc.resolve_names()
+        except Exception as e:
+            print(f"  警告：无法解析命名目标: {e}")
+            return {}
+    
+    def _read_toc_link_entries(self, page_num: int, links: List[Tuple]) -> List[Dict]:
+        """
+        读取目录页上各链接区域内的文字，同一行指向同一页的多个链接（标题和页码分别链接）合并为一个条目
+        
+        Args:
+            page_num: 目录页页码（0基）
+            links: [(链接区域, 目标页码(0基)), ...]
             
-            if success:
-                if bookmark_stats:
-                    print(f"最终添加了 {bookmark_stats.get('final', 0)} 个书签， 共 {bookmark_stats.get('levels', 0)} 个层级")
-                
-                # 保存文件
-                if self.save_pdf(output_path):
-                    return True
-                else:
-                    return False
+        Returns:
+            List[Dict]: 条目列表，包含候选标题candidates、缩进indent、目标页target_page和该行是否带页码has_page_number
+        """
+        words = self.get_page_text(page_num).get_words()
+        lines = []  # [(行的y坐标, 目标页, 单词列表)]
+        for rect, target_page in sorted(links, key=lambda item: (item[0].y0, item[0].x0)):
+            rect_words = [w for w in words
+                          if rect.x0 <= (w[0] + w[2]) / 2 <= rect.x1 and rect.y0 <= (w[1] + w[3]) / 2 <= rect.y1]
+            if not rect_words:
+                continue
+            line_y = min(w[1] for w in rect_words)
+            for line in lines:
+                if line[1] == target_page and abs(line[0] - line_y) <= self.toc_indent_tolerance:
+                    line[2].extend(w for w in rect_words if w not in line[2])
+                    break
             else:
-                print("添加书签失败")
-                return False
-                
-        except Exception as e:
-            print(f"错误：处理PDF时发生异常: {e}")
-            return False
-        finally:
-            self.close_pdf()
+                lines.append((line_y, target_page, list(rect_words)))
+        
+        # 只链接了标题时，引导符和页码在链接区域之外：把同一视觉行上不属于其他链接的单词也算进来
+        owners = {}
+        for index, (_, _, line_words) in enumerate(lines):
+            for w in line_words:
+                owners.setdefault(w, index)
+        
+        entries = []
+        for index, (line_y, target_page, line_words) in enumerate(lines):
+            line_top = min(w[1] for w in line_words)
+            line_bottom = max(w[3] for w in line_words)
+            row = sorted((w for w in words if line_top <= (w[1] + w[3]) / 2 <= line_bottom), key=lambda w: w[0])
+            positions = [i for i, w in enumerate(row) if owners.get(w) == index]
+            if not positions:
+                continue
+            first, last = positions[0], positions[-1]
+            while first > 0 and owners.get(row[first - 1], index) == index:
+                first -= 1
+            while last < len(row) - 1 and owners.get(row[last + 1], index) == index:
+                last += 1
+            row = row[first:last + 1]
+            text = " ".join(w[4] for w in row).strip()
+            
+            # 引导符之后是页码，直接去掉；没有引导符时只有与前一个单词间距较大的行尾数字才视为页码，
+            # 这样"Chapter 1"、"Part II"等以数字结尾的标题保持完整
+            title = re.sub(TOC_LEADER_PATTERN + r'.*$', '', text).strip()
+            has_leader = title != text
+            has_page_number = has_leader
+            if not has_leader and self._match_toc_line(row):
+                has_page_number = True
+                title = " ".join(w[4] for w in row[:-1]).strip()
+            # 先用原文核对，再用去掉页码的标题；未核对到时使用去掉页码的标题
+            candidates = [c for c in dict.fromkeys([text if not has_leader else title, title]) if c]
+            if not candidates:
+                continue
+            entries.append({
+                'title': title or candidates[0],
+                'candidates': candidates,
+                'indent': row[0][0],
+                'target_page': target_page,
+                'toc_page': page_num,
+                'has_page_number': has_page_number,
+            })
+        return entries
+    
+    def _assign_indent_levels(self, entries: List[Dict]):
+        """
+        按缩进为目录条目分配层级：缩进聚类后从左到右依次为1、2、3...层（最多6层），
+        所有条目缩进相同时按标题的数字序列确定层级
+        
+        Args:
+            entries: 目录条目列表，会直接写入level
+        """
+        indents = []
+        for indent in sorted(entry['indent'] for entry in entries):
+            if not indents or indent - indents[-1] > self.toc_indent_tolerance:
+                indents.append(indent)
+        
+        for entry in entries:
+            if len(indents) > 1:
+                level = sum(1 for indent in indents if indent <= entry['indent'] + self.toc_indent_tolerance)
+            else:
+                level = len(self.extract_number_sequence(entry['title'])) or 1
+            entry['level'] = min(level, 6)
     
     def _filter_by_x_coordinate(self) -> List[Dict]:
         """
         步骤1: 通过x坐标过滤出所有符合逻辑的数据
+        只遍历一次文档：逐页累积左边距直方图和页眉页脚特征，
+        同时只缓存通过文本检查的候选块，最后再对候选块做对齐判断
         
         Returns:
             List[Dict]: 过滤后的文本块列表 (dataList1)
         """
-        print("  提取所有页面的文本块...")
-        all_text_blocks = []
-        
-        # 提取所有页面的文本
-        for page_num in range(len(self.doc)):
-            page_text_blocks = self.extract_text_with_font_info(page_num)
-            all_text_blocks.extend(page_text_blocks)
-        
-        print(f"  总共提取了 {len(all_text_blocks)} 个文本块")
-        
-        # 检测PDF文件所有内容的最左边x坐标
-        self.document_leftmost_x = self.detect_document_leftmost_x_coordinate(all_text_blocks)
-        print(f"  检测到的PDF最左边x坐标: {self.document_leftmost_x}")
+        pages = self.get_analysis_pages()
+        if len(pages) < len(self.doc):
+            print(f"  分析 {len(pages)}/{len(self.doc)} 页")
+        
+        estimator = self._create_left_margin_estimator()
+        furniture_pages = {}  # 页眉页脚特征键 -> 出现的页码集合（0基）
+        furniture_keys = {}
+        body_line_heights = {}  # 正文行高 -> 文本长度
+        analyzed_pages = []  # 实际分析过的页码，页眉页脚的出现密度只在这些页面上计算
+        candidates = []  # (文本块, 页眉页脚特征键, 预先计算的上下文)
+        self.partial_results["candidates"] = candidates
+        total_blocks = 0
+        
+        # 抽样模式：先从抽样页面估计左边距和页眉页脚，全量遍历时只做廉价的候选检查
+        sample_runs = self._select_sample_pages(pages)
+        sampled_pages = [page_num for run in sample_runs for page_num in run]
+        if sampled_pages:
+            print(f"  抽样模式: 从 {len(sampled_pages)} 页估计版式...")
+            for ordinal, page_num in enumerate(sampled_pages):
+                self.check_cancelled("版式抽样", page_num + 1)
+                for block in self.extract_text_blocks_fast(page_num):
+                    key = self._furniture_key(block) if self.enable_furniture_filter else None
+                    if key is None:
+                        estimator.add(ordinal, block['bbox'][0])
+                        self._add_body_line_height(body_line_heights, block)
+                    else:
+                        furniture_pages.setdefault(key, set()).add(page_num)
+                self.release_page_block_index(page_num)
+            self.release_page_text()
+            self.body_line_height = self._select_body_line_height(body_line_heights)
+            # 页眉页脚的出现密度在每组抽样的连续页内按真实页码计算
+            furniture_keys = self._select_furniture_keys(furniture_pages, sampled_pages, sample_runs)
+            self.document_leftmost_x = self._report_leftmost_x(estimator)
+            print(f"  抽样估计的PDF最左边x坐标: {self.document_leftmost_x}")
+        
+        # 按页指纹复用：抽样模式下候选检查依赖抽样估计的版式，不复用
+        page_store_dir = self._get_page_store_dir() if self.reuse_page_results and self.cache_dir and not sampled_pages else None
+        two_tier_pages = full_fallback_pages = 0  # 两级提取的页数、其中改为整页提取的页数
+        prefer_full_extraction = False
+        fresh_pages = {}  # 本次重新提取的页码(0基) -> (候选起始序号, 候选结束序号, 页眉页脚特征键, 左边距x坐标, 正文行高, 指纹)
+        reused_pages = 0
+        
+        print("  逐页提取文本块并收集候选标题...")
+        self.begin_memory_windows()
+        # 页眉页脚只在已分析的页面上统计出现密度（跳过页面或截止时间抽样时密度不被稀释）
+        try:
+            for page_num in self.iter_pages_within_deadline(pages, "页面分析"):
+                analyzed_pages.append(page_num)
+                page_first_candidate = len(candidates)
+                fingerprint = self.get_page_fingerprint(page_num) if page_store_dir else None
+                record = self.load_page_record(page_store_dir, fingerprint) if page_store_dir else None
+                if record is not None:
+                    self._restore_page_record(record, page_num, candidates, furniture_pages, body_line_heights, estimator)
+                    reused_pages += 1
+                elif sampled_pages:
+                    page_text_blocks = self.extract_text_blocks_fast(page_num)
+                    total_blocks += len(page_text_blocks)
+                    for block in page_text_blocks:
+                        if (self._matches_layout_profile(block, furniture_keys)
+                                and self._is_candidate_text(block.get('text', '').strip())):
+                            candidates.append((block, None, None))
+                elif self.enable_two_tier_extraction and not prefer_full_extraction:
+                    page_text_blocks = self.extract_text_blocks_fast(page_num)
+                    for block in page_text_blocks:
+                        block['is_candidate'] = self._is_candidate_text(block.get('text', '').strip())
+                    two_tier_pages += 1
+                    if self._candidate_area_ratio(page_text_blocks) > self.two_tier_max_clip_ratio:
+                        page_text_blocks = self.extract_candidate_text_blocks(page_num)
+                        full_fallback_pages += 1
+                    # 前若干页大多需要整页提取时（标题密集的文档），其余页面不再先做blocks粗筛
+                    prefer_full_extraction = two_tier_pages >= 10 and full_fallback_pages * 2 > two_tier_pages
+                else:
+                    page_text_blocks = self.extract_candidate_text_blocks(page_num)
+                
+                if not sampled_pages and record is None:
+                    total_blocks += len(page_text_blocks)
+                    first_candidate = len(candidates)
+                    body_blocks = []
+                    page_furniture_keys = []
+                    page_line_heights = {}
+                    for block in page_text_blocks:
+                        key = self._furniture_key(block) if self.enable_furniture_filter else None
+                        if key is None:
+                            body_blocks.append(block)
+                            self._add_body_line_height(page_line_heights, block)
+                        else:
+                            furniture_pages.setdefault(key, set()).add(page_num)
+                            page_furniture_keys.append(key)
+                        
+                        if block.get('is_candidate'):
+                            candidates.append((block, key, None))
+                    
+                    # 页眉页脚区域的文本不参与左边距和正文行高估计
+                    estimator.add_page(page_num, body_blocks)
+                    for line_height, length in page_line_heights.items():
+                        body_line_heights[line_height] = body_line_heights.get(line_height, 0) + length
+                    if page_store_dir:
+                        body_x = [block.get('position', {}).get('x', 0) or block.get('bbox', [0])[0] for block in body_blocks]
+                        fresh_pages[page_num] = (first_candidate, len(candidates), page_furniture_keys, body_x,
+                                                 page_line_heights, fingerprint)
+                
+                # 释放本页的空间索引前先为本页的候选块计算上下文
+                if self.enable_context_filter:
+                    for i in range(page_first_candidate, len(candidates)):
+                        block, key, context = candidates[i]
+                        if context is None:
+                            candidates[i] = (block, key, self.build_block_context(block))
+                self.release_page_block_index(page_num)
+                if self.memory_window_due(page_num):
+                    self.trim_memory_window(page_num)
+        except ProcessCancelled:
+            # 取消时部分结果也去除已经能识别出的页眉页脚
+            self.body_line_height = self._select_body_line_height(body_line_heights)
+            partial_furniture_keys = self._select_furniture_keys(furniture_pages, sorted(analyzed_pages))
+            self.partial_results["candidates"] = [candidate for candidate in candidates
+                                                  if not self._is_furniture(candidate[0], candidate[1], partial_furniture_keys)]
+            raise
+        self.release_page_text()
+        
+        print(f"  总共提取了 {total_blocks} 个文本块，其中候选文本块 {len(candidates)} 个")
+        if page_store_dir:
+            print(f"  按页指纹复用 {reused_pages} 页，重新提取 {len(fresh_pages)} 页")
+            # 候选块（含逐页计算的上下文）之后写入页面记录
+            fresh_candidates = [candidates[i] for first, end, *_ in fresh_pages.values() for i in range(first, end)]
+        
+        if not sampled_pages:
+            # 去除跨页重复的页眉、页脚和页码
+            self.body_line_height = self._select_body_line_height(body_line_heights)
+            furniture_keys = self._select_furniture_keys(furniture_pages, sorted(analyzed_pages))
+            if furniture_keys:
+                before_count = len(candidates)
+                candidates = [candidate for candidate in candidates
+                              if not self._is_furniture(candidate[0], candidate[1], furniture_keys)]
+                self.partial_results["candidates"] = candidates
+                print(f"  页眉页脚过滤去除 {before_count - len(candidates)} 个候选文本块")
+            
+            # 检测PDF文件内容的左边距x坐标
+            self.document_leftmost_x = self._report_leftmost_x(estimator)
+            print(f"  检测到的PDF最左边x坐标: {self.document_leftmost_x}")
         
         # 根据x坐标过滤
+        aligned_blocks = []  # (文本块, x坐标)
         filtered_blocks = []
         
-        for block in all_text_blocks:
+        # 临近截止时间时跳过次要校验（上下文独立性、表格区域）
+        run_validators = not self.skip_for_deadline("候选校验", "跳过上下文独立性和表格区域检查")
+        
+        for block, _, context in candidates:
+            self.check_cancelled("候选校验", block.get('page', 1))
             text = block.get('text', '').strip()
-            if not text:
-                continue
             
             # 获取x坐标
             x_coordinate = block.get('position', {}).get('x', 0)
@@ -3195,24 +6088,6 @@ class PDFBookmarkTool:
                 if len(bbox) >= 4:
                     x_coordinate = bbox[0]
             
-            # 基本的文本过滤
-            if not self._is_potential_title_text(text):
-                continue
-            
-            # 检查是否为文档标题，如果是则跳过
-            if self.document_title_text:
-                # 双向检查：文档标题包含当前文本，或当前文本包含文档标题
-                text_clean = text.strip()
-                title_clean = self.document_title_text.strip()
-                if (text_clean in title_clean) or (title_clean in text_clean) or (text_clean == title_clean):
-                    print(f"    跳过文档标题: '{text[:30]}...'")
-                    continue
-            
-            # 数字开头过滤检查
-            if self._should_filter_by_numeric_start(text):
-                print(f"    跳过非数字开头的文本: '{text[:30]}...'")
-                continue
-            
             # X坐标过滤：标题必须与PDF文件最左边对齐
             if self.document_leftmost_x is not None:
                 x_diff = abs(x_coordinate - self.document_leftmost_x)
@@ -3222,6 +6097,34 @@ class PDFBookmarkTool:
                 else:
                     print(f"    保留X坐标对齐的文本: '{text[:30]}...' (x={x_coordinate:.1f}, 差异={x_diff:.1f})")
             
+            # 上下文独立性检查：排除列表项和段落中的文本
+            if run_validators and self.enable_context_filter and not self.is_text_independent(text, context or self.build_block_context(block)):
+                continue
+            
+            # 表格区域检查：位于表格线框内的文本不是标题
+            if run_validators and self.is_in_table_region(block.get('page', 1) - 1, block.get('bbox')):
+                print(f"    跳过表格内的文本: '{text[:30]}...'")
+                continue
+            
+            aligned_blocks.append((block, x_coordinate))
+        
+        # 两级提取：只对通过所有检查的候选块提取字体信息
+        light_indexes = [i for i, (block, _) in enumerate(aligned_blocks) if block.get('is_light')]
+        full_block_map = {}  # id(轻量文本块) -> 完整文本块，写入页面记录时代替轻量块
+        if light_indexes:
+            print(f"  为 {len(light_indexes)} 个候选文本块提取字体信息...")
+            full_blocks = self.extract_block_font_info([aligned_blocks[i][0] for i in light_indexes])
+            for i, full_block in zip(light_indexes, full_blocks):
+                full_block_map[id(aligned_blocks[i][0])] = full_block
+                aligned_blocks[i] = (full_block, aligned_blocks[i][1])
+        
+        if page_store_dir:
+            self._store_page_records(page_store_dir, fresh_pages, fresh_candidates, full_block_map)
+        
+        for block, x_coordinate in aligned_blocks:
+            if not block:
+                continue
+            
             # 添加额外的分析信息
             block_info = block.copy()
             block_info.update({
@@ -3234,10 +6137,436 @@ class PDFBookmarkTool:
             })
             
             filtered_blocks.append(block_info)
+        self.partial_results["candidates"] = filtered_blocks
         
         print(f"  X坐标过滤完成，保留 {len(filtered_blocks)} 个文本块")
+        self.print_table_detection_stats()
+        self.print_page_budget_stats()
         return filtered_blocks
     
+    def get_page_fingerprint(self, page_num: int) -> str:
+        """
+        计算页面指纹：页面尺寸、旋转、内容流和页面引用的Form XObject内容的SHA-256
+        （不解释内容流，只读取原始数据）
+        
+        Args:
+            page_num: 页码（0基）
+            
+        Returns:
+            str: 十六进制指纹
+        """
+        page = self.doc[page_num]
+        digest = hashlib.sha256()
+        digest.update(f"{tuple(page.rect)}|{page.rotation}".encode('utf-8'))
+        digest.update(page.read_contents())
+        for xobject in page.get_xobjects():
+            digest.update(self.doc.xref_stream(xobject[0]) or b"")
+        return digest.hexdigest()
+    
+    def _get_page_store_dir(self) -> str:
+        """
+        页面记录的存放目录：按影响单页候选标题的选项和工具版本区分，选项变化后旧记录不再使用
+        
+        Returns:
+            str: 目录路径（位于cache_dir下）
+        """
+        options = {name: getattr(self, name) for name in PAGE_RECORD_OPTIONS}
+        digest = hashlib.sha256(json.dumps(options, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8'))
+        self._update_file_digest(digest, os.path.abspath(__file__))
+        digest.update(str(getattr(fitz, "VersionBind", "")).encode('utf-8'))
+        return os.path.join(self.cache_dir, f"pages-{digest.hexdigest()[:32]}")
+    
+    def load_page_record(self, store_dir: str, fingerprint: str) -> Optional[Dict]:
+        """
+        读取指纹对应的页面记录
+        
+        Args:
+            store_dir: 页面记录目录
+            fingerprint: 页面指纹
+            
+        Returns:
+            Optional[Dict]: 页面记录，没有或读取失败时返回None
+        """
+        record_path = os.path.join(store_dir, f"{fingerprint}.json")
+        try:
+            with open(record_path, 'r', encoding='utf-8') as f:
+                record = json.load(f)
+            # 更新修改时间，作为最近使用时间
+            os.utime(record_path)
+            return record
+        except (OSError, ValueError):
+            return None
+    
+    def _restore_page_record(self, record: Dict, page_num: int, candidates: List, furniture_pages: Dict,
+                             body_line_heights: Dict, estimator: 'LeftMarginEstimator'):
+        """
+        把页面记录按新页码放回逐页分析的累积结果（候选块、页眉页脚特征、左边距数据、正文行高、表格区域）
+        
+        Args:
+            record: 页面记录
+            page_num: 该页在本文档中的页码（0基），插入或删除页面后可能与记录时不同
+            candidates: 候选块列表 [(文本块, 页眉页脚特征键, 上下文), ...]，追加本页候选
+            furniture_pages: 页眉页脚特征键 -> 出现的页码集合
+            body_line_heights: 正文行高 -> 文本长度
+            estimator: 左边距估计器
+        """
+        for key in record['furniture_keys']:
+            furniture_pages.setdefault(tuple(key), set()).add(page_num)
+        for line_height, length in record.get('body_line_heights', []):
+            body_line_heights[line_height] = body_line_heights.get(line_height, 0) + length
+        for x_coordinate in record['body_x']:
+            estimator.add(page_num, x_coordinate)
+        for block, key, context in record['candidates']:
+            # 页码重映射
+            block['page'] = page_num + 1
+            for line in block.get('lines', []):
+                if 'page' in line:
+                    line['page'] = page_num + 1
+            candidates.append((block, tuple(key) if key else None, context))
+        if record.get('table_regions') is not None:
+            self.page_table_regions[page_num] = [tuple(region) for region in record['table_regions']]
+    
+    def _store_page_records(self, store_dir: str, fresh_pages: Dict, fresh_candidates: List, full_block_map: Dict):
+        """
+        为本次重新提取的页面写入页面记录（超出单页预算的页面结果与耗时有关，不记录）
+        
+        Args:
+            store_dir: 页面记录目录
+            fresh_pages: 页码(0基) -> (候选起始序号, 候选结束序号, 页眉页脚特征键, 左边距x坐标, 正文行高, 指纹)
+            fresh_candidates: 重新提取页面的候选块，按fresh_pages中的序号区间依次排列
+            full_block_map: id(轻量文本块) -> 完整文本块（None表示字体小于阈值，不可能成为标题）
+        """
+        try:
+            os.makedirs(store_dir, exist_ok=True)
+        except OSError as e:
+            print(f"警告：无法创建页面记录目录: {e}")
+            return
+        
+        offset = 0
+        for page_num, (first, end, furniture_keys, body_x, line_heights, fingerprint) in fresh_pages.items():
+            page_candidates = fresh_candidates[offset:offset + end - first]
+            offset += end - first
+            if page_num + 1 in self.page_budget_stats:
+                continue
+            
+            record_candidates = []
+            for block, key, context in page_candidates:
+                if id(block) in full_block_map:
+                    block = full_block_map[id(block)]
+                    if block is None:
+                        continue
+                record_candidates.append((block, key, context))
+            record = {
+                'candidates': record_candidates,
+                'furniture_keys': furniture_keys,
+                'body_x': body_x,
+                'body_line_heights': list(line_heights.items()),
+                'table_regions': self.page_table_regions.get(page_num),
+            }
+            
+            record_path = os.path.join(store_dir, f"{fingerprint}.json")
+            try:
+                part_path = f"{record_path}.{os.getpid()}.part"
+                with open(part_path, 'w', encoding='utf-8') as f:
+                    json.dump(record, f, ensure_ascii=False, default=str)
+                os.replace(part_path, record_path)
+            except OSError as e:
+                print(f"警告：写入页面记录失败: {e}")
+                return
+    
+    def get_analysis_pages(self) -> List[int]:
+        """
+        根据page_ranges和skip_pages计算需要分析的页码
+        
+        Returns:
+            List[int]: 按顺序排列的页码列表（0基）
+        """
+        page_count = len(self.doc)
+        if self.page_ranges:
+            pages = self._parse_page_ranges(self.page_ranges, page_count)
+        else:
+            pages = list(range(page_count))
+        
+        if self.skip_pages:
+            skipped = set(self._parse_page_ranges(self.skip_pages, page_count))
+            pages = [page_num for page_num in pages if page_num not in skipped]
+        if self.restricted_pages is not None:
+            pages = [page_num for page_num in pages if page_num in self.restricted_pages]
+        return pages
+    
+    def _parse_page_ranges(self, spec: str, page_count: int) -> List[int]:
+        """
+        解析页码范围字符串，如"1-20,30-,45"（1基，闭区间，省略端点表示到文档首/尾）
+        
+        Args:
+            spec: 页码范围字符串
+            page_count: 文档总页数
+            
+        Returns:
+            List[int]: 去重排序后的页码列表（0基），超出文档范围的页码会被忽略
+            
+        Raises:
+            ValueError: 页码范围格式无效（见parse_page_range_spec）
+        """
+        pages = set()
+        for start, end in parse_page_range_spec(spec):
+            pages.update(range(start - 1, min(end or page_count, page_count)))
+        return sorted(pages)
+    
+    def _select_sample_pages(self, pages: List[int]) -> List[List[int]]:
+        """
+        从待分析页面中抽取约sample_pages页用于估计版式
+        以连续页为一组、各组等间隔分布：单页等间隔抽样在章节周期与抽样间隔相同时
+        会把每章开头的标题误判为页眉，连续页组中标题只出现一次，不会被误判
+        
+        Args:
+            pages: 待分析的页码列表（0基）
+            
+        Returns:
+            List[List[int]]: 各组抽样的连续页码，未启用抽样或页数不超过抽样数时返回空列表
+        """
+        if self.sample_pages <= 0 or len(pages) <= self.sample_pages:
+            return []
+        run_length = min(self.sample_run_length, self.sample_pages)
+        run_count = max(1, self.sample_pages // run_length)
+        step = (len(pages) - run_length) / max(1, run_count - 1)
+        return [pages[int(i * step):int(i * step) + run_length] for i in range(run_count)]
+    
+    def _matches_layout_profile(self, block: Dict, furniture_keys: set) -> bool:
+        """
+        抽样模式下的廉价版式检查：与左边距对齐，且不是已识别的页眉页脚
+        
+        Args:
+            block: 文本块信息
+            furniture_keys: 抽样识别出的页眉页脚（_select_furniture_keys的结果）
+            
+        Returns:
+            bool: 是否符合版式
+        """
+        if self.document_leftmost_x is not None:
+            if abs(block['bbox'][0] - self.document_leftmost_x) > self.x_coordinate_tolerance:
+                return False
+        if furniture_keys and self._is_furniture(block, self._furniture_key(block), furniture_keys):
+            return False
+        return True
+    
+    def _is_candidate_text(self, text: str) -> bool:
+        """
+        只依赖文本内容的候选标题检查（在提取过程中逐块调用）
+        
+        Args:
+            text: 文本内容
+            
+        Returns:
+            bool: 是否保留为候选
+        """
+        if not text:
+            return False
+        
+        # 基本的文本过滤
+        if not self._is_potential_title_text(text):
+            return False
+        
+        # 检查是否为文档标题，如果是则跳过
+        if self.document_title_text:
+            # 双向检查：文档标题包含当前文本，或当前文本包含文档标题
+            text_clean = text.strip()
+            title_clean = self.document_title_text.strip()
+            if (text_clean in title_clean) or (title_clean in text_clean) or (text_clean == title_clean):
+                print(f"    跳过文档标题: '{text[:30]}...'")
+                return False
+        
+        # 数字开头过滤检查
+        if self._should_filter_by_numeric_start(text):
+            print(f"    跳过非数字开头的文本: '{text[:30]}...'")
+            return False
+        
+        return True
+    
+    def _furniture_key(self, block: Dict) -> Optional[Tuple]:
+        """
+        计算文本块的页眉页脚特征键（小写文本 + 量化后的Y坐标）
+        文本中的数字原样保留，由_select_furniture_keys判断各数字是固定值还是随页码变化的页码
+        
+        Args:
+            block: 文本块信息
+            
+        Returns:
+            Optional[Tuple]: 特征键，不在页眉页脚区域内的文本块返回None
+        """
+        bbox = block.get('bbox', [0, 0, 0, 0])
+        page_height = block.get('page_height', 0)
+        if len(bbox) < 4 or page_height <= 0:
+            return None
+        
+        # 只考虑页面上下边缘区域内的文本块
+        band = page_height * self.furniture_margin_ratio
+        if bbox[3] > band and bbox[1] < page_height - band:
+            return None
+        
+        text = re.sub(r'\s+', ' ', block.get('text', '').strip().lower())
+        if not text:
+            return None
+        
+        quantum = self.furniture_y_quantum
+        return (text, round(bbox[1] / quantum), round(bbox[3] / quantum))
+    
+    def _furniture_template(self, key: Tuple) -> Tuple:
+        """特征键的数字掩码形式（"第 3 页"与"第 4 页"相同），用于把同一版面元素的各页文本归为一组"""
+        return (re.sub(r'\d+', '#', key[0]),) + tuple(key[1:])
+    
+    def _select_furniture_keys(self, key_pages: Dict[Tuple, set], analyzed_pages: List[int],
+                               sample_runs: Optional[List[List[int]]] = None) -> Dict:
+        """
+        选出跨页重复出现的页眉、页脚和页码
+        同一位置、数字掩码后文本相同的文本块归为一组：组内每个数字要么固定不变，要么随页码递增（页码）时，
+        整组视为同一版面元素；否则（如"Chapter 1".."Chapter 12"）只有文本完全相同的文本块在多页重复出现才算
+        
+        Args:
+            key_pages: 特征键 -> 出现的页码集合（0基）
+            analyzed_pages: 已分析的页码（升序），出现密度只在这些页面上计算
+            sample_runs: 抽样模式下各组连续页的页码，出现密度在每组内分别计算
+            
+        Returns:
+            Dict: 数字掩码后的特征键 -> [数字规则列表, ...]，每个数字规则为
+                  ('value', 取值集合) 或 ('offset', 数值与页码之差的集合)
+        """
+        groups = {}
+        for key in key_pages:
+            groups.setdefault(self._furniture_template(key), []).append(key)
+        
+        furniture_keys = {}
+        for template, keys in groups.items():
+            entries = sorted((page, [int(n) for n in re.findall(r'\d+', key[0])])
+                             for key in keys for page in key_pages[key])
+            rules = self._furniture_number_rules(entries)
+            if rules is not None and self._is_repeated_on_pages([page for page, _ in entries], analyzed_pages,
+                                                                sample_runs):
+                furniture_keys.setdefault(template, []).append(rules)
+                continue
+            for key in keys:
+                if self._is_repeated_on_pages(key_pages[key], analyzed_pages, sample_runs):
+                    numbers = [int(n) for n in re.findall(r'\d+', key[0])]
+                    furniture_keys.setdefault(template, []).append([('value', {n}) for n in numbers])
+        
+        if furniture_keys:
+            print(f"  页眉页脚过滤: 识别出 {len(furniture_keys)} 种重复版面元素")
+            for template in list(furniture_keys)[:5]:
+                print(f"    重复元素: '{template[0][:30]}'")
+        return furniture_keys
+    
+    def _furniture_number_rules(self, entries: List[Tuple[int, List[int]]]) -> Optional[List[Tuple]]:
+        """
+        判断一组文本块中每个数字的变化规律：固定不变，或随页码递增（与页码之差大多相同，
+        插入没有页码的页面后差值会变化）
+        
+        Args:
+            entries: [(页码(0基), 文本中的数字列表), ...]，按页码排序
+            
+        Returns:
+            Optional[List[Tuple]]: 每个数字的规则，有数字既不固定也不随页码变化时返回None
+        """
+        rules = []
+        for slot in range(len(entries[0][1])):
+            values = [numbers[slot] for _, numbers in entries]
+            if len(set(values)) == 1:
+                rules.append(('value', set(values)))
+                continue
+            offsets = [value - page for (page, _), value in zip(entries, values)]
+            increasing = all(later > earlier for earlier, later in zip(values, values[1:]))
+            if not increasing or max(offsets.count(offset) for offset in set(offsets)) * 2 < len(offsets):
+                return None
+            rules.append(('offset', set(offsets)))
+        return rules
+    
+    def _is_repeated_on_pages(self, pages, analyzed_pages: List[int],
+                              sample_runs: Optional[List[List[int]]] = None) -> bool:
+        """
+        判断出现的页面是否足够多且足够密集：页眉页脚几乎每页（奇偶页交替时约每两页）出现，
+        只是间隔出现的（如各章开头的标题）不算
+        抽样模式下各组之间相隔很多页，合并计算的密度会把每组出现一次的文本算得很密，
+        因此要求在至少两组（只有一组时为该组）中都出现在过半的页面上
+        
+        Args:
+            pages: 出现的页码（0基）
+            analyzed_pages: 已分析的页码（升序）
+            sample_runs: 抽样模式下各组连续页的页码
+            
+        Returns:
+            bool: 是否视为跨页重复
+        """
+        pages = set(pages)
+        if len(pages) < self.furniture_min_pages:
+            return False
+        if sample_runs:
+            dense_runs = sum(1 for run in sample_runs
+                             if sum(1 for page_num in run if page_num in pages) * 2 > len(run))
+            return dense_runs >= min(2, len(sample_runs))
+        span = bisect.bisect_right(analyzed_pages, max(pages)) - bisect.bisect_left(analyzed_pages, min(pages))
+        return len(pages) >= self.furniture_min_density * max(span, 1)
+    
+    def _is_furniture(self, block: Dict, key: Optional[Tuple], furniture_keys: Dict) -> bool:
+        """
+        判断文本块是否为已识别的页眉页脚；字号明显大于正文或符合标题格式的文本块不算
+        
+        Args:
+            block: 文本块信息
+            key: 文本块的页眉页脚特征键
+            furniture_keys: _select_furniture_keys的结果
+            
+        Returns:
+            bool: 是否为页眉页脚
+        """
+        if key is None or not furniture_keys:
+            return False
+        rule_lists = furniture_keys.get(self._furniture_template(key))
+        if not rule_lists or self._is_heading_like(block):
+            return False
+        numbers = [int(n) for n in re.findall(r'\d+', key[0])]
+        page_num = block.get('page', 1) - 1
+        for rules in rule_lists:
+            if all(value in allowed if kind == 'value' else value - page_num in allowed
+                   for (kind, allowed), value in zip(rules, numbers)):
+                return True
+        return False
+    
+    def _is_heading_like(self, block: Dict) -> bool:
+        """
+        文本块是否像标题：符合目录格式，或行高超过正文行高的furniture_heading_ratio倍
+        
+        Args:
+            block: 文本块信息
+            
+        Returns:
+            bool: 是否像标题
+        """
+        text = block.get('text', '').strip()
+        if any(re.match(pattern, text) for pattern in self.toc_patterns):
+            return True
+        line_height = self._block_line_height(block)
+        return bool(self.body_line_height and line_height
+                    and line_height > self.body_line_height * self.furniture_heading_ratio)
+    
+    def _block_line_height(self, block: Dict) -> Optional[float]:
+        """文本块的平均行高（pt）：边界框高度除以行数，轻量文本块没有字号时以此比较文字大小"""
+        bbox = block.get('bbox', [0, 0, 0, 0])
+        if len(bbox) < 4:
+            return None
+        return (bbox[3] - bbox[1]) / max(len(block.get('lines') or []), 1)
+    
+    def _add_body_line_height(self, line_heights: Dict, block: Dict):
+        """把正文文本块的行高按文本长度累加到行高统计中"""
+        line_height = self._block_line_height(block)
+        if line_height:
+            key = round(line_height, 1)
+            line_heights[key] = line_heights.get(key, 0) + len(block.get('text', ''))
+    
+    def _select_body_line_height(self, line_heights: Dict) -> Optional[float]:
+        """正文行高：按文本长度加权出现最多的行高，没有统计数据时返回None"""
+        if not line_heights:
+            return None
+        return max(line_heights.items(), key=lambda item: item[1])[0]
+    
     def _filter_by_font_threshold(self, data_list: List[Dict]) -> List[Dict]:
         """
         步骤2: 通过 --font-threshold对dataList1过滤得到dataList2
@@ -3588,20 +6917,37 @@ class PDFBookmarkTool:
         print("  检查数字序列书签的层级一致性...")
         toc_list = self._ensure_numeric_sequence_hierarchy(toc_list)
         
+        # 复用的原有书签保留原来的跳转目标（页内位置、缩放等）
+        for entry, node in zip(toc_list, tree_list):
+            if node.get('dest'):
+                entry.append(node['dest'])
+        
         try:
             # 验证TOC结构
             if not self.validate_toc_structure(toc_list):
                 print("  错误：TOC结构验证失败")
                 return False, {}
             
-            # 设置TOC
-            self.doc.set_toc(toc_list)
+            # 层级修复不增删条目，toc_list与tree_list一一对应
+            self.set_proposed_toc(toc_list, tree_list)
+            
+            # 与原有书签完全一致时不修改文档
+            self.outline_unchanged = self.is_toc_unchanged(toc_list)
+            if self.outline_unchanged:
+                print("  书签与PDF原有书签完全一致，不修改PDF")
+            else:
+                # 设置TOC
+                self.doc.set_toc(toc_list)
             
             # 统计信息
             stats = {
+                'status': 'unchanged' if self.outline_unchanged else 'updated',
+                'source': self.outline_source,
                 'total': len(tree_list),
                 'final': len(toc_list),
-                'levels': len(set(entry[0] for entry in toc_list))
+                'levels': len(set(entry[0] for entry in toc_list)),
+                'page_budget': self.get_page_budget_summary(),
+                'deadline': self.get_deadline_summary()
             }
             return True, stats
             
@@ -4106,10 +7452,22 @@ class PDFBookmarkTool:
         print(f"开始匹配 {len(bookmark_titles)} 个书签标题...")
         
         # 获取所有页面的文本信息 - 包括行级别的文本
+        # 只保留匹配需要的字段（文本、页码、字号、坐标），不保留行和字体明细
         all_text_blocks = []
-        for page_num in range(len(self.doc)):
-            page = self.doc[page_num]
-            text_dict = page.get_text("dict")
+        self.begin_memory_windows()
+        for page_num in self.iter_pages_within_deadline(list(range(len(self.doc))), "文本匹配"):
+            # 超出单页预算的页面只使用廉价提取的文本块
+            budget_action = self.check_page_budget(page_num)
+            if budget_action:
+                for block in self.extract_text_blocks_fast(page_num):
+                    all_text_blocks.append({"text": block["text"], "page": page_num + 1})
+                self.release_page_block_index(page_num)
+                if self.memory_window_due(page_num):
+                    self.trim_memory_window(page_num)
+                continue
+            
+            # 行级别文本和块级别文本共用同一个TextPage
+            text_dict = self.get_page_text(page_num).get_dict()
             
             # 先提取行级别的文本
             for block in text_dict["blocks"]:
@@ -4146,12 +7504,29 @@ class PDFBookmarkTool:
             # 然后提取合并后的块级别文本（作为备选）
             page_text_blocks = self.extract_text_with_font_info(page_num)
             for block in page_text_blocks:
-                block['page'] = page_num + 1
-            all_text_blocks.extend(page_text_blocks)
+                all_text_blocks.append({
+                    "text": block.get("text", ""),
+                    "size": block.get("size", 12),
+                    "page": page_num + 1,
+                })
+            
+            self.release_page_block_index(page_num)
+            if self.memory_window_due(page_num):
+                self.trim_memory_window(page_num)
+        self.release_page_text()
         
+        self.print_page_budget_stats()
         matched_bookmarks = []
+        self.partial_results["matches"] = matched_bookmarks
         
-        for title in bookmark_titles:
+        for title_index, title in enumerate(bookmark_titles):
+            self.check_cancelled("书签匹配")
+            # 临近截止时间时只做精确匹配，到达截止时间时停止匹配
+            if self.deadline_reached():
+                self.record_degradation("书签匹配", f"到达截止时间，剩余{len(bookmark_titles) - title_index}个标题未匹配")
+                break
+            if fuzzy_match and self.skip_for_deadline("书签匹配", "跳过模糊匹配"):
+                fuzzy_match = False
             matched_block = self._find_matching_text_block(title, all_text_blocks, fuzzy_match, remove_all_spaces)
             if matched_block:
                 matched_bookmarks.append(matched_block)
@@ -4184,8 +7559,12 @@ class PDFBookmarkTool:
             # 同时处理PDF中可能存在的点号格式，例如 "1.新增功能说明" -> "1新增功能说明"
             target_clean = re.sub(r'^(\d+(?:\.\d+)*)\.', r'\1', target_clean)
         
-        # 优先进行精确匹配
+        # 优先进行精确匹配（文本块按页排列，每换一页检查一次取消请求）
+        checked_page = None
         for block in text_blocks:
+            if block['page'] != checked_page:
+                checked_page = block['page']
+                self.check_cancelled("书签匹配", checked_page)
             block_text = block.get('text', '').strip()
             block_clean = self._clean_title_for_matching(block_text)
             if remove_all_spaces:
@@ -4210,6 +7589,9 @@ class PDFBookmarkTool:
         # 如果目标标题不包含数字前缀，尝试匹配带前缀的版本
         if not self._has_numeric_prefix(target_title):
             for block in text_blocks:
+                if block['page'] != checked_page:
+                    checked_page = block['page']
+                    self.check_cancelled("书签匹配", checked_page)
                 block_text = block.get('text', '').strip()
                 block_clean = self._clean_title_for_matching(block_text)
                 
@@ -4231,6 +7613,9 @@ class PDFBookmarkTool:
             best_score = 0.0
             
             for block in text_blocks:
+                if block['page'] != checked_page:
+                    checked_page = block['page']
+                    self.check_cancelled("书签匹配", checked_page)
                 block_text = block.get('text', '').strip()
                 block_clean = self._clean_title_for_matching(block_text)
                 
@@ -4379,12 +7764,18 @@ class PDFBookmarkTool:
             处理是否成功
         """
         print(f"使用书签文件进行处理: {bookmark_file_path}")
+        self.start_deadline()
+        self.reset_partial_results()
         
         # 确保PDF文档已打开
         if not self.open_pdf():
             print("❌ 无法打开PDF文件")
             return False
         
+        # 相同输入、书签文件和选项的结果已缓存时直接写出
+        if self.load_cached_result("bookmark_file", bookmark_file_path):
+            return self.write_results(output_path)
+        
         # 解析书签文件
         bookmark_data = self.parse_bookmark_file(bookmark_file_path)
         if not bookmark_data:
@@ -4411,11 +7802,14 @@ class PDFBookmarkTool:
         matched_bookmarks.sort(key=lambda x: (x['page'], -x.get('y', 0)))
         
         # 添加书签到PDF
+        self.outline_source = "bookmark_file"
         success, result = self.add_bookmarks(matched_bookmarks)
         if success:
-            # 保存PDF
-            if self.save_pdf(output_path):
+            self.store_cached_result(result)
+            # 保存PDF（以及同时输出的书签文件），预览模式只输出书签
+            if self.write_results(output_path):
                 print(f"✅ 基于书签文件的处理完成，共添加 {len(matched_bookmarks)} 个书签")
+                self.print_deadline_summary()
                 return True
             else:
                 print("❌ 保存PDF文件失败")
@@ -4436,12 +7830,18 @@ class PDFBookmarkTool:
             处理是否成功
         """
         print(f"使用Markdown文件进行处理: {markdown_file_path}")
+        self.start_deadline()
+        self.reset_partial_results()
         
         # 确保PDF文档已打开
         if not self.open_pdf():
             print("❌ 无法打开PDF文件")
             return False
         
+        # 相同输入、Markdown文件和选项的结果已缓存时直接写出
+        if self.load_cached_result("markdown", markdown_file_path):
+            return self.write_results(output_path)
+        
         # 解析Markdown文件
         markdown_bookmarks = self.parse_markdown_file(markdown_file_path)
         if not markdown_bookmarks:
@@ -4471,11 +7871,14 @@ class PDFBookmarkTool:
         matched_bookmarks.sort(key=lambda x: (x['page'], -x.get('y', 0)))
         
         # 添加书签到PDF
+        self.outline_source = "markdown"
         success, result = self.add_bookmarks(matched_bookmarks)
         if success:
-            # 保存PDF
-            if self.save_pdf(output_path):
+            self.store_cached_result(result)
+            # 保存PDF（以及同时输出的书签文件），预览模式只输出书签
+            if self.write_results(output_path):
                 print(f"✅ 基于Markdown文件的处理完成，共添加 {len(matched_bookmarks)} 个书签")
+                self.print_deadline_summary()
                 return True
             else:
                 print("❌ 保存PDF文件失败")
@@ -4487,14 +7890,19 @@ class PDFBookmarkTool:
 
 def main():
     parser = argparse.ArgumentParser(description="PDF书签工具")
-    parser.add_argument("input_file", nargs='?', help="输入PDF文件路径")
-    parser.add_argument("-o", "--output", help="输出文件路径")
+    parser.add_argument("input_file", nargs='?', help="输入PDF文件路径，\"-\"表示从标准输入读取（需要同时指定 -o）")
+    parser.add_argument("-o", "--output", help="输出文件路径，\"-\"表示写到标准输出")
+    parser.add_argument("--outline-output", action="append", default=[],
+                        help="同时把计算出的书签写到文件（按扩展名.json/.csv/.txt选择格式，\"-\"表示标准输出并使用--format），可重复")
     
     # 处理模式选择
     parser.add_argument("--extract-only", action="store_true", help="仅提取现有书签，不创建新书签")
     parser.add_argument("--bookmark-file-assisted", action="store_true", help="书签文件辅助加书签模式")
     parser.add_argument("--markdown-assisted", action="store_true", help="markdown辅助加书签模式")
     parser.add_argument("--parse-markdown", type=str, help="仅解析Markdown文件并输出标题结构")
+    parser.add_argument("--apply-toc", type=str, help="直接写入已审阅的书签JSON（--preview的输出），跳过提取和匹配")
+    parser.add_argument("--preview", nargs='?', const="-", metavar="PATH",
+                        help="只输出最终书签（层级、标题、页码和来源坐标）的JSON，不写出PDF；默认写到标准输出")
     
     # 书签提取相关参数
     parser.add_argument("--format", choices=['json', 'txt', 'csv'], default='json', help="导出格式 (默认: json)")
@@ -4505,6 +7913,37 @@ def main():
     parser.add_argument("--disable-font-filter", action="store_true", help="禁用字体大小过滤")
     parser.add_argument("--font-threshold", type=float, help="字体大小阈值")
     parser.add_argument("--debug", action="store_true", help="启用调试模式")
+    parser.add_argument("--disable-furniture-filter", action="store_true", help="禁用页眉页脚过滤")
+    parser.add_argument("--margin-min-page-ratio", type=float,
+                        help="左边距至少需要出现的页面比例（默认: 0.05，所需页数最多为 --margin-max-min-pages）")
+    parser.add_argument("--margin-max-min-pages", type=int, help="左边距所需页数的上限（默认: 3）")
+    parser.add_argument("--full-extraction", action="store_true", help="对所有页面提取完整字体信息（禁用两级提取）")
+    parser.add_argument("--keep-images", action="store_true", help="文本提取时保留图片块（默认不解码图片）")
+    parser.add_argument("--pages", type=page_range_argument, help="只分析的页码范围，如 \"1-20,30-\"（1基）")
+    parser.add_argument("--skip-pages", type=page_range_argument, help="跳过的页码范围，格式同 --pages")
+    parser.add_argument("--disable-struct-tree", action="store_true", help="不从带标签PDF的结构树生成书签")
+    parser.add_argument("--disable-toc-links", action="store_true", help="不从目录页的内部链接生成书签")
+    parser.add_argument("--disable-toc-text", action="store_true", help="不解析印刷目录页的文本生成书签")
+    parser.add_argument("--reuse-outline", action="store_true", help="复用PDF原有书签：覆盖全文时跳过提取，否则只分析未覆盖的页面并合并")
+    parser.add_argument("--outline-gap", type=int, help="复用原有书签时，连续多少页没有书签视为未覆盖（默认: 10）")
+    parser.add_argument("--sample-pages", type=int, default=0, help="抽样模式：从N页估计版式，其余页面只做廉价的候选检查")
+    parser.add_argument("--slow-page-seconds", type=float,
+                        help="单页文本解释已耗时超过该值(秒)时跳过该页的字体和标题分析(解释本身不会被中断，"
+                             "总耗时用--deadline限制)，0表示不限制")
+    parser.add_argument("--page-line-budget", type=int, help="单页文本行数上限，超出的页面降级为廉价提取，0表示不限制")
+    parser.add_argument("--deadline", type=float, help="任务截止时间(秒)，临近截止时改用更廉价的策略并返回降级结果")
+    parser.add_argument("--max-memory", type=int, help="有界内存模式：进程常驻内存上限(MB)，按页窗口处理大文件")
+    parser.add_argument("--incremental", action="store_true", help="增量保存：只追加书签对象，不重写整个PDF（大文件保存更快）")
+    parser.add_argument("--save-profile", choices=list(SAVE_PROFILES), default="standard",
+                        help="完整保存的配置: standard=合并重复对象并压缩(默认), fast=最快, compact=最小, web=线性化(新版MuPDF不支持时改为普通保存)")
+    parser.add_argument("--unchanged-output", choices=["copy", "link", "skip"], default="copy",
+                        help="书签与原有书签一致时的输出方式: copy=复制原文件(默认), link=硬链接原文件(之后原地修改输出会同时修改原文件), skip=不写出")
+    parser.add_argument("--mmap", action="store_true", help="内存映射输入文件后从内存打开（网络盘等随机读取较慢的位置）")
+    parser.add_argument("--cache-dir", type=str, help="结果缓存目录：相同PDF和选项的任务直接复用上次的书签（可多台机器共享）")
+    parser.add_argument("--cache-max-mb", type=int, help="结果缓存目录大小上限(MB)，超出时删除最久未使用的结果（默认: 64）")
+    parser.add_argument("--reuse-pages", action="store_true",
+                        help="按页指纹复用上一版本中未变化页面的候选标题，只重新提取变化的页面（需要--cache-dir）")
+    parser.add_argument("--control-stdin", action="store_true", help="从标准输入读取控制消息（单独一行cancel表示取消处理）")
     
     parser.add_argument("--require-numeric-start", action="store_true", help="书签必须以数字开头")
     parser.add_argument("--exclude-titles", type=str, help="排除的标题列表(JSON格式)")
@@ -4513,6 +7952,16 @@ def main():
     parser.add_argument("--markdown-file", type=str, help="markdown文件路径")
     
     args = parser.parse_args()
+    
+    # PDF或书签写到标准输出时，日志改为输出到标准错误，避免混入输出内容
+    stdout_outputs = [path for path in [args.output] + args.outline_output + [args.preview] if path == "-"]
+    if len(stdout_outputs) > 1:
+        print("错误：只能有一个输出写到标准输出")
+        sys.exit(1)
+    if stdout_outputs:
+        sys.stdout = sys.stderr
+        if hasattr(fitz, "set_messages"):
+            fitz.set_messages(fd=2)
     print(args)
     
     # 对于parse-markdown模式，不需要PDF文件
@@ -4521,7 +7970,14 @@ def main():
         if not args.input_file:
             print("错误：需要提供输入PDF文件路径")
             sys.exit(1)
-        if not os.path.exists(args.input_file):
+        if args.input_file == "-":
+            if not args.output:
+                print("错误：从标准输入读取PDF时需要提供 -o 输出路径")
+                sys.exit(1)
+            if args.control_stdin:
+                print("错误：从标准输入读取PDF时不能同时使用 --control-stdin")
+                sys.exit(1)
+        elif not os.path.exists(args.input_file):
             print(f"错误：文件 '{args.input_file}' 不存在")
             sys.exit(1)
     else:
@@ -4531,16 +7987,70 @@ def main():
     try:
         # 对于parse-markdown模式，使用虚拟PDF路径
         pdf_path = args.input_file if not args.parse_markdown else "dummy.pdf"
-        tool = PDFBookmarkTool(pdf_path)
+        pdf_stream = None
+        source_path = None
+        if pdf_path == "-":
+            # 从标准输入读取整个PDF，在内存中处理（没有原文件，"stdin.pdf"只用于显示）
+            pdf_path = "stdin.pdf"
+            pdf_stream = sys.stdin.buffer.read()
+        elif args.mmap and not args.parse_markdown:
+            with open(pdf_path, "rb") as f:
+                pdf_stream = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            source_path = pdf_path
+        tool = PDFBookmarkTool(pdf_path, pdf_stream, source_path)
         
         # 设置工具选项
         tool.enable_debug = args.debug
+        tool.listen_for_cancel(args.control_stdin)
         
         # 设置字体过滤选项
         if args.disable_font_filter:
             tool.enable_font_size_filter = False
         if args.font_threshold:
             tool.font_size_threshold = args.font_threshold
+        if args.disable_furniture_filter:
+            tool.enable_furniture_filter = False
+        if args.full_extraction:
+            tool.enable_two_tier_extraction = False
+        if args.keep_images:
+            tool.text_extraction_flags |= fitz.TEXT_PRESERVE_IMAGES
+        if args.max_memory:
+            tool.max_memory_mb = args.max_memory
+        if args.slow_page_seconds is not None:
+            tool.slow_page_seconds = args.slow_page_seconds
+        if args.page_line_budget is not None:
+            tool.page_line_budget = args.page_line_budget
+        if args.margin_min_page_ratio is not None:
+            tool.leftmost_x_min_page_ratio = args.margin_min_page_ratio
+        if args.margin_max_min_pages is not None:
+            tool.leftmost_x_max_min_pages = args.margin_max_min_pages
+        if args.deadline:
+            tool.deadline_seconds = args.deadline
+        tool.incremental_save = args.incremental
+        tool.save_profile = args.save_profile
+        tool.unchanged_output = args.unchanged_output
+        tool.preview_output = args.preview
+        tool.cache_dir = args.cache_dir
+        tool.reuse_page_results = args.reuse_pages
+        if args.reuse_pages and not args.cache_dir:
+            print("警告：--reuse-pages 需要同时指定 --cache-dir，已忽略")
+        if args.cache_max_mb is not None:
+            tool.cache_max_mb = args.cache_max_mb
+        for outline_path in args.outline_output:
+            extension = os.path.splitext(outline_path)[1].lower().lstrip('.')
+            tool.outline_outputs.append((outline_path, extension if extension in ('json', 'csv', 'txt') else args.format))
+        tool.page_ranges = args.pages
+        tool.skip_pages = args.skip_pages
+        tool.sample_pages = args.sample_pages
+        tool.reuse_outline = args.reuse_outline
+        if args.disable_struct_tree:
+            tool.enable_struct_tree = False
+        if args.disable_toc_links:
+            tool.enable_toc_links = False
+        if args.disable_toc_text:
+            tool.enable_toc_text = False
+        if args.outline_gap:
+            tool.outline_gap_pages = args.outline_gap
         
         # 设置手动控制选项
         if args.exclude_titles:
@@ -4593,6 +8103,31 @@ def main():
                 print("❌ 书签提取失败!")
                 sys.exit(1)
         
+        elif args.apply_toc:
+            # 直接写入已审阅的书签（跳过提取和匹配）
+            print(f"开始写入已审阅的书签: {args.input_file}")
+            
+            # 确定输出文件路径
+            if args.output:
+                output_path = args.output
+            else:
+                base_name = os.path.splitext(args.input_file)[0]
+                output_path = f"{base_name}_with_bookmarks.pdf"
+            
+            success = tool.process_with_toc_file(args.apply_toc, output_path)
+            
+            if success:
+                print(f"✅ 书签写入完成！")
+                if tool.preview_output:
+                    print("预览模式，未写出PDF")
+                elif tool.outline_unchanged and tool.unchanged_output == "skip":
+                    print("书签未变化，未写出PDF")
+                else:
+                    print(f"PDF已保存到: {output_path}")
+            else:
+                print("❌ 书签写入失败!")
+                sys.exit(1)
+        
         elif args.bookmark_file_assisted:
             # 书签文件辅助加书签模式
             print(f"开始书签文件辅助加书签处理: {args.input_file}")
@@ -4615,7 +8150,12 @@ def main():
             
             if success:
                 print(f"✅ 书签文件辅助加书签完成！")
-                print(f"PDF已保存到: {output_path}")
+                if tool.preview_output:
+                    print("预览模式，未写出PDF")
+                elif tool.outline_unchanged and tool.unchanged_output == "skip":
+                    print("书签未变化，未写出PDF")
+                else:
+                    print(f"PDF已保存到: {output_path}")
             else:
                 print("❌ 书签文件辅助加书签失败!")
                 sys.exit(1)
@@ -4642,7 +8182,12 @@ def main():
             
             if success:
                 print(f"✅ markdown辅助加书签完成！")
-                print(f"PDF已保存到: {output_path}")
+                if tool.preview_output:
+                    print("预览模式，未写出PDF")
+                elif tool.outline_unchanged and tool.unchanged_output == "skip":
+                    print("书签未变化，未写出PDF")
+                else:
+                    print(f"PDF已保存到: {output_path}")
             else:
                 print("❌ markdown辅助加书签失败!")
                 sys.exit(1)
@@ -4696,11 +8241,22 @@ def main():
             
             if success:
                 print(f"✅ 自动加书签完成！")
-                print(f"PDF已保存到: {output_path}")
+                if tool.preview_output:
+                    print("预览模式，未写出PDF")
+                elif tool.outline_unchanged and tool.unchanged_output == "skip":
+                    print("书签未变化，未写出PDF")
+                else:
+                    print(f"PDF已保存到: {output_path}")
             else:
                 print("❌ 自动加书签失败!")
                 sys.exit(1)
     
+    except ProcessCancelled as e:
+        # 取消时输出已找到的部分结果（单行JSON），不写出PDF
+        print(f"⏹️ {e}（{tool.cancel_reason}）")
+        print(f"已取消，部分结果: {json.dumps(tool.get_partial_results(), ensure_ascii=False)}")
+        sys.exit(CANCELLED_EXIT_CODE)
+    
     except Exception as e:
         print(f"错误：处理PDF时发生异常: {e}")
         import traceback
@@ -4711,9 +8267,15 @@ def main():
         # 清理资源
         if 'tool' in locals() and hasattr(tool, 'doc') and tool.doc is not None:
             try:
-                tool.doc.close()
+                tool.close_pdf()
             except:
                 pass  # 忽略关闭时的错误
+        # 映射的输入文件在文档和memoryview释放之后才能关闭
+        if 'pdf_stream' in locals() and isinstance(pdf_stream, mmap.mmap):
+            try:
+                pdf_stream.close()
+            except BufferError:
+                pass
 
 
 if __name__ == "__main__":
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+页眉页脚过滤的回归测试
+"""
+
+import json
+
+from pdf_bookmark_tool import PDFBookmarkTool, fitz
+
+
+def build_chapter_per_page_pdf(path, page_count=12):
+    """每页顶部（页眉区域内）一个章标题，另有固定的页眉和"Page N of M"页脚"""
+    doc = fitz.open()
+    paragraph = "Body text of the chapter, long enough to be a paragraph with several words in it. " * 2
+    for page_num in range(page_count):
+        page = doc.new_page()
+        page.insert_text((72, 40), "ACME Manual v2 - Confidential", fontsize=9)
+        page.insert_text((72, 80), f"Chapter {page_num + 1}", fontsize=18)
+        for k in range(10):
+            page.insert_textbox(fitz.Rect(72, 120 + k * 60, 520, 175 + k * 60), paragraph, fontsize=10)
+        page.insert_text((290, 810), f"Page {page_num + 1} of {page_count}", fontsize=9)
+    doc.save(path)
+    doc.close()
+
+
+def run_preview(pdf_path, preview_path, **options):
+    tool = PDFBookmarkTool(str(pdf_path))
+    for name, value in options.items():
+        setattr(tool, name, value)
+    tool.preview_output = str(preview_path)
+    assert tool.new_auto_bookmark_process()
+    with open(preview_path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def test_chapter_heading_on_every_page_is_not_furniture(tmp_path):
+    pdf_path = tmp_path / "chapters.pdf"
+    build_chapter_per_page_pdf(pdf_path)
+    bookmarks = run_preview(pdf_path, tmp_path / "preview.json", font_size_threshold=12)
+    assert [(item['title'], item['page']) for item in bookmarks] == [
+        (f"Chapter {page}", page) for page in range(1, 13)
+    ]
+
+
+def test_page_numbers_and_running_headers_are_furniture():
+    tool = PDFBookmarkTool("unused.pdf")
+    footer = [(("page %d of 12" % (page + 1), 200, 203), page) for page in range(12)]
+    running = [(("chapter 3 overview", 10, 14), page) for page in range(4, 9)]
+    openings = [(("chapter %d" % (page // 3 + 1), 20, 24), page) for page in range(0, 12, 3)]
+    key_pages = {}
+    for key, page in footer + running + openings:
+        key_pages.setdefault(key, set()).add(page)
+    furniture = tool._select_furniture_keys(key_pages, list(range(12)))
+    
+    def is_furniture(key, page):
+        return tool._is_furniture({'text': key[0], 'bbox': [72, 0, 200, 12], 'page': page + 1}, key, furniture)
+    
+    assert all(is_furniture(key, page) for key, page in footer + running)
+    # 未出现过的页面上，随页码变化的页码仍能识别
+    assert is_furniture(("page 13 of 12", 200, 203), 12)
+    assert not is_furniture(("page 3 of 12", 200, 203), 12)
+    assert not any(is_furniture(key, page) for key, page in openings)
+
+
+def test_heading_sized_blocks_are_exempt():
+    tool = PDFBookmarkTool("unused.pdf")
+    tool.body_line_height = 12.0
+    key = ("chapter 1", 20, 24)
+    furniture = {tool._furniture_template(key): [[('offset', {1})]]}
+    small = {'text': "Chapter 1", 'bbox': [72, 70, 160, 82], 'lines': [{}], 'page': 1}
+    large = {'text': "Chapter 1", 'bbox': [72, 62, 180, 84], 'lines': [{}], 'page': 1}
+    assert tool._is_furniture(small, key, furniture)
+    assert not tool._is_furniture(large, key, furniture)
+
+
+def build_numbered_chapters_pdf(path, page_count=40):
+    """每页一个"N Chapter number N"章标题和两个小节标题，另有固定的页眉和页码"""
+    doc = fitz.open()
+    for page_num in range(page_count):
+        page = doc.new_page()
+        page.insert_text((72, 40), "ACME Manual v2 - Confidential", fontsize=9)
+        page.insert_text((300, 810), f"Page {page_num + 1}", fontsize=9)
+        chapter = page_num + 1
+        page.insert_text((72, 100), f"{chapter} Chapter number {chapter}", fontsize=16)
+        y = 130
+        for section in range(1, 3):
+            page.insert_text((72, y), f"{chapter}.{section} Section {chapter}.{section} title", fontsize=13)
+            y += 24
+            for _ in range(4):
+                page.insert_text((90, y), "Body text line that is long enough to be a paragraph, with commas, "
+                                          "more words.", fontsize=10)
+                y += 14
+            y += 10
+    doc.save(path)
+    doc.close()
+
+
+def test_sampled_layout_keeps_chapter_headings(tmp_path):
+    pdf_path = tmp_path / "numbered.pdf"
+    build_numbered_chapters_pdf(pdf_path)
+    bookmarks = run_preview(pdf_path, tmp_path / "preview.json", font_size_threshold=12, sample_pages=10)
+    titles = [item['title'] for item in bookmarks]
+    assert len(titles) == 120
+    assert all(f"{chapter} Chapter number {chapter}" in titles for chapter in range(1, 41))
+
+
+def test_sampled_density_is_computed_per_run():
+    tool = PDFBookmarkTool("unused.pdf")
+    runs = [list(range(0, 5)), list(range(35, 40))]
+    sampled = [page for run in runs for page in run]
+    # 两组各出现一次的文本在合并后的抽样页上显得很密，但在每组内都不过半
+    sparse = {("appendix", 20, 24): {3, 4, 35}}
+    header = {("acme manual", 3, 5): {0, 1, 2, 3, 36, 37, 38}}
+    assert tool._select_furniture_keys(sparse, sampled, runs) == {}
+    assert tool._select_furniture_keys(header, sampled, runs)
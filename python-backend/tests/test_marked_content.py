@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+标记内容文本读取的测试
+"""
+
+import check_struct_tree
+from marked_content import MarkedContentReader, glyph_name_to_text, parse_to_unicode, read_literal_string
+
+
+def parse(content, decoders=None):
+    texts = {}
+    MarkedContentReader(None).parse_content(content, 0, {0: decoders or {"F1": lambda data: data.decode('latin-1')}},
+                                            {}, texts, [], set())
+    return texts
+
+
+def test_literal_string_escapes_and_nesting():
+    data = rb"(a\(b\) (c) \101\t\
+d) rest"
+    value, pos = read_literal_string(data, 1)
+    assert value == b"a(b) (c) A\td"
+    assert data[pos:] == b" rest"
+
+
+def test_text_is_collected_per_mcid():
+    texts = parse(b"/H1 <</MCID 0>> BDC BT /F1 16 Tf [(1) -300 (Intro) 20 (duction)] TJ ET EMC\n"
+                  b"/P <</MCID 1>> BDC BT /F1 10 Tf 72 700 Td (Body) Tj 0 -14 Td (text) Tj ET EMC\n"
+                  b"/Artifact BMC BT /F1 9 Tf (Page 1) Tj ET EMC")
+    assert texts == {0: "1 Introduction", 1: " Body text"}
+
+
+def test_nested_marked_content_and_inline_images_are_handled():
+    texts = parse(b"/H2 <</MCID 3>> BDC /Span BMC BT /F1 12 Tf (Nested) Tj ET EMC\n"
+                  b"BI /W 1 /H 1 /BPC 8 /CS /G ID \x00EMC) EI\n"
+                  b"BT /F1 12 Tf (heading) Tj ET EMC (outside) Tj")
+    assert texts == {3: "Nestedheading"}
+
+
+def test_to_unicode_bfchar_and_bfrange():
+    cmap = (b"1 beginbfchar <0003> <0020> endbfchar\n"
+            b"2 beginbfrange <0010> <0012> <0041> <0020> <0021> [<00E9> <4E2D>] endbfrange")
+    assert parse_to_unicode(cmap) == {0x03: " ", 0x10: "A", 0x11: "B", 0x12: "C", 0x20: "é", 0x21: "中"}
+
+
+def test_glyph_names():
+    assert glyph_name_to_text("Eacute") == "É"
+    assert glyph_name_to_text("uni4E2D6587") == "中文"
+    assert glyph_name_to_text("u1F600") == "\U0001F600"
+    assert glyph_name_to_text("a.sc") == "a"
+    assert glyph_name_to_text("notaglyphname") == ""
+
+
+def test_struct_tree_fixture(tmp_path):
+    pdf_path = str(tmp_path / "tagged.pdf")
+    check_struct_tree.build_fixture(pdf_path)
+    assert check_struct_tree.run_check(pdf_path)
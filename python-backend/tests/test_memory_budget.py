@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+"""
+有界内存模式的回归测试：10000页的合成文档，峰值常驻内存不超过上限
+"""
+
+import benchmark_memory
+
+
+def test_ten_thousand_pages_within_memory_budget(tmp_path):
+    pdf_path = str(tmp_path / "synthetic_10000.pdf")
+    benchmark_memory.generate_document(pdf_path, 10000)
+    assert benchmark_memory.run_check([pdf_path], max_memory=200)
+
+
+def test_budget_overrun_is_reported(tmp_path):
+    pdf_path = str(tmp_path / "synthetic_200.pdf")
+    benchmark_memory.generate_document(pdf_path, 200)
+    assert not benchmark_memory.run_check([pdf_path], max_memory=1)
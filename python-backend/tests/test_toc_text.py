@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+印刷目录页解析的回归测试
+"""
+
+import re
+
+from pdf_bookmark_tool import PDFBookmarkTool, TOC_PAGE_NUMBER_PATTERN, fitz
+
+
+def words_of(*items):
+    """由(x0, 文本)生成同一行上的get_words单词"""
+    return [(x0, 100, x0 + 6 * len(text), 110, text, 0, 0, i) for i, (x0, text) in enumerate(items)]
+
+
+def build_two_column_toc_pdf(path):
+    """第1页是两栏目录（每栏6个带引导符的条目），之后每章一页"""
+    doc = fitz.open()
+    toc = doc.new_page()
+    toc.insert_text((72, 60), "Contents", fontsize=16)
+    for index in range(12):
+        column, row = divmod(index, 6)
+        x0, y = 72 + column * 250, 100 + row * 20
+        toc.insert_text((x0, y), f"Chapter {index + 1}", fontsize=10)
+        toc.insert_text((x0 + 60, y), "." * 40, fontsize=10)
+        page_text = str(index + 1)
+        toc.insert_text((x0 + 200 - fitz.get_text_length(page_text, fontsize=10), y), page_text, fontsize=10)
+    for index in range(12):
+        doc.new_page().insert_text((72, 80), f"Chapter {index + 1}", fontsize=18)
+    doc.save(path)
+    doc.close()
+
+
+def test_page_number_pattern_only_accepts_roman_numerals():
+    for text in ["12", "iv", "xii", "xlix", "mcm"]:
+        assert re.fullmatch(TOC_PAGE_NUMBER_PATTERN, text)
+    for text in ["did", "civil", "dim", "mill", "iiii", ""]:
+        assert not re.fullmatch(TOC_PAGE_NUMBER_PATTERN, text)
+
+
+def test_page_number_needs_leader_or_gap():
+    tool = PDFBookmarkTool("unused.pdf")
+    assert tool._match_toc_line(words_of((72, "Introduction"), (150, "....."), (190, "5")))
+    assert tool._match_toc_line(words_of((72, "Preface"), (400, "vii"))).group(3) == "vii"
+    assert not tool._match_toc_line(words_of((72, "Chapter"), (120, "1")))
+    assert not tool._match_toc_line(words_of((72, "Part"), (100, "ii")))
+
+
+def test_two_column_toc_entries_are_not_merged(tmp_path):
+    pdf_path = tmp_path / "two_column_toc.pdf"
+    build_two_column_toc_pdf(pdf_path)
+    tool = PDFBookmarkTool(str(pdf_path))
+    assert tool.open_pdf()
+    try:
+        entries = tool._read_toc_text_entries(0)
+    finally:
+        tool.close_pdf()
+    assert [(entry['title'], entry['printed_page']) for entry in entries] == [
+        (f"Chapter {index}", str(index)) for index in range(1, 13)
+    ]
+    assert len(set(entry['indent'] for entry in entries)) == 1
@@ -6,6 +6,9 @@ const fs = require("fs");
 let mainWindow;
 let pythonProcess = null;
 
+// 停止处理时等待Python后端在取消检查点退出的最长时间，超时后强制结束进程
+const CANCEL_GRACE_PERIOD_MS = 10000;
+
 // 递归查找目录中的Python可执行文件
 function findPythonBinaryInDir(rootDir) {
   try {
@@ -554,6 +557,8 @@ ipcMain.handle("process-pdf", async (event, options) => {
     if (options.enableDebug) {
       args.push("--debug");
     }
+    // 通过标准输入发送取消消息，后端返回已找到的部分结果
+    args.push("--control-stdin");
 
     console.log("Spawning Python process:", pythonInfo.command);
     console.log("Python type:", pythonInfo.type);
@@ -571,6 +576,12 @@ ipcMain.handle("process-pdf", async (event, options) => {
         PYTHONPATH: getPythonBackendPath(),
       },
     });
+    const child = pythonProcess;
+    // 强制结束时需要清理的保存临时文件
+    child.partialOutputPath = options.outputPath ? `${options.outputPath}.part` : null;
+    child.stdin.on("error", (err) => {
+      console.error("Failed to write to Python stdin:", err);
+    });
 
     let output = "";
     let error = "";
@@ -626,7 +637,32 @@ ipcMain.handle("process-pdf", async (event, options) => {
     });
 
     pythonProcess.on("close", (code) => {
-      pythonProcess = null;
+      // 停止后可能已经启动了新的进程，只清除自己的引用
+      if (pythonProcess === child) {
+        pythonProcess = null;
+      }
+
+      // 被取消时后端输出单行JSON格式的部分结果，不写出PDF
+      const cancelledMatch = output.match(/已取消，部分结果: (.+)/);
+      if (cancelledMatch) {
+        let partialResult = null;
+        try {
+          partialResult = JSON.parse(cancelledMatch[1]);
+        } catch (parseError) {
+          console.error("Failed to parse partial result:", parseError);
+        }
+        const summary = partialResult
+          ? `已分析 ${partialResult.pages_analyzed} 页，候选标题 ${partialResult.candidates.length} 个，匹配书签 ${partialResult.matches.length} 个`
+          : "部分结果解析失败";
+        resolve({
+          success: false,
+          cancelled: true,
+          error: `处理已取消（${summary}），未写出PDF`,
+          partialResult: partialResult,
+          output: output,
+        });
+        return;
+      }
 
       if (code === 0) {
         // 从输出中提取实际的输出文件路径
@@ -841,8 +877,27 @@ ipcMain.handle("extract-bookmarks", async (event, options) => {
 
 ipcMain.handle("stop-process", async () => {
   if (pythonProcess) {
-    pythonProcess.kill();
-    pythonProcess = null;
+    const child = pythonProcess;
+    // 先发送取消消息：后端在一页处理之内停止，process-pdf返回已找到的部分结果
+    if (child.stdin && child.stdin.writable) {
+      child.stdin.write("cancel\n");
+    }
+    // 超时仍未退出时强制结束，并删除可能写了一半的保存临时文件
+    const killTimer = setTimeout(() => {
+      if (child.exitCode === null && child.signalCode === null) {
+        child.kill();
+      }
+    }, CANCEL_GRACE_PERIOD_MS);
+    child.once("close", () => {
+      clearTimeout(killTimer);
+      if (child.partialOutputPath && fs.existsSync(child.partialOutputPath)) {
+        try {
+          fs.unlinkSync(child.partialOutputPath);
+        } catch (err) {
+          console.error("Failed to remove partial output:", err);
+        }
+      }
+    });
     return { success: true };
   }
   return { success: false, message: "没有正在运行的进程" };